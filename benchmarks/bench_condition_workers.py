@@ -0,0 +1,111 @@
+"""
+Benchmark serial vs. thread pool condition evaluation without RayStation.
+
+A stand-in dose object sleeps for a fixed latency on every scripting API call, so the
+measured speedup reflects how much of the round is spent waiting on independent queries.
+
+Usage (from the repository root):
+    python benchmarks/bench_condition_workers.py --conditions 12 --latency 0.05 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.flow.condition_checker import ConditionChecker
+from src.flow.condition_executor import make_executor
+
+
+class LatencyDose:
+    """Dose distribution stand-in: every query takes `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def GetDoseStatistic(self, RoiName, DoseType):
+        self._wait()
+        return {"Max": 6200.0, "Min": 3500.0, "Average": 4100.0}[DoseType] + len(RoiName)
+
+    def GetDoseAtRelativeVolumes(self, RoiName, RelativeVolumes):
+        self._wait()
+        return [6000.0 * (1.0 - v) + len(RoiName) for v in RelativeVolumes]
+
+    def GetRelativeVolumeAtDoseValues(self, RoiName, DoseValues):
+        self._wait()
+        return [max(0.0, 1.0 - d / 6000.0) for d in DoseValues]
+
+
+class _Course:
+    def __init__(self, dose):
+        self.TotalDose = dose
+
+
+class _Plan:
+    def __init__(self, dose):
+        self.TreatmentCourse = _Course(dose)
+
+
+class _Case:
+    def __init__(self, dose):
+        self.TreatmentPlans = {"Plan": _Plan(dose)}
+
+
+def build_conditions(count):
+    """Metric conditions on `count` different ROIs (statistics are not batched, so each costs one call)."""
+    types = [("Max Dose", "Dmax (cGy) ≥ 6000"), ("Min Dose", "Dmin (cGy) ≤ 3600"),
+             ("Max Dmean", "Dmean (cGy) ≥ 4000"), ("Min Dmean", "Dmean (cGy) ≤ 4200")]
+    conditions = []
+    for i in range(count):
+        condition_type, criteria = types[i % len(types)]
+        conditions.append({"name": f"c{i}", "type": condition_type, "roi": f"ROI_{i}",
+                           "active_round": "≥ 1", "criteria": criteria})
+    return conditions
+
+
+def run(conditions, latency, workers, rounds):
+    """Return (seconds per round, results of the last round, API calls)."""
+    dose = LatencyDose(latency)
+    executor = make_executor(workers)
+    checker = ConditionChecker(conditions, {}, _Case(dose), "Plan", executor=executor)
+    results = None
+    start = time.perf_counter()
+    for round_number in range(1, rounds + 1):
+        checker.set_optimization_round(round_number)
+        checker.invalidate_dose_cache()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = checker.check_all_conditions()
+    elapsed = (time.perf_counter() - start) / rounds
+    executor.shutdown()
+    return elapsed, results, dose.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conditions", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per API call")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    conditions = build_conditions(args.conditions)
+    serial_time, serial_results, serial_calls = run(conditions, args.latency, 1, args.rounds)
+    pool_time, pool_results, pool_calls = run(conditions, args.latency, args.workers, args.rounds)
+
+    print(f"{args.conditions} conditions, {args.latency * 1000:.0f} ms per API call, {args.rounds} rounds")
+    print(f"  serial         {serial_time:8.3f} s/round  ({serial_calls} calls)")
+    print(f"  {args.workers} workers      {pool_time:8.3f} s/round  ({pool_calls} calls)")
+    print(f"  speedup        {serial_time / pool_time:8.2f}x")
+    print(f"  results match  {list(serial_results.items()) == list(pool_results.items())}")
+
+
+if __name__ == "__main__":
+    main()
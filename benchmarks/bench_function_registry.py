@@ -0,0 +1,138 @@
+"""
+Benchmark the per-function overhead of adding optimization functions through the function registry.
+
+A stand-in plan optimization records AddOptimizationFunction calls without RayStation, so the
+timing covers dispatch, description parsing and parameter writes only. The registry is compared
+with an if/elif dispatcher that calls re.search per value (the previous ObjectiveAdder design),
+and with functions parsed once at flow load (compile_functions), where only the writes remain.
+
+Usage (from the repository root):
+    python benchmarks/bench_function_registry.py --functions 10000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.flow.function_registry import FUNCTION_SPECS, get_function_spec, add_optimization_function, compile_functions
+
+
+class _Parameters:
+    pass
+
+
+class _Function:
+    def __init__(self):
+        self.DoseFunctionParameters = _Parameters()
+        self.Tag = None
+
+
+class RecordingOptimization:
+    """Plan optimization stand-in: AddOptimizationFunction returns an empty function."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def AddOptimizationFunction(self, **kwargs):
+        self.calls += 1
+        return _Function()
+
+
+DESCRIPTIONS = {
+    "Max Dose": "Max Dose 5000 cGy",
+    "Min Dose": "Min Dose 3933 cGy",
+    "Max EUD": "Max EUD 2500 cGy, Parameter A 1",
+    "Min EUD": "Min EUD 2500 cGy, Parameter A 1",
+    "Target EUD": "Target EUD 2500 cGy, Parameter A 1",
+    "Uniform Dose": "Uniform Dose 4140 cGy",
+    "Dose fall-off": "Dose fall-off [H] 4140 cGy [L] 2070 cGy, Low dose distance 1.5 cm",
+    "Max DVH": "Max DVH 500 cGy to 70% volume",
+    "Min DVH": "Min DVH 500 cGy to 0.1cc volume",
+    "Uniformity Constraint": "Uniformity Constraint Rel.std.dev 1 %",
+}
+
+
+def _legacy_number(pattern, description, flags=0):
+    match = re.search(pattern, description, flags)
+    if match:
+        return float(match.group(1))
+    raise ValueError(f"Could not extract value from: {description}")
+
+
+def legacy_add(po, func_type, description, weight, is_constraint):
+    """If/elif dispatcher with per-call re.search, as ObjectiveAdder was written before the registry."""
+    if func_type in ("Max Dose", "Min Dose", "Uniform Dose"):
+        values = {"DoseLevel": _legacy_number(r'(\d+\.?\d*)\s*cGy', description)}
+    elif func_type in ("Max EUD", "Min EUD", "Target EUD"):
+        values = {"DoseLevel": _legacy_number(r'(\d+\.?\d*)\s*cGy', description),
+                  "EudParameterA": _legacy_number(r'Parameter A\s+(\d+\.?\d*)', description, re.IGNORECASE)}
+    elif func_type == "Dose fall-off":
+        values = {"HighDoseLevel": _legacy_number(r'\[H\]\s*(\d+\.?\d*)\s*cGy', description),
+                  "LowDoseLevel": _legacy_number(r'\[L\]\s*(\d+\.?\d*)\s*cGy', description),
+                  "LowDoseDistance": _legacy_number(r'Low dose distance\s+(\d+\.?\d*)\s*cm', description, re.IGNORECASE)}
+    elif func_type in ("Max DVH", "Min DVH"):
+        values = {"DoseLevel": _legacy_number(r'(\d+\.?\d*)\s*cGy', description)}
+        if 'cc' in description.lower():
+            values["IsAbsoluteVolume"] = True
+            values["AbsoluteVolume"] = _legacy_number(r'to\s+(\d+\.?\d*)\s*cc\s*volume', description, re.IGNORECASE)
+        else:
+            values["PercentVolume"] = _legacy_number(r'to\s+(\d+\.?\d*)%\s*volume', description, re.IGNORECASE)
+    elif func_type == "Uniformity Constraint":
+        values = {"PercentStdDeviation": _legacy_number(r'Rel\.std\.dev\s+(\d+\.?\d*)\s*%', description, re.IGNORECASE)}
+        is_constraint = True
+    else:
+        raise ValueError(f"Unknown function type: {func_type}")
+    o = po.AddOptimizationFunction(FunctionType=func_type, IsConstraint=is_constraint)
+    for attribute, value in values.items():
+        setattr(o.DoseFunctionParameters, attribute, value)
+    if not is_constraint:
+        o.DoseFunctionParameters.Weight = float(weight)
+
+
+def registry_add(po, func_type, description, weight, is_constraint):
+    spec = get_function_spec(func_type)
+    parameters = spec.parameters(description, weight, is_constraint)
+    add_optimization_function(po, spec, "tag", "ROI", parameters, is_constraint, False, [], False, None)
+
+
+def preparsed_add(po, function, description, weight, is_constraint):
+    add_optimization_function(po, function.spec, function.tag, function.roi, function.parameters, function.is_constraint,
+                              False, [], False, None)
+
+
+def run(add, entries):
+    """Return (microseconds per function, AddOptimizationFunction calls)."""
+    po = RecordingOptimization()
+    start = time.perf_counter()
+    for func_type, description in entries:
+        add(po, func_type, description, "1", False)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(entries) * 1e6, po.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    types = list(FUNCTION_SPECS)
+    entries = [(types[i % len(types)], DESCRIPTIONS[types[i % len(types)]]) for i in range(args.functions)]
+
+    legacy_time = min(run(legacy_add, entries)[0] for _ in range(args.repeats))
+    registry_time = min(run(registry_add, entries)[0] for _ in range(args.repeats))
+    compiled = compile_functions([{"tag": f"f{i}", "type": func_type, "roi": "ROI", "description": description, "weight": "1"}
+                                  for i, (func_type, description) in enumerate(entries)])
+    preparsed_time = min(run(preparsed_add, [(function, None) for function in compiled])[0] for _ in range(args.repeats))
+
+    print(f"{args.functions} functions over {len(types)} types (best of {args.repeats})")
+    print(f"  if/elif + re.search  {legacy_time:8.2f} us/function")
+    print(f"  registry             {registry_time:8.2f} us/function")
+    print(f"  parsed at flow load  {preparsed_time:8.2f} us/function")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Check the NumPy condition evaluator (DvhEngine) against known answers without RayStation.
+
+Small synthetic dose grids with hand-computed Dmax, Dmin, Dmean, DaV, VaD and ROI volume
+(including fractional voxels and tied doses) are evaluated first. A random grid then compares
+relative_volumes_at_doses with a per-dose masked sum and times both.
+
+Usage (from the repository root):
+    python benchmarks/check_dvh_engine.py --voxels 200000 --doses 50
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.flow.dvh_engine import DvhEngine
+
+
+def build_engine():
+    """
+    Dose grid of 20 voxels (0.1 cc each) with three ROIs:
+      "Steps"      10 whole voxels at 100, 200, ..., 1000 cGy (stored out of order)
+      "Fractional" voxels at 100/200/300 cGy with weights 1/0.5/0.5
+      "Ties"       whole voxels at 200, 200, 100, 100 cGy
+    """
+    engine = DvhEngine()
+    dose = np.zeros(20)
+    steps = [11, 4, 17, 2, 9, 14, 0, 7, 19, 5]
+    dose[steps] = [100.0 * (i + 1) for i in range(10)]
+    dose[[1, 3, 6]] = [100.0, 200.0, 300.0]
+    dose[[8, 10, 12, 13]] = [200.0, 200.0, 100.0, 100.0]
+    engine.set_dose(dose)
+    engine.set_roi("Steps", steps, [1.0] * 10, 0.1)
+    # A voxel with zero weight is ignored
+    engine.set_roi("Fractional", [1, 3, 6, 15], [1.0, 0.5, 0.5, 0.0], 0.1)
+    engine.set_roi("Ties", [8, 10, 12, 13], [1.0] * 4, 0.1)
+    return engine
+
+
+# (label, call, expected)
+EXPECTED = [
+    ("Steps Dmax", lambda e: e.dmax("Steps"), 1000.0),
+    ("Steps Dmin", lambda e: e.dmin("Steps"), 100.0),
+    ("Steps Dmean", lambda e: e.dmean("Steps"), 550.0),
+    ("Steps volume", lambda e: e.roi_volume("Steps"), 1.0),
+    ("Steps D10% D60% D100%", lambda e: e.dose_at_relative_volumes("Steps", [0.1, 0.6, 1.0]), [1000.0, 500.0, 100.0]),
+    ("Steps V0 V100 V500 V550 V1000 V1001", lambda e: e.relative_volumes_at_doses("Steps", [0, 100, 500, 550, 1000, 1001]),
+     [1.0, 1.0, 0.6, 0.5, 0.1, 0.0]),
+    ("Fractional Dmean", lambda e: e.dmean("Fractional"), 175.0),
+    ("Fractional volume", lambda e: e.roi_volume("Fractional"), 0.2),
+    ("Fractional V150 V200 V300", lambda e: e.relative_volumes_at_doses("Fractional", [150, 200, 300]), [0.5, 0.5, 0.25]),
+    ("Ties V100 V150 V200", lambda e: e.relative_volumes_at_doses("Ties", [100, 150, 200]), [1.0, 0.5, 0.5]),
+]
+
+
+def check_known_answers():
+    """Print each check and return the number of failures."""
+    engine = build_engine()
+    failures = 0
+    for label, call, expected in EXPECTED:
+        actual = call(engine)
+        values = actual if isinstance(actual, list) else [actual]
+        targets = expected if isinstance(expected, list) else [expected]
+        ok = len(values) == len(targets) and all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) for a, b in zip(values, targets))
+        failures += not ok
+        print(f"  {'OK  ' if ok else 'FAIL'} {label}: {actual} (expected {expected})")
+    return failures
+
+
+def masked_volumes(doses, weights, dose_values):
+    """Relative volumes with one masked sum per dose value (the reference result)."""
+    total = weights.sum()
+    return [float(weights[doses >= d].sum() / total) for d in dose_values]
+
+
+def check_random_grid(voxels, dose_count, seed):
+    """Compare relative_volumes_at_doses with masked sums on a random grid; return (failures, times)."""
+    rng = np.random.default_rng(seed)
+    engine = DvhEngine()
+    engine.set_dose(np.round(rng.gamma(4.0, 1000.0, voxels)))  # rounded doses give ties
+    indices = np.arange(voxels)
+    weights = np.where(rng.random(voxels) < 0.1, rng.random(voxels), 1.0)
+    engine.set_roi("Random", indices, weights, 0.027)
+    dose_values = np.linspace(0.0, engine.dmax("Random") + 100.0, dose_count)
+
+    start = time.perf_counter()
+    reference = masked_volumes(engine.dose, weights, dose_values)
+    masked_time = time.perf_counter() - start
+    engine.relative_volumes_at_doses("Random", dose_values[:1])  # sort once outside the timing
+    start = time.perf_counter()
+    actual = engine.relative_volumes_at_doses("Random", dose_values)
+    searchsorted_time = time.perf_counter() - start
+
+    failures = sum(not math.isclose(a, b, abs_tol=1e-9) for a, b in zip(actual, reference))
+    return failures, masked_time, searchsorted_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voxels", type=int, default=200000)
+    parser.add_argument("--doses", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("Known answers")
+    failures = check_known_answers()
+
+    random_failures, masked_time, searchsorted_time = check_random_grid(args.voxels, args.doses, args.seed)
+    failures += random_failures
+    print(f"Random grid ({args.voxels} voxels, {args.doses} dose values)")
+    print(f"  {'OK  ' if not random_failures else 'FAIL'} VaD matches masked sums ({random_failures} mismatches)")
+    print(f"  masked sums     {masked_time * 1000:8.2f} ms")
+    print(f"  searchsorted    {searchsorted_time * 1000:8.2f} ms")
+
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
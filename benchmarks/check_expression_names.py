@@ -0,0 +1,74 @@
+"""
+Check that every condition name can be inserted into an expression and read back without RayStation.
+
+For each name that compile_conditions accepts, quote_condition_name() (used by the Insert button of
+the Expression condition) must give text that parse_expression() reads back as a reference to exactly
+that name, alone and inside a larger expression. Names are a fixed list of awkward cases
+(parentheses, quotes, backslashes, keywords, whitespace) plus random names over the same characters.
+
+Usage (from the repository root):
+    python benchmarks/check_expression_names.py --random 20000
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.flow.condition_compiler import compile_conditions, parse_expression, quote_condition_name
+
+NAMES = [
+    "PTV_D95", "PTV D95", "PTV(boost) D95", "PTV(boost)", "(", ")", "()", "NOT_PTV", "NOT", "not", "And", "OR",
+    "AND OR", 'say "hi"', '"', '""', "\\", "a\\b", 'a\\"b', "trailing\\", " leading", "trailing ", "tab\tname",
+    "line\nbreak", "≥95%", "D95% ≥ 3900 cGy", "Lung-V20<30", "x AND y", "",
+]
+ALPHABET = 'ab ()"\\\tANDORT_≥%'
+
+
+def accepted(names):
+    """Names compile_conditions accepts (as 'Alway TRUE' conditions, which take any name)."""
+    names = list(dict.fromkeys(names))
+    return [condition.name for condition in compile_conditions(
+        [{"name": name, "type": "Alway TRUE", "roi": "", "active_round": "≥ 0", "criteria": ""} for name in names])]
+
+
+def round_trips(name):
+    """True if the inserted name parses back as a reference to exactly that name."""
+    token = quote_condition_name(name)
+    try:
+        alone = parse_expression(token)
+        combined = parse_expression(f"NOT ({token} OR other) AND {token}")
+    except ValueError:
+        return False
+    return alone.op == "ref" and alone.references() == {name} and combined.references() == {name, "other"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--random", type=int, default=20000, help="number of random names")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random_names = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 8))) for _ in range(args.random)]
+
+    failures = 0
+    for name in accepted(NAMES):
+        ok = round_trips(name)
+        failures += not ok
+        print(f"  {'OK  ' if ok else 'FAIL'} {name!r} -> {quote_condition_name(name)}")
+
+    names = accepted(random_names)
+    random_failures = [name for name in names if not round_trips(name)]
+    failures += len(random_failures)
+    print(f"Random names: {len(names) - len(random_failures)} of {len(names)} round-trip")
+    for name in random_failures[:10]:
+        print(f"  FAIL {name!r} -> {quote_condition_name(name)}")
+
+    print(f"{failures} failure(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,7 @@ try:
     machine_options = settings["machine_options"]
     beam_energy_list = settings["beam_energy_list"]
     flow_collection_path = settings["flow_collection_path"]
+    checkpoint_settings = settings.get("checkpoint_policy", {})
 except FileNotFoundError:
     messagebox.showwarning("Settings file not found", f"{settings_file} not found. Using default settings.")
     
@@ -43,7 +44,10 @@ except FileNotFoundError:
     
     # Default Flow collection path
     flow_collection_path = os.path.join(path,'flow_collection')
+    
+    # Default checkpoint policy - save the patient after every step
+    checkpoint_settings = {"mode": "every_step"}
 
 if __name__ == "__main__":
-    app = PlanningFlowApp(machine_options=machine_options, beam_energy_list=beam_energy_list, flow_collection_path=flow_collection_path)
+    app = PlanningFlowApp(machine_options=machine_options, beam_energy_list=beam_energy_list, flow_collection_path=flow_collection_path, checkpoint_settings=checkpoint_settings)
     app.mainloop()
\ No newline at end of file
@@ -2,9 +2,12 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
 import json
+import os
 import sys
 from src.PlanFlowDesigner import PlanFlowDesigner
 from src.StartFlow import StartFlow
+from src.flow.run_journal import RunJournal
+from src.flow.batch_runner import BatchRunner
 
 try:
     from raystation import *
@@ -29,12 +32,13 @@ class TextRedirector:
 
 
 class PlanningFlowApp(tk.Tk):
-    def __init__(self, machine_options, beam_energy_list, flow_collection_path):
+    def __init__(self, machine_options, beam_energy_list, flow_collection_path, checkpoint_settings=None):
         super().__init__()
 
         self.machine_options = machine_options
         self.beam_energy_list = beam_energy_list
         self.flow_collection_path = flow_collection_path
+        self.checkpoint_settings = checkpoint_settings or {}
         
         self.title(f"Planning Flow 🍃 v{app_version}")
         self.geometry("570x150")
@@ -51,6 +55,7 @@ class PlanningFlowApp(tk.Tk):
 
         # Loaded Workflow Data
         self.workflow_data = {}
+        self.flow_file_path = None
         self.planning_window = None
         
         # Selected workflow steps (default: all enabled)
@@ -61,7 +66,9 @@ class PlanningFlowApp(tk.Tk):
             "add_objectives": True,
             "first_optimization": True,
             "loop_optimization": True,
-            "Early_Stop_mode": True
+            "Early_Stop_mode": True,
+            "Headless_mode": False,
+            "Profile_API_mode": False
         }
 
     def create_treatment_settings(self):
@@ -113,6 +120,8 @@ class PlanningFlowApp(tk.Tk):
         ttk.Button(frame, text="New Flow", command=self.new_flow).pack(side="left", padx=5, pady=2)
         ttk.Button(frame, text="Edit Flow", command=self.edit_flow).pack(side="left", padx=5, pady=2)
         ttk.Button(frame, text="Start", command=self.start_planning).pack(side="right", padx=5, pady=2)
+        ttk.Button(frame, text="Resume", command=self.resume_planning).pack(side="right", padx=5, pady=2)
+        ttk.Button(frame, text="Batch", command=self.batch_planning).pack(side="right", padx=5, pady=2)
         ttk.Button(frame, text="Select Steps", command=self.select_steps).pack(side="right", padx=5, pady=2)
     
     def create_console_output(self):
@@ -154,6 +163,7 @@ class PlanningFlowApp(tk.Tk):
                 self.flow_collection_path = os.path.dirname(file_path)
                 with open(file_path, "r") as f:
                     self.workflow_data = json.load(f)
+                self.flow_file_path = file_path
                 
                 # Display flow name in the entry field
                 flow_name = self.workflow_data.get("flow_name", "Unnamed Flow")
@@ -165,6 +175,7 @@ class PlanningFlowApp(tk.Tk):
             except Exception as e:
                 messagebox.showerror("Load Error", f"Failed to load workflow:\n{str(e)}")
                 self.workflow_data = {}
+                self.flow_file_path = None
 
     def edit_flow(self):
         """Allow editing of the loaded workflow and open the planning steps window."""
@@ -190,7 +201,7 @@ class PlanningFlowApp(tk.Tk):
         """Open window to select which workflow steps to execute."""
         step_window = tk.Toplevel(self)
         step_window.title("Select Workflow Steps")
-        step_window.geometry("350x280")
+        step_window.geometry("350x345")
         step_window.attributes('-topmost', True)
         
         tk.Label(step_window, text="Select steps to execute:", font=("Arial", 10, "bold")).pack(pady=10)
@@ -220,6 +231,22 @@ class PlanningFlowApp(tk.Tk):
         
         loop_optimize_frame.pack(anchor="w", padx=30, pady=3)
         
+        headless_frame = ttk.Frame(step_window)
+        check_vars["Headless_mode"] = tk.BooleanVar(value=self.selected_steps["Headless_mode"])
+        ttk.Checkbutton(headless_frame, text="Headless Mode", variable=check_vars["Headless_mode"]).pack(side='left', pady=3)
+        headless_info_but = ttk.Button(headless_frame, text="?", command=lambda: messagebox.showinfo("Headless Mode", "If enabled, Planning Flow does not switch RayStation modules or tabs while running. Useful for batch runs."), width=2)
+        headless_info_but.pack(side='left', padx=5, pady=3)
+        
+        headless_frame.pack(anchor="w", padx=30, pady=3)
+        
+        profile_frame = ttk.Frame(step_window)
+        check_vars["Profile_API_mode"] = tk.BooleanVar(value=self.selected_steps["Profile_API_mode"])
+        ttk.Checkbutton(profile_frame, text="Profile API Calls", variable=check_vars["Profile_API_mode"]).pack(side='left', pady=3)
+        profile_info_but = ttk.Button(profile_frame, text="?", command=lambda: messagebox.showinfo("Profile API Calls", "If enabled, every RayStation API call made through the case is counted and timed, and the hottest calls are listed at the end of the run. Adds a small overhead."), width=2)
+        profile_info_but.pack(side='left', padx=5, pady=3)
+        
+        profile_frame.pack(anchor="w", padx=30, pady=3)
+        
         def apply_selection():
             for step_key in check_vars:
                 self.selected_steps[step_key] = check_vars[step_key].get()
@@ -243,6 +270,65 @@ class PlanningFlowApp(tk.Tk):
         ttk.Button(btn_frame, text="Apply", command=apply_selection).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Cancel", command=step_window.destroy).pack(side="left", padx=5)
 
+    def journal_path(self, plan_name):
+        """Return the run journal path next to the loaded flow file."""
+        if self.flow_file_path:
+            base_dir = os.path.dirname(self.flow_file_path)
+        else:
+            base_dir = self.flow_collection_path
+        if not os.path.isdir(base_dir):
+            return None
+        return RunJournal.journal_path(base_dir, self.workflow_data.get('flow_name', 'Unnamed'), plan_name or "existing_plan")
+    
+    def resume_planning(self):
+        """Resume an interrupted planning flow from its run journal."""
+        if not self.workflow_data:
+            messagebox.showerror("Resume Planning", "Please load the flow of the interrupted run first using 'Load Flow' button.")
+            return
+        
+        journal_path = self.journal_path(self.plan_name_var.get())
+        if not journal_path or not os.path.exists(journal_path):
+            journal_path = filedialog.askopenfilename(
+                title="Select Run Journal",
+                filetypes=[("Run Journal", "*.journal.jsonl"), ("All Files", "*.*")],
+                initialdir=os.path.dirname(self.flow_file_path) if self.flow_file_path else self.flow_collection_path
+            )
+            if not journal_path:
+                return
+        
+        resume_state = RunJournal(journal_path).load()
+        if not resume_state:
+            messagebox.showerror("Resume Planning", f"No resumable run found in:\n{journal_path}")
+            return
+        if resume_state["finished"]:
+            messagebox.showinfo("Resume Planning", "This run already finished. Nothing to resume.")
+            return
+        if resume_state["flow_name"] != self.workflow_data.get("flow_name"):
+            messagebox.showerror("Resume Planning", f"The journal belongs to flow '{resume_state['flow_name']}', but '{self.workflow_data.get('flow_name')}' is loaded.")
+            return
+        try:
+            patient_id = get_current("Patient").PatientID
+        except:
+            patient_id = None
+        if patient_id != resume_state["patient_id"]:
+            messagebox.showerror("Resume Planning", f"The journal belongs to patient '{resume_state['patient_id']}'. Please open that patient first.")
+            return
+        
+        summary = (f"Plan: {resume_state['plan_name']}\n"
+                   f"Completed steps: {', '.join(resume_state['completed_steps']) or 'None'}\n"
+                   f"Completed loop rounds: {resume_state['last_round']}\n\n"
+                   "Continue from the first unfinished step?")
+        if not messagebox.askyesno("Resume Planning", summary):
+            return
+        
+        plan_data = {
+            'plan_name': resume_state['plan_name'],
+            'machine': resume_state.get('machine') or self.room_var.get()
+        }
+        selected_steps = dict(self.selected_steps)
+        selected_steps.update(resume_state["selected_steps"])
+        self.run_flow(plan_data, selected_steps, journal_path, resume_state)
+    
     def start_planning(self):
         """Start the automated planning process."""
         plan_data = {
@@ -262,7 +348,60 @@ class PlanningFlowApp(tk.Tk):
                 messagebox.showerror("Input Error", "Please select a Treatment Room.")
                 return
         
+        self.run_flow(plan_data, self.selected_steps, self.journal_path(plan_data['plan_name']))
+    
+    def batch_planning(self):
+        """Run the loaded flow for every patient listed in a CSV file."""
+        if not self.workflow_data:
+            messagebox.showerror("Batch Planning", "Please load a flow first using 'Load Flow' button.")
+            return
+        if self.selected_steps.get("create_plan_and_beams") and self.room_var.get() == "":
+            messagebox.showerror("Input Error", "Please select a Treatment Room.")
+            return
+        
+        csv_path = filedialog.askopenfilename(
+            title="Select Batch CSV (patient_id, case_name, examination_name, plan_name)",
+            filetypes=[("CSV files", "*.csv"), ("All Files", "*.*")]
+        )
+        if not csv_path:
+            return
+        log_dir = filedialog.askdirectory(title="Select Folder for Batch Logs", initialdir=os.path.dirname(csv_path))
+        if not log_dir:
+            return
         
+        try:
+            patient_count = len(BatchRunner.read_csv(csv_path))
+        except Exception as e:
+            messagebox.showerror("Batch Planning", f"Failed to read batch CSV:\n{str(e)}")
+            return
+        if not messagebox.askyesno("Batch Planning", f"Run flow '{self.workflow_data.get('flow_name', 'Unnamed')}' for {patient_count} patient(s)?\n\n"
+                                   "The currently open patient will be closed. Please save it first."):
+            return
+        
+        # Expand window and show console
+        self.geometry("570x500")
+        self.console_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.console_text.delete(1.0, tk.END)
+        
+        sys.stdout = TextRedirector(self.console_text)
+        sys.stderr = TextRedirector(self.console_text)
+        self.update()
+        
+        try:
+            runner = BatchRunner(self.workflow_data, self.selected_steps, self.room_var.get(), log_dir,
+                                 checkpoint_settings=self.checkpoint_settings)
+            results = runner.run(csv_path)
+            failed = len([r for r in results if r["status"] != "completed"])
+            messagebox.showinfo("Batch Planning", f"Batch finished: {len(results) - failed} completed, {failed} failed.\nLogs: {log_dir}")
+        except Exception as e:
+            print(f"❌ Error during batch: {str(e)}")
+            messagebox.showerror("Batch Planning Error", f"An error occurred:\n{str(e)}")
+        finally:
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+    
+    def run_flow(self, plan_data, selected_steps, journal_path=None, resume_state=None):
+        """Run StartFlow with console output redirected to the Process Log."""
         # Expand window and show console
         self.geometry("570x500")
         self.console_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -279,7 +418,8 @@ class PlanningFlowApp(tk.Tk):
         self.update()
         
         try:
-            StartFlow(workflow_data=self.workflow_data, plan_data=plan_data, selected_steps=self.selected_steps)
+            StartFlow(workflow_data=self.workflow_data, plan_data=plan_data, selected_steps=selected_steps, checkpoint_settings=self.checkpoint_settings,
+                      journal_path=journal_path, resume_state=resume_state)
             print("\n" + "=" * 60)
             print("✅ Planning Flow Completed Successfully!")
             print("=" * 60 + "\n")
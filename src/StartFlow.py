@@ -8,7 +8,16 @@ from src.flow.condition_checker import ConditionChecker
 from src.flow.conditional_ROI_creater import ConditionalROICreator
 from src.flow.objective_adjuster import ObjectiveAdjuster
 from src.flow.ClinicalGoalAdder import ClinicalGoalAdder
-import time
+from src.flow.checkpoint_policy import CheckpointPolicy
+from src.flow.ui_navigator import UINavigator
+from src.flow.run_journal import RunJournal
+from src.flow.tracer import SpanTracer
+from src.flow.api_profiler import ApiProfiler
+from src.flow.convergence import ConditionPlateauDetector, ObjectiveConvergenceMonitor
+from src.flow.condition_compiler import compile_conditions, referenced_conditions
+from src.flow.function_registry import compile_functions
+from src.flow.robustness_settings import RobustnessSettingsManager
+from src.flow.condition_executor import make_executor
 from datetime import datetime
 import warnings
 
@@ -22,15 +31,25 @@ except:
 
 
 class StartFlow:
-    def __init__(self, workflow_data, plan_data, selected_steps=None):
+    def __init__(self, workflow_data, plan_data, selected_steps=None, checkpoint_settings=None, journal_path=None, resume_state=None, interactive=True):
         super().__init__()
-        # Initialize timing dictionary
-        self.step_times = {}
-        self.overall_start_time = time.time()
+        # Non-interactive runs (batch) never open dialogs: errors are raised instead
+        self.interactive = interactive
+        self.completed = False
+        # Hierarchical timing: flow -> step -> loop round -> condition/adjustment/optimization -> API call
+        self.tracer = SpanTracer()
+        self.flow_span = self.tracer.open("Planning Flow", "flow")
+        self.conditions_checker = None
+        # Trace and condition history files are written next to the run journal
+        self.run_path = journal_path[:-len(".journal.jsonl")] if journal_path and journal_path.endswith(".journal.jsonl") else None
+        self.trace_path = self.run_path + ".trace.json" if self.run_path else None
         self.ui = get_current("ui")
         self.case = get_current("Case")
         self.Patient = get_current("Patient")
         
+        # Checkpoint policy decides when Patient.Save() is actually called
+        self.checkpoint = CheckpointPolicy.from_settings(self.Patient, checkpoint_settings)
+        
         # Store selected steps (default: all enabled)
         if selected_steps is None:
             self.selected_steps = {
@@ -43,11 +62,28 @@ class StartFlow:
         else:
             self.selected_steps = selected_steps
         
+        # Run journal (for resuming an interrupted run)
+        self.journal = RunJournal(journal_path)
+        self.resume_state = resume_state
+        if self.resume_state:
+            # Steps finished in the previous run are skipped
+            self.selected_steps = dict(self.selected_steps)
+            for step_key in self.resume_state["completed_steps"]:
+                self.selected_steps[step_key] = False
+        
+        # UI navigation only clicks when the module/tab actually changes (or never, in headless mode)
+        self.navigator = UINavigator(self.ui, headless=self.selected_steps.get("Headless_mode", False))
+        
         # Check is the Plan Name not Unique
         plan_name = plan_data.get('plan_name', '')
         existing_plans = [plan.Name for plan in self.case.TreatmentPlans]
-        if plan_name in existing_plans:
-            messagebox.showerror("Plan Name Exists", f"A plan named '{plan_name}' already exists. Please rename.")
+        # (on resume the step is only deselected when the journal records it as completed)
+        if plan_name in existing_plans and self.selected_steps.get("create_plan_and_beams"):
+            if self.resume_state:
+                self._report_error("Plan Name Exists", f"The previous run did not finish creating plan '{plan_name}'. "
+                                                       "Delete the plan and resume, or start a new run with another plan name.")
+            else:
+                self._report_error("Plan Name Exists", f"A plan named '{plan_name}' already exists. Please rename.")
             return
         else:
             pass  # Plan name is unique, proceed
@@ -59,16 +95,32 @@ class StartFlow:
             self.case = None
         
         if not self.case:
-            messagebox.showerror("No Case Open", "Please open a case before starting Planning Flow.")
+            self._report_error("No Case Open", "Please open a case before starting Planning Flow.")
             return
         else:
             # Start Planning
             print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             print("")
             
-            # 0. Ask user to choose examination if multiple exist
-            if len(self.case.Examinations) > 1:
-                exam_names = [exam.Name for exam in self.case.Examinations]
+            # Opt-in API profiling: plan, po and dose are reached through the case, so wrapping it covers them
+            self.profiler = None
+            if self.selected_steps.get("Profile_API_mode"):
+                self.profiler = ApiProfiler(self.tracer)
+                self.case = self.profiler.wrap(self.case, "case")
+                print("API profiling enabled\n")
+            
+            # 0. Ask user to choose examination if multiple exist (unless it is already known)
+            exam_names = [exam.Name for exam in self.case.Examinations]
+            requested_exam = self.resume_state.get("examination_name") if self.resume_state else plan_data.get('examination_name')
+            if requested_exam in exam_names:
+                self.selected_examination = self.case.Examinations[requested_exam]
+            elif requested_exam:
+                self._report_error("Examination Not Found", f"Examination '{requested_exam}' not found in this case.")
+                return
+            elif len(self.case.Examinations) > 1 and not self.interactive:
+                self._report_error("Multiple Examinations", "Multiple examinations found. Please specify the examination name.")
+                return
+            elif len(self.case.Examinations) > 1:
                 selected_exam = tk.StringVar()
                 
                 def on_select():
@@ -95,108 +147,134 @@ class StartFlow:
             else:
                 self.selected_examination = self.case.Examinations[0]
             
+            if self.resume_state:
+                print(f"Resuming previous run: {len(self.resume_state['completed_steps'])} step(s) and {self.resume_state['last_round']} loop round(s) already completed\n")
+                self.journal.resume()
+            else:
+                self.journal.start(
+                    flow_name=workflow_data.get("flow_name", ""),
+                    plan_name=plan_name,
+                    machine=plan_data.get('machine', ''),
+                    patient_id=self.Patient.PatientID,
+                    case_name=self.case.CaseName,
+                    examination_name=self.selected_examination.Name,
+                    selected_steps=self.selected_steps
+                )
+            
             # 1. Load flow data from JSON file
             print("Loading flow data...")
-            step_start = time.time()
+            step_span = self.tracer.open("Load Flow Data")
             loaded_flow_data = self.load_flow_data(flow_data=workflow_data, plan_data=plan_data)
-            self.step_times["Load Flow Data"] = time.time() - step_start
-            elapsed = self._format_time(self.step_times["Load Flow Data"])
+            if loaded_flow_data is None:
+                return
+            self.objective_monitor = ObjectiveConvergenceMonitor.from_settings(loaded_flow_data['end_flow_data'])
+            # Robustness parameters are saved only when the settings or the robust functions change
+            self.robustness = RobustnessSettingsManager(loaded_flow_data['robust_settings'], tracer=self.tracer)
+            elapsed = self._format_time(step_span.close())
             print(f"✅ Completed in {elapsed}\n")
             print('#' * 50 + '\n')
             
             # 2. Check Match ROI if any not match open ROIs match window then create Match ROI dictionary
             print("Matching ROIs...")
-            step_start = time.time()
-            matcher = MatchROI(loaded_flow_data['match_roi_data'], self.case)
-            self.match_roi_dict = matcher.get_matched_dict()
-            self.step_times["Match ROIs"] = time.time() - step_start
+            step_span = self.tracer.open("Match ROIs")
+            if self.resume_state and self.resume_state.get("match_roi_dict") is not None:
+                print("Using matched ROIs from previous run")
+                self.match_roi_dict = self.resume_state["match_roi_dict"]
+            else:
+                matcher = MatchROI(loaded_flow_data['match_roi_data'], self.case, unmatched_policy="ask" if self.interactive else "fail")
+                self.match_roi_dict = matcher.get_matched_dict()
+                self.journal.record_match_roi(self.match_roi_dict)
             print("Matched ROI Dictionary:", self.match_roi_dict)
-            elapsed = self._format_time(self.step_times["Match ROIs"])
+            elapsed = self._format_time(step_span.close())
             print(f"✅ Completed in {elapsed}\n")
             print('#' * 50 + '\n')
             
             # 3. Create a Plan and add beam based on the loaded flow
             if self.selected_steps.get("create_plan_and_beams"):
                 print("Plan creation...")
-                step_start = time.time()
-                try:
-                    self.ui.Navigation.MenuItem['Plan design'].Click()
-                    self.ui.Navigation.MenuItem['Plan design'].Popup.MenuItem['Plan setup'].Click()
-                except:
-                    self.ui.TitleBar.Navigation.MenuItem['Plan design'].Click()
-                    self.ui.TitleBar.Navigation.MenuItem['Plan design'].Popup.MenuItem['Plan setup'].Click()
-                plan_creator = PlanCreater(loaded_flow_data, self.case, self.selected_examination, self.match_roi_dict)
+                step_span = self.tracer.open("Create Plan and Beams")
+                self.navigator.go_to('Plan design', 'Plan setup')
+                plan_creator = PlanCreater(loaded_flow_data, self.case, self.selected_examination, self.match_roi_dict, checkpoint=self.checkpoint, interactive=self.interactive, journal=self.journal)
                 plan_creator.create_plan_step()
-                self.Patient.Save()
-                self.ui.Workspace.TabControl['Plan'].TabItem['Beams'].Select()
+                if self.checkpoint.step_done("Create Plan"):
+                    self.journal.record_saved()
+                self.navigator.select_workspace_tab('Plan', 'Beams')
                 plan_creator.add_beams_step()
-                self.Patient.Save()
-                self.step_times["Create Plan and Beams"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Create Plan and Beams"])
+                self._finish_step("create_plan_and_beams", "Add Beams")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
                 print("[SKIPPED] Plan creation - Using existing plan")
                 selected_plan_name = None
                 
-                # First, try to get currently open plan
-                try:
-                    current_plan = get_current("Plan")
-                    selected_plan_name = current_plan.Name
-                    print(f"Using currently open plan: {selected_plan_name}")
-                except:
-                    # No plan currently open, let user select from available plans
-                    available_plans = [plan.Name for plan in self.case.TreatmentPlans]
-                    
-                    if not available_plans:
-                        messagebox.showerror("No Plan Available", "No plans found in this case. Please enable 'Create Plan and Add Beams' option.")
-                        return
-                    elif len(available_plans) == 1:
-                        # Only one plan, use it
-                        selected_plan_name = available_plans[0]
-                        print(f"Using plan: {selected_plan_name}")
+                # When resuming, use the plan of the previous run
+                if self.resume_state and self.resume_state.get("plan_name") in existing_plans:
+                    selected_plan_name = self.resume_state["plan_name"]
+                    print(f"Using plan from previous run: {selected_plan_name}")
+                # Non-interactive runs only use the plan with exactly the requested name
+                elif not self.interactive:
+                    if plan_name in existing_plans:
+                        selected_plan_name = plan_name
                     else:
-                        # Multiple plans, let user choose
-                        selected_plan_var = tk.StringVar()
-                        
-                        def on_plan_select():
-                            nonlocal selected_plan_name
-                            selected_plan_name = selected_plan_var.get()
-                            plan_window.destroy()
-                        
-                        plan_window = tk.Toplevel()
-                        plan_window.title("Select Plan")
-                        tk.Label(plan_window, text="Multiple plans found. Please select one:").pack(pady=10)
-                        
-                        plan_combo = ttk.Combobox(plan_window, textvariable=selected_plan_var, values=available_plans, state="readonly")
-                        plan_combo.pack(pady=5)
-                        plan_combo.current(0)
-                        
-                        select_button = tk.Button(plan_window, text="Select", command=on_plan_select)
-                        select_button.pack(pady=10)
-                        
-                        plan_window.grab_set()
-                        plan_window.wait_window()
+                        self._report_error("No Plan Available", f"Plan '{plan_name}' not found in this case.")
+                        return
+                    print(f"Using plan: {selected_plan_name}")
+                else:
+                    # First, try to get currently open plan
+                    try:
+                        current_plan = get_current("Plan")
+                        selected_plan_name = current_plan.Name
+                        print(f"Using currently open plan: {selected_plan_name}")
+                    except:
+                        # No plan currently open, let user select from available plans
+                        available_plans = [plan.Name for plan in self.case.TreatmentPlans]
                         
-                        if selected_plan_name:
+                        if not available_plans:
+                            self._report_error("No Plan Available", "No plans found in this case. Please enable 'Create Plan and Add Beams' option.")
+                            return
+                        elif len(available_plans) == 1:
+                            # Only one plan, use it
+                            selected_plan_name = available_plans[0]
                             print(f"Using plan: {selected_plan_name}")
+                        else:
+                            # Multiple plans, let user choose
+                            selected_plan_var = tk.StringVar()
+                            
+                            def on_plan_select():
+                                nonlocal selected_plan_name
+                                selected_plan_name = selected_plan_var.get()
+                                plan_window.destroy()
+                            
+                            plan_window = tk.Toplevel()
+                            plan_window.title("Select Plan")
+                            tk.Label(plan_window, text="Multiple plans found. Please select one:").pack(pady=10)
+                            
+                            plan_combo = ttk.Combobox(plan_window, textvariable=selected_plan_var, values=available_plans, state="readonly")
+                            plan_combo.pack(pady=5)
+                            plan_combo.current(0)
+                            
+                            select_button = tk.Button(plan_window, text="Select", command=on_plan_select)
+                            select_button.pack(pady=10)
+                            
+                            plan_window.grab_set()
+                            plan_window.wait_window()
+                            
+                            if selected_plan_name:
+                                print(f"Using plan: {selected_plan_name}")
                 
                 # Update plan_data to reflect selected plan name
                 plan_data['plan_name'] = selected_plan_name
                 self.plan = self.case.TreatmentPlans[selected_plan_name]
+                self.journal.record_plan_name(selected_plan_name)
                 print()
                 
             # 4. Create Automate ROI
             if self.selected_steps.get("automate_roi"):
                 print("Creating Automate ROIs...")
-                try:
-                    self.ui.Navigation.MenuItem['Patient modeling'].Click()
-                    self.ui.Navigation.MenuItem['Patient modeling'].Popup.MenuItem['Structure definition'].Click()
-                except:
-                    self.ui.TitleBar.Navigation.MenuItem['Patient modeling'].Click()
-                    self.ui.TitleBar.Navigation.MenuItem['Patient modeling'].Popup.MenuItem['Structure definition'].Click()
-                self.ui.ToolPanel.TabItem['ROIs'].Select()
-                step_start = time.time()
+                self.navigator.go_to('Patient modeling', 'Structure definition')
+                self.navigator.select_tool_panel_tab('ROIs')
+                step_span = self.tracer.open("Create Automate ROIs")
                 roi_creater = Automate_ROI_Creater(
                     automate_roi_data=loaded_flow_data['automate_roi_data'],
                     matched_roi_dict=self.match_roi_dict,
@@ -204,9 +282,8 @@ class StartFlow:
                     examination=self.selected_examination
                 )
                 roi_creater.create_all_rois()
-                self.Patient.Save()
-                self.step_times["Create Automate ROIs"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Create Automate ROIs"])
+                self._finish_step("automate_roi", "Create Automate ROIs")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
@@ -215,14 +292,9 @@ class StartFlow:
             # 5 Add Clinical Goals from Template
             if self.selected_steps.get("add_clinical_goal") and loaded_flow_data['clinical_goal_data']:
                 print("Adding Clinical Goals from Template...")
-                step_start = time.time()
-                try:
-                    self.ui.Navigation.MenuItem['Plan optimization'].Click()
-                    self.ui.Navigation.MenuItem['Plan optimization'].Popup.MenuItem['Plan optimization'].Click()
-                except:
-                    self.ui.TitleBar.Navigation.MenuItem['Plan optimization'].Click()
-                    self.ui.TitleBar.Navigation.MenuItem['Plan optimization'].Popup.MenuItem['Plan optimization'].Click()
-                self.ui.Workspace.TabControl['DVH'].TabItem['Clinical goals'].Select()
+                step_span = self.tracer.open("Add Clinical Goals")
+                self.navigator.go_to('Plan optimization', 'Plan optimization')
+                self.navigator.select_workspace_tab('DVH', 'Clinical goals')
                 clinical_goal_adder = ClinicalGoalAdder(
                     clinical_goal_data=loaded_flow_data['clinical_goal_data'],
                     matched_roi_dict=self.match_roi_dict,
@@ -230,9 +302,8 @@ class StartFlow:
                     plan_name=plan_data['plan_name']
                 )
                 clinical_goal_adder.add_clinical_goals()
-                self.Patient.Save()
-                self.step_times["Add Clinical Goals"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Add Clinical Goals"])
+                self._finish_step("add_clinical_goal", "Add Clinical Goals")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
@@ -241,26 +312,20 @@ class StartFlow:
             # 6. Add initial objective
             if self.selected_steps.get("add_objectives"):
                 print("Adding Initial Objectives...")
-                step_start = time.time()
-                try:
-                    self.ui.Navigation.MenuItem['Plan optimization'].Click()
-                    self.ui.Navigation.MenuItem['Plan optimization'].Popup.MenuItem['Plan optimization'].Click()
-                except:
-                    self.ui.TitleBar.Navigation.MenuItem['Plan optimization'].Click()
-                    self.ui.TitleBar.Navigation.MenuItem['Plan optimization'].Popup.MenuItem['Plan optimization'].Click()
-
-                self.ui.Workspace.TabControl['Objectives/constraints'].TabItem['Objectives/constraints'].Select()
+                step_span = self.tracer.open("Add Initial Objectives")
+                self.navigator.go_to('Plan optimization', 'Plan optimization')
+                self.navigator.select_workspace_tab('Objectives/constraints', 'Objectives/constraints')
                 opjective_adder = ObjectiveAdder(
-                    initial_functions_data=loaded_flow_data['initial_functions_data'],
+                    initial_functions_data=loaded_flow_data['compiled_initial_functions'],
                     case=self.case,
                     plan_name=plan_data['plan_name'],
                     matched_roi_dict=self.match_roi_dict,
-                    robust_settings=loaded_flow_data['robust_settings']
+                    robust_settings=loaded_flow_data['robust_settings'],
+                    robustness=self.robustness
                 )
                 opjective_adder.add_initial_objectives()
-                self.Patient.Save()
-                self.step_times["Add Initial Objectives"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Add Initial Objectives"])
+                self._finish_step("add_objectives", "Add Initial Objectives")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
@@ -270,7 +335,7 @@ class StartFlow:
             # TODO: Calculation setting for Proton plan
             if self.selected_steps.get("add_objectives") or self.selected_steps.get("first_optimization"):
                 print("Setting Opt. and Cal. Settings...")
-                step_start = time.time()
+                step_span = self.tracer.open("Opt. and Cal. Settings")
                 # Optimization Settings
                 self.plan = self.case.TreatmentPlans[plan_data['plan_name']]
                 self.po = self.plan.PlanOptimizations[0]
@@ -299,8 +364,7 @@ class StartFlow:
                         print("[IMPT] Unknown calculation algorithm. Using default calculation algorithm -> MonteCarlo...")
                 else:
                     print("Unknown technique type for calculation algorithm setting.")
-                self.step_times["Opt. and Cal. Settings"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Opt. and Cal. Settings"])
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
@@ -309,11 +373,12 @@ class StartFlow:
             # 8. First Optimization
             if self.selected_steps.get("first_optimization"):
                 print("Starting First Optimization...")
-                step_start = time.time()
-                self.po.RunOptimization()
-                self.Patient.Save()
-                self.step_times["First Optimization"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["First Optimization"])
+                step_span = self.tracer.open("First Optimization")
+                with self.tracer.span("RunOptimization", "optimization"):
+                    self.po.RunOptimization()
+                self.objective_monitor.record(self.po, "First Optimization")
+                self._finish_step("first_optimization", "First Optimization")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
@@ -322,13 +387,18 @@ class StartFlow:
             # 9. Loop Optimization
             if self.selected_steps.get("loop_optimization"):
                 print("Starting Loop Optimization...")
-                step_start = time.time()
+                step_span = self.tracer.open("Loop Optimization")
                 # 9.1 Check Conditions
                 conditions_checker = ConditionChecker(
-                    check_conditions_data=loaded_flow_data['check_conditions_data'],
+                    check_conditions_data=loaded_flow_data['compiled_conditions'],
                     case=self.case,
                     plan_name=plan_data['plan_name'],
-                    matched_roi_dict=self.match_roi_dict
+                    matched_roi_dict=self.match_roi_dict,
+                    examination=self.selected_examination,
+                    tracer=self.tracer,
+                    evaluator=loaded_flow_data['end_flow_data'].get('condition_evaluator', 'api'),
+                    dvh_bins=loaded_flow_data['end_flow_data'].get('dvh_curve_bins', 200),
+                    executor=make_executor(loaded_flow_data['end_flow_data'].get('condition_workers', 1))
                 )
                 
                 # 9.2 Create conditional ROIs
@@ -337,61 +407,131 @@ class StartFlow:
                     matched_roi_dict=self.match_roi_dict,
                     case=self.case,
                     examination=self.selected_examination,
-                    plan=self.plan
+                    plan=self.plan,
+                    tracer=self.tracer
                 )
+                self.conditions_checker = conditions_checker
+                # Cached dose statistics and volume of a ROI are dropped when its geometry is recreated
+                conditional_roi_creator.add_geometry_listener(conditions_checker.roi_geometry_changed)
                 
                 # 9.3 Adjust objectives
                 objective_adjuster = ObjectiveAdjuster(
-                    function_adjustments_data=loaded_flow_data['function_adjustments_data'],
+                    function_adjustments_data=loaded_flow_data['compiled_function_adjustments'],
                     matched_roi_dict=self.match_roi_dict,
                     case=self.case,
                     plan=self.plan,
-                    robust_settings=loaded_flow_data['robust_settings']
+                    robust_settings=loaded_flow_data['robust_settings'],
+                    tracer=self.tracer,
+                    robustness=self.robustness
                 )
                 
-                # 9.4 Run optimization loop
-                for i in range(loaded_flow_data['end_flow_data']['max_optimize_rounds']):
-                    self.plan = self.case.TreatmentPlans[plan_data['plan_name']]
-                    self.po = self.plan.PlanOptimizations[0]
-                    print("  ---------------------")
-                    print(f"  Optimization Loop {i+1}/{loaded_flow_data['end_flow_data']['max_optimize_rounds']}...")
-                    print("  ---------------------")
-                    print("  Checking conditions...")
-                    conditions_checker.set_optimization_round(i+1)
-                    met_condition = conditions_checker.check_all_conditions()
+                # Optional: end the loop when the condition metrics stop moving
+                plateau_detector = ConditionPlateauDetector.from_settings(loaded_flow_data['end_flow_data'])
+                
+                # Only evaluate conditions that are consumed downstream
+                # (early stop and the plateau rule look at every condition)
+                if self.selected_steps.get("Early_Stop_mode") or plateau_detector:
+                    conditions_checker.set_required_conditions(None)
+                else:
+                    conditions_checker.set_required_conditions(referenced_conditions(
+                        loaded_flow_data['condition_rois_data'],
+                        loaded_flow_data['function_adjustments_data']
+                    ))
+                
+                # 9.4 Run optimization loop (continue after the last completed round when resuming)
+                # Worker threads are stopped even if the loop fails
+                try:
+                    start_round = self.resume_state["last_round"] if self.resume_state else 0
+                    # The plateau rule only compares doses that came from a new optimization
+                    dose_optimized = True
+                    for i in range(start_round, loaded_flow_data['end_flow_data']['max_optimize_rounds']):
+                        self.plan = self.case.TreatmentPlans[plan_data['plan_name']]
+                        self.po = self.plan.PlanOptimizations[0]
+                        print("  ---------------------")
+                        print(f"  Optimization Loop {i+1}/{loaded_flow_data['end_flow_data']['max_optimize_rounds']}...")
+                        print("  ---------------------")
+                        round_span = self.tracer.open(f"Loop {i+1}", "round", round=i+1)
+                        print("  Checking conditions...")
+                        conditions_checker.set_optimization_round(i+1)
+                        with self.tracer.span("Check Conditions", "condition"):
+                            met_condition = conditions_checker.check_all_conditions()
                     
-                    early_stop = False
+                        if plateau_detector and dose_optimized and plateau_detector.update(conditions_checker.last_values):
+                            print(f"  Condition metrics plateaued ({plateau_detector.describe()}). Ending loop optimization.\n")
+                            round_span.close()
+                            break
                     
-                    if self.selected_steps.get("Early_Stop_mode"):
-                        print("  Check for early stop...")
-                        if any(met_condition.values()): 
-                            early_stop = False 
-                        else: 
-                            early_stop = True
+                        early_stop = False
                     
-                    if early_stop:
-                        print("  No conditions met. No optimization in this loop.\n")
-                        pass
-                    else:
-                        loop_start = time.time()
-                        conditional_roi_creator.create_all_conditional_rois(met_condition)
-                        objective_adjuster.adjust_objectives(met_condition)
-                        print("  Running optimization...")
-                        self.po.RunOptimization()
-                        self.Patient.Save()
-                        loop_time = time.time() - loop_start
-                        formatted_loop_time = self._format_time(loop_time)
-                        print(f"  ✅ Loop {i+1} completed in {formatted_loop_time}\n")
+                        if self.selected_steps.get("Early_Stop_mode"):
+                            print("  Check for early stop...")
+                            if any(met_condition.values()): 
+                                early_stop = False 
+                            else: 
+                                early_stop = True
                     
-                self.step_times["Loop Optimization"] = time.time() - step_start
-                elapsed = self._format_time(self.step_times["Loop Optimization"])
+                        if early_stop:
+                            print("  No conditions met. No optimization in this loop.\n")
+                            dose_optimized = False
+                            self.journal.record_round(i+1)
+                            round_span.close()
+                        else:
+                            with self.tracer.span("Create Conditional ROIs", "roi"):
+                                conditional_roi_creator.create_all_conditional_rois(met_condition)
+                            with self.tracer.span("Adjust Objectives", "adjustment"):
+                                objective_adjuster.adjust_objectives(met_condition, conditions_checker.margins())
+                            print("  Running optimization...")
+                            with self.tracer.span("RunOptimization", "optimization"):
+                                self.po.RunOptimization()
+                            dose_optimized = True
+                            conditions_checker.invalidate_dose_cache()
+                            self.journal.record_round(i+1)
+                            if self.checkpoint.round_done(i+1):
+                                self.journal.record_saved()
+                            self.objective_monitor.record(self.po, f"Loop {i+1}")
+                            formatted_loop_time = self._format_time(round_span.close())
+                            print(f"  ✅ Loop {i+1} completed in {formatted_loop_time}\n")
+                        
+                            if self.objective_monitor.should_stop():
+                                print(f"  Objective improved {self.objective_monitor.improvement():.2f}% over the last {self.objective_monitor.rounds} optimization(s). Ending loop optimization.\n")
+                                break
+                finally:
+                    conditions_checker.executor.shutdown()
+                self.journal.record_step("loop_optimization")
+                elapsed = self._format_time(step_span.close())
                 print(f"✅ Completed in {elapsed}\n")
                 print('#' * 50 + '\n')
             else:
                 print("[SKIPPED] Loop optimization\n")
             
+            # Final checkpoint if any save was skipped
+            if self.checkpoint.flow_done():
+                self.journal.record_saved()
+            self.journal.record_finished()
+            self.completed = True
+            self.flow_span.close()
+            
             # Print timing summary
             self.print_timing_summary()
+            if self.profiler:
+                print("\n".join(self.profiler.report(top_n=15)))
+                print("=" * 60 + "\n")
+            self.export_trace()
+            self.export_condition_history()
+    
+    def _report_error(self, title, message):
+        """Show an error message box, or raise when running non-interactively."""
+        if self.interactive:
+            messagebox.showerror(title, message)
+        else:
+            raise RuntimeError(f"{title}: {message}")
+    
+    def _finish_step(self, step_key, checkpoint_name):
+        """Record a finished step in the run journal and checkpoint the patient."""
+        self.journal.record_step(step_key)
+        if self.checkpoint.step_done(checkpoint_name):
+            self.journal.record_saved()
+    
     def load_flow_data(self, flow_data, plan_data):
         """Load the planning flow data to be a Dictionary format."""
         try:
@@ -418,6 +558,13 @@ class StartFlow:
             clinical_goal_data = flow_data.get("clinical_goal", {})
             robust_settings = flow_data.get("robust_settings", {})
             
+            # Parse all check conditions once; malformed criteria stop the flow here, before any optimization
+            compiled_conditions = compile_conditions(check_conditions_data)
+            # Parse the function descriptions once; unparseable ones stop the flow here too
+            compiled_initial_functions = compile_functions(initial_functions_data, "initial functions", default_weight="1")
+            compiled_function_adjustments = compile_functions(function_adjustments_data, "function adjustments",
+                                                              conditions=compiled_conditions)
+            
             loaded_flow_data = {
                 "plan_name": plan_name,
                 "machine": machine,
@@ -429,11 +576,14 @@ class StartFlow:
                 "match_roi_data": match_roi_data,
                 "automate_roi_data": automate_roi_data,
                 "initial_functions_data": initial_functions_data,
+                "compiled_initial_functions": compiled_initial_functions,
                 "optimization_data": optimization_data,
                 "final_calc_data": final_calc_data,
                 "check_conditions_data": check_conditions_data,
+                "compiled_conditions": compiled_conditions,
                 "condition_rois_data": condition_rois_data,
                 "function_adjustments_data": function_adjustments_data,
+                "compiled_function_adjustments": compiled_function_adjustments,
                 "end_flow_data": end_flow_data,
                 "clinical_goal_data": clinical_goal_data,
                 "robust_settings": robust_settings
@@ -442,31 +592,75 @@ class StartFlow:
             return loaded_flow_data
             
         except Exception as e:
-            messagebox.showerror("Load Error", f"Failed to load flow data:\n{str(e)}")
+            self._report_error("Load Error", f"Failed to load flow data:\n{str(e)}")
+    
+    @property
+    def step_times(self):
+        """Total time per flow step in seconds, derived from the tracer's step spans."""
+        return self.tracer.totals("step")
+    
+    def export_condition_history(self):
+        """Write the per-round condition values as CSV and compact binary next to the run journal."""
+        if not self.run_path or not self.conditions_checker or not len(self.conditions_checker.history):
+            return None
+        try:
+            history = self.conditions_checker.history
+            history.export_csv(self.run_path + ".conditions.csv")
+            history.export_binary(self.run_path + ".conditions.bin")
+            print(f"Condition history written to: {self.run_path}.conditions.csv / .bin")
+            return self.run_path + ".conditions.csv"
+        except Exception as e:
+            print(f"Warning: Could not write condition history: {str(e)}")
+            return None
+    
+    def export_trace(self):
+        """Write the Chrome trace-event JSON of this run next to the run journal."""
+        if not self.trace_path:
+            return None
+        try:
+            self.tracer.export_chrome_trace(self.trace_path)
+            print(f"Trace written to: {self.trace_path}")
+            return self.trace_path
+        except Exception as e:
+            print(f"Warning: Could not write trace file: {str(e)}")
+            return None
     
     def _format_time(self, seconds):
-        """Format time in seconds to HH:MM:SS format."""
+        """Format time in seconds to HH:MM:SS.mmm format."""
         hours = int(seconds // 3600)
         minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+        secs = seconds % 60
+        return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
     
     def print_timing_summary(self):
-        """Print execution time summary."""
-        total_time = time.time() - self.overall_start_time
+        """Print execution time summary with a nested breakdown of each step."""
+        total_time = self.flow_span.duration
         
         print("\n" + "=" * 60)
         print("EXECUTION TIME SUMMARY")
         print("=" * 60)
         
-        for step_name, step_time in self.step_times.items():
-            percentage = (step_time / total_time) * 100
-            formatted_time = self._format_time(step_time)
-            print(f"{step_name:<30} {formatted_time:>10} ({percentage:>5.1f}%)")
+        for step_span in [span for span in self.tracer.spans if span.category == "step"]:
+            percentage = (step_span.duration / total_time) * 100
+            formatted_time = self._format_time(step_span.duration)
+            print(f"{step_span.name:<30} {formatted_time:>14} ({percentage:>5.1f}%)")
+            for depth, name, count, child_time in self.tracer.breakdown(step_span, max_depth=3):
+                label = ("  " * depth + f"{name} x{count}")[:30]
+                print(f"{label:<30} {self._format_time(child_time):>14} ({child_time / total_time * 100:>5.1f}%)")
         
         print("-" * 60)
         total_formatted = self._format_time(total_time)
-        print(f"{'TOTAL EXECUTION TIME':<30} {total_formatted:>10} (100.0%)")
+        print(f"{'TOTAL EXECUTION TIME':<30} {total_formatted:>14} (100.0%)")
+        print("-" * 60)
+        print(f"Patient saves: {self.checkpoint.summary()}")
+        print(f"UI navigation: {self.navigator.summary()}")
+        if self.conditions_checker:
+            print(f"Dose statistics cache: {self.conditions_checker.cache_summary()}")
+        if self.objective_monitor.trajectory:
+            print("-" * 60)
+            print("Objective value trajectory:")
+            for line in self.objective_monitor.summary_lines():
+                print(f"  {line}")
         print("=" * 60)
         print(f"Finished at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 60 + "\n")
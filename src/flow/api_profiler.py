@@ -0,0 +1,191 @@
+import sys
+import threading
+import time
+
+
+class ApiProfiler:
+    """
+    Opt-in profiler for RayStation scripting API usage.
+    Objects wrapped with wrap() (case, plan, po, dose, ...) count and time every attribute access,
+    item lookup and method call made through them. Calls are grouped by flow step (the open step
+    span of the tracer) and by calling class (ConditionChecker, ObjectiveAdjuster, ...).
+    """
+
+    # Values returned as-is instead of being wrapped
+    PLAIN_TYPES = (int, float, str, bool, bytes, list, tuple, dict, type(None))
+
+    def __init__(self, tracer=None):
+        """
+        Initialize the API profiler.
+
+        Args:
+            tracer: Optional SpanTracer, used to group calls by the currently open step
+        """
+        self.tracer = tracer
+        self.stats = {}  # (step, caller, call) -> [count, total_seconds]
+        self._lock = threading.Lock()  # conditions may call the API from executor worker threads
+
+    def wrap(self, target, name):
+        """
+        Wrap a RayStation object so all API usage through it is profiled.
+
+        Args:
+            target: RayStation object, e.g. the case
+            name: Name shown in the report, e.g. "case"
+        """
+        if isinstance(target, ProfiledProxy) or isinstance(target, self.PLAIN_TYPES):
+            return target
+        return ProfiledProxy(target, self, name)
+
+    def record(self, call, elapsed):
+        """Record one API access with its duration in seconds."""
+        key = (self._current_step(), self._caller(), call)
+        with self._lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def total_time(self):
+        """Total time spent inside profiled API accesses in seconds."""
+        with self._lock:
+            return sum(entry[1] for entry in self.stats.values())
+
+    def report(self, top_n=15):
+        """
+        Build the hottest-calls report.
+
+        Args:
+            top_n: Number of entries to include
+
+        Returns:
+            List of report lines
+        """
+        with self._lock:
+            stats = {key: tuple(entry) for key, entry in self.stats.items()}
+        total_calls = sum(entry[0] for entry in stats.values())
+        total_time = sum(entry[1] for entry in stats.values())
+        lines = [f"API PROFILE (top {top_n} of {len(stats)} call sites, {total_calls} calls, {total_time:.3f} s)"]
+        lines.append(f"{'Call':<48} {'Count':>6} {'Total (s)':>10} {'Mean (ms)':>10}  Step / Caller")
+        hottest = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)[:top_n]
+        for (step, caller, call), (count, total) in hottest:
+            call_label = call if len(call) <= 48 else "..." + call[-45:]
+            lines.append(f"{call_label:<48} {count:>6} {total:>10.3f} {total / count * 1000:>10.2f}  {step} / {caller}")
+        return lines
+
+    def _current_step(self):
+        if self.tracer is None:
+            return "-"
+        span = self.tracer.current("step")
+        return span.name if span else "-"
+
+    @staticmethod
+    def _caller():
+        # First frame outside this module that runs inside a method tells the calling class
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        if frame is None:
+            return "-"
+        instance = frame.f_locals.get("self")
+        if instance is not None:
+            return type(instance).__name__
+        return frame.f_globals.get("__name__", "-").rsplit(".", 1)[-1]
+
+
+def _unwrap(value):
+    """Return the wrapped RayStation object for proxies (also inside lists and dicts)."""
+    if isinstance(value, ProfiledProxy):
+        return object.__getattribute__(value, "_target")
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _unwrap(v) for k, v in value.items()}
+    return value
+
+
+class ProfiledProxy:
+    """Transparent proxy around a RayStation object that reports its usage to an ApiProfiler."""
+
+    __slots__ = ("_target", "_profiler", "_path")
+
+    def __init__(self, target, profiler, path):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_profiler", profiler)
+        object.__setattr__(self, "_path", path)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, "_target")
+        profiler = object.__getattribute__(self, "_profiler")
+        path = f"{object.__getattribute__(self, '_path')}.{name}"
+
+        start = time.perf_counter()
+        value = getattr(target, name)
+        elapsed = time.perf_counter() - start
+
+        # Method lookups are counted together with the call itself
+        if callable(value) and not isinstance(value, type):
+            return _ProfiledMethod(value, profiler, f"{path}()", elapsed)
+        profiler.record(path, elapsed)
+        return profiler.wrap(value, path)
+
+    def __setattr__(self, name, value):
+        profiler = object.__getattribute__(self, "_profiler")
+        start = time.perf_counter()
+        setattr(object.__getattribute__(self, "_target"), name, _unwrap(value))
+        profiler.record(f"{object.__getattribute__(self, '_path')}.{name} =", time.perf_counter() - start)
+
+    def __getitem__(self, key):
+        profiler = object.__getattribute__(self, "_profiler")
+        # Lookups by different names are grouped together, e.g. "case.PatientModel.RegionsOfInterest[]"
+        path = f"{object.__getattribute__(self, '_path')}[]"
+        start = time.perf_counter()
+        value = object.__getattribute__(self, "_target")[_unwrap(key)]
+        profiler.record(path, time.perf_counter() - start)
+        return profiler.wrap(value, path)
+
+    def __iter__(self):
+        profiler = object.__getattribute__(self, "_profiler")
+        path = f"{object.__getattribute__(self, '_path')}[]"
+        for item in object.__getattribute__(self, "_target"):
+            yield profiler.wrap(item, path)
+
+    def __len__(self):
+        return len(object.__getattribute__(self, "_target"))
+
+    def __bool__(self):
+        return bool(object.__getattribute__(self, "_target"))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, "_target") == _unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, "_target"))
+
+    def __str__(self):
+        return str(object.__getattribute__(self, "_target"))
+
+    def __repr__(self):
+        return repr(object.__getattribute__(self, "_target"))
+
+
+class _ProfiledMethod:
+    """Callable returned for API methods; times the call and unwraps proxied arguments."""
+
+    __slots__ = ("_method", "_profiler", "_path", "_lookup_time")
+
+    def __init__(self, method, profiler, path, lookup_time=0.0):
+        self._method = method
+        self._profiler = profiler
+        self._path = path
+        self._lookup_time = lookup_time
+
+    def __call__(self, *args, **kwargs):
+        args = [_unwrap(a) for a in args]
+        kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+        start = time.perf_counter()
+        result = self._method(*args, **kwargs)
+        self._profiler.record(self._path, time.perf_counter() - start + self._lookup_time)
+        return self._profiler.wrap(result, self._path)
@@ -0,0 +1,201 @@
+import csv
+import os
+import statistics
+import time
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+
+from src.StartFlow import StartFlow
+from src.flow.run_journal import RunJournal
+
+try:
+    from raystation import *
+    import raystation.v2025 as rs
+    from raystation.v2025 import get_current
+    import raystation.v2025.typing as rstype
+except:
+    from connect import *
+
+
+class BatchRunner:
+    """
+    Run one flow non-interactively for a list of patients read from a CSV file.
+    Each patient is opened from the patient database, StartFlow runs headless with
+    non-interactive ROI matching and examination/plan selection, and the console output
+    is written to a per-patient log file. A throughput summary is written at the end.
+    """
+
+    REQUIRED_COLUMNS = ["patient_id", "case_name", "examination_name", "plan_name"]
+
+    def __init__(self, workflow_data, selected_steps, machine, log_dir, checkpoint_settings=None, save_on_failure=True):
+        """
+        Initialize the batch runner.
+
+        Args:
+            workflow_data: Loaded flow dictionary
+            selected_steps: Dictionary of selected flow steps (Headless_mode is forced on)
+            machine: Default treatment machine (a "machine" CSV column overrides it)
+            log_dir: Directory for per-patient logs, run journals and the batch summary
+            checkpoint_settings: "checkpoint_policy" section of setting.json
+            save_on_failure: Save a patient whose flow failed, so the next patient can be opened
+        """
+        self.workflow_data = workflow_data
+        self.selected_steps = dict(selected_steps)
+        self.selected_steps["Headless_mode"] = True
+        self.machine = machine
+        self.log_dir = log_dir
+        self.checkpoint_settings = checkpoint_settings
+        self.save_on_failure = save_on_failure
+        self.results = []
+
+    @classmethod
+    def read_csv(cls, csv_path):
+        """
+        Read the batch CSV file.
+
+        Returns:
+            List of row dictionaries with at least the REQUIRED_COLUMNS
+        """
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            columns = [c.strip() for c in (reader.fieldnames or [])]
+            missing = [c for c in cls.REQUIRED_COLUMNS if c not in columns]
+            if missing:
+                raise ValueError(f"Batch CSV is missing column(s): {', '.join(missing)}")
+            rows = []
+            for row in reader:
+                row = {(k or "").strip(): (v or "").strip() for k, v in row.items()}
+                if row.get("patient_id"):
+                    rows.append(row)
+        return rows
+
+    def run(self, csv_path):
+        """
+        Run the flow for every patient in the CSV file.
+
+        Returns:
+            List of result dictionaries (patient_id, plan_name, status, duration, step_times, log_path, error)
+        """
+        rows = self.read_csv(csv_path)
+        os.makedirs(self.log_dir, exist_ok=True)
+        flow_name = self.workflow_data.get("flow_name", "Unnamed")
+        print(f"Batch: {len(rows)} patient(s) with flow '{flow_name}'\n")
+
+        batch_start = time.time()
+        self.results = []
+        for index, row in enumerate(rows, start=1):
+            print(f"[{index}/{len(rows)}] {row['patient_id']} / {row['case_name']} / {row['plan_name']}")
+            result = self._run_patient(row)
+            self.results.append(result)
+            if result["status"] == "completed":
+                print(f"  ✅ Completed in {result['duration']:.1f} s")
+            else:
+                print(f"  ❌ {result['error']}")
+
+        summary_path = self.write_summary(time.time() - batch_start)
+        print(f"\nBatch summary written to: {summary_path}")
+        return self.results
+
+    def _run_patient(self, row):
+        safe_name = f"{row['patient_id']}_{row['plan_name']}".replace(" ", "_").replace("/", "_").replace("\\", "_")
+        log_path = os.path.join(self.log_dir, f"{safe_name}.log")
+        result = {
+            "patient_id": row["patient_id"],
+            "plan_name": row["plan_name"],
+            "status": "failed",
+            "duration": 0.0,
+            "step_times": {},
+            "log_path": log_path,
+            "error": None
+        }
+        plan_data = {
+            'plan_name': row["plan_name"],
+            'machine': row.get("machine") or self.machine,
+            'examination_name': row["examination_name"]
+        }
+        journal_path = RunJournal.journal_path(self.log_dir, self.workflow_data.get("flow_name", "Unnamed"), safe_name)
+
+        patient = None
+        start = time.time()
+        with open(log_path, 'w', encoding='utf-8') as log_file, redirect_stdout(log_file), redirect_stderr(log_file):
+            try:
+                patient = self._open_patient(row["patient_id"], row["case_name"])
+                flow = StartFlow(workflow_data=self.workflow_data, plan_data=plan_data, selected_steps=self.selected_steps,
+                                 checkpoint_settings=self.checkpoint_settings, journal_path=journal_path, interactive=False)
+                result["step_times"] = dict(flow.step_times)
+                if flow.completed:
+                    result["status"] = "completed"
+                else:
+                    result["error"] = "Flow stopped before the end"
+            except Exception as e:
+                result["error"] = str(e)
+                print(f"❌ Error during planning flow: {str(e)}")
+
+            if result["status"] != "completed" and patient is not None and self.save_on_failure:
+                try:
+                    patient.Save()
+                    print("Patient saved after failure")
+                except Exception as e:
+                    print(f"Warning: Could not save patient after failure: {str(e)}")
+        result["duration"] = time.time() - start
+        return result
+
+    def _open_patient(self, patient_id, case_name):
+        """Load a patient from the patient database and make the case current."""
+        patient_db = get_current("PatientDB")
+        patient_infos = patient_db.QueryPatientInfo(Filter={"PatientID": patient_id})
+        if len(patient_infos) == 0:
+            raise ValueError(f"Patient '{patient_id}' not found in the patient database")
+        if len(patient_infos) > 1:
+            raise ValueError(f"Patient ID '{patient_id}' matches {len(patient_infos)} patients")
+
+        patient = patient_db.LoadPatient(PatientInfo=patient_infos[0], AllowPatientUpgrade=True)
+        case_names = [case.CaseName for case in patient.Cases]
+        if case_name not in case_names:
+            raise ValueError(f"Case '{case_name}' not found for patient '{patient_id}'")
+        patient.Cases[case_name].SetCurrent()
+        return patient
+
+    def write_summary(self, total_time):
+        """
+        Write the batch summary (per-patient status, patients/hour and per-step medians).
+
+        Returns:
+            Path of the summary file
+        """
+        completed = [r for r in self.results if r["status"] == "completed"]
+        patients_per_hour = len(completed) / (total_time / 3600) if total_time > 0 else 0.0
+
+        step_names = []
+        for result in completed:
+            for step in result["step_times"]:
+                if step not in step_names:
+                    step_names.append(step)
+
+        lines = [
+            f"Batch summary - {self.workflow_data.get('flow_name', 'Unnamed')}",
+            f"Finished at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            "=" * 60,
+            f"Patients: {len(self.results)} ({len(completed)} completed, {len(self.results) - len(completed)} failed)",
+            f"Total time: {total_time / 60:.1f} min",
+            f"Throughput: {patients_per_hour:.2f} patients/hour",
+            ""
+        ]
+        if step_names:
+            lines.append("Median step times (completed patients):")
+            for step in step_names:
+                times = [r["step_times"][step] for r in completed if step in r["step_times"]]
+                lines.append(f"  {step:<35} {statistics.median(times):>8.1f} s")
+            lines.append("")
+        lines.append("Patients:")
+        for result in self.results:
+            status = "OK    " if result["status"] == "completed" else "FAILED"
+            line = f"  {status} {result['patient_id']:<15} {result['plan_name']:<15} {result['duration']:>8.1f} s"
+            if result["error"]:
+                line += f"  {result['error']}"
+            lines.append(line)
+
+        summary_path = os.path.join(self.log_dir, f"batch_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return summary_path
@@ -0,0 +1,133 @@
+import time
+
+
+class CheckpointPolicy:
+    """
+    Decide when the patient is saved during a planning flow.
+    All Patient.Save() calls of StartFlow and PlanCreater are routed through this class,
+    so long runs do not spend minutes on saves that nothing depends on.
+    Supported modes: "every_step", "every_n_rounds", "end_of_flow" and "time_based".
+    """
+
+    MODES = ["every_step", "every_n_rounds", "end_of_flow", "time_based"]
+
+    def __init__(self, patient, mode="every_step", every_n_rounds=1, interval_seconds=600):
+        """
+        Initialize the checkpoint policy.
+
+        Args:
+            patient: RayStation patient object
+            mode: One of CheckpointPolicy.MODES
+            every_n_rounds: Save every N loop rounds (only used in "every_n_rounds" mode)
+            interval_seconds: Minimum time between saves (only used in "time_based" mode)
+        """
+        if mode not in self.MODES:
+            print(f"Warning: Unknown checkpoint mode '{mode}'. Using 'every_step'.")
+            mode = "every_step"
+
+        self.patient = patient
+        self.mode = mode
+        self.every_n_rounds = max(1, int(every_n_rounds))
+        self.interval_seconds = float(interval_seconds)
+
+        self.save_count = 0
+        self.skipped_count = 0
+        self.save_time = 0.0
+        self.pending = 0  # Checkpoints skipped since the last save
+        self.last_save_time = time.time()
+        self.last_checkpoint = None
+
+    @classmethod
+    def from_settings(cls, patient, settings):
+        """
+        Create a policy from the "checkpoint_policy" section of setting.json.
+
+        Args:
+            patient: RayStation patient object
+            settings: Dictionary like {"mode": "every_n_rounds", "every_n_rounds": 3}
+        """
+        settings = settings or {}
+        return cls(
+            patient,
+            mode=settings.get("mode", "every_step"),
+            every_n_rounds=settings.get("every_n_rounds", 1),
+            interval_seconds=settings.get("interval_seconds", 600)
+        )
+
+    def step_done(self, step_name):
+        """
+        Checkpoint after a flow step.
+
+        Returns:
+            True if the patient was saved, False if the save was skipped
+        """
+        if self.mode == "every_step" or self.mode == "every_n_rounds":
+            return self._save(step_name)
+        if self.mode == "time_based" and self._interval_elapsed():
+            return self._save(step_name)
+        return self._skip()
+
+    def force(self, step_name):
+        """
+        Checkpoint that always saves, whatever the mode (e.g. before SetCurrent on a new plan or
+        beam set, which RayStation refuses while they are unsaved). Counted in the save stats.
+
+        Returns:
+            True
+        """
+        return self._save(step_name)
+
+    def round_done(self, round_number):
+        """
+        Checkpoint after an optimization loop round.
+
+        Returns:
+            True if the patient was saved, False if the save was skipped
+        """
+        if self.mode == "every_step":
+            return self._save(f"Loop {round_number}")
+        if self.mode == "every_n_rounds" and round_number % self.every_n_rounds == 0:
+            return self._save(f"Loop {round_number}")
+        if self.mode == "time_based" and self._interval_elapsed():
+            return self._save(f"Loop {round_number}")
+        return self._skip()
+
+    def flow_done(self):
+        """
+        Final checkpoint at the end of the flow. Saves only if a previous checkpoint was skipped.
+
+        Returns:
+            True if the patient was saved, False otherwise
+        """
+        if self.pending > 0:
+            return self._save("End of flow")
+        return False
+
+    def avoided_time(self):
+        """Estimate of the save time avoided, based on the average measured save time."""
+        if self.save_count == 0:
+            return 0.0
+        return self.skipped_count * (self.save_time / self.save_count)
+
+    def summary(self):
+        """Return a one-line summary of saves performed and skipped."""
+        return (f"{self.save_count} saves ({self.save_time:.1f} s), "
+                f"{self.skipped_count} skipped (~{self.avoided_time():.1f} s avoided) [mode: {self.mode}]")
+
+    def _interval_elapsed(self):
+        return time.time() - self.last_save_time >= self.interval_seconds
+
+    def _save(self, reason):
+        save_start = time.time()
+        self.patient.Save()
+        self.last_save_time = time.time()
+        self.save_time += self.last_save_time - save_start
+        self.save_count += 1
+        self.pending = 0
+        self.last_checkpoint = reason
+        return True
+
+    def _skip(self):
+        self.skipped_count += 1
+        self.pending += 1
+        return False
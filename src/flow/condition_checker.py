@@ -1,30 +1,105 @@
-import re
+import threading
 from tkinter import messagebox
+from src.flow.tracer import NULL_TRACER
+from src.flow.condition_compiler import CompiledCondition, compile_conditions
+from src.flow.dvh_engine import DvhEngine, read_dose_grid, read_roi_mask
+from src.flow.dvh_curve import DvhCurve
+from src.flow.condition_history import ConditionHistory
+from src.flow.condition_executor import SerialExecutor
 
 
 class ConditionChecker:
     """
     Evaluates conditions from check_conditions data and returns which conditions are met.
     Used to determine if conditional ROIs and function adjustments should be applied.
+    Dose metrics come from the RayStation API ("api"), the local NumPy DVH engine ("numpy"),
+    the API cross-checked against the engine ("verify"), or one cached cumulative DVH curve
+    per ROI and round ("curve").
     """
     
-    def __init__(self, check_conditions_data, matched_roi_dict, case, plan_name):
+    EVALUATORS = ["api", "numpy", "verify", "curve"]
+    
+    # Relative cost of evaluating a metric that is not cached yet (expression operands are ordered by it)
+    METRIC_COSTS = {"always": 0, "max": 1, "min": 1, "mean": 1, "dav": 2, "vad": 2}
+    
+    def __init__(self, check_conditions_data, matched_roi_dict, case, plan_name, examination=None, tracer=None,
+                 evaluator="api", dvh_bins=200, executor=None):
         """
         Initialize the condition checker.
         
         Args:
-            check_conditions_data: List of condition dictionaries from flow JSON
+            check_conditions_data: List of CompiledCondition (or condition dictionaries from flow JSON, compiled here)
             matched_roi_dict: Dictionary mapping flow ROI names to case ROI names
             case: RayStation case object
             plan_name: Name of the plan to check conditions against
+            examination: RayStation examination whose structure set holds the ROI geometries
+                         (None uses the first structure set)
+            tracer: Optional SpanTracer for per-condition and API call timing
+            evaluator: One of ConditionChecker.EVALUATORS
+            dvh_bins: Number of dose samples per DVH curve ("curve" evaluator)
+            executor: Condition executor from condition_executor.make_executor() (None evaluates serially)
         """
         self.check_conditions_data = check_conditions_data
+        if all(isinstance(condition, CompiledCondition) for condition in check_conditions_data):
+            self.conditions = list(check_conditions_data)
+        else:
+            self.conditions = compile_conditions(check_conditions_data)
+        self._conditions_by_name = {condition.name: condition for condition in self.conditions}
+        self._round_results = {}  # Condition name -> result, memoized for the current round
+        self._round_short_circuited = set()  # Expression operands skipped once the result was known
+        self._round_inactive_operands = set()  # Expression operands not active in the current round
+        self._previous_results = {}  # Condition name -> result of its last evaluation (hysteresis)
         self.matched_roi_dict = matched_roi_dict
         self.case = case
         self.plan_name = plan_name
         self.plan = None
         self.dose = None
         self.optimization_round = 0  # Track current optimization round
+        self.last_values = {}  # Metric values evaluated in the last check (condition name -> value)
+        self.required = None  # Condition names to evaluate (None evaluates all)
+        self.history = ConditionHistory()  # Every evaluated condition of every round
+        self.executor = executor or SerialExecutor()
+        self.skipped_evaluations = 0  # unused conditions not evaluated
+        self.short_circuit_skips = 0  # expression operands not evaluated because the result was known
+        self.inactive_operands = 0  # expression operands that could not be evaluated (inactive round)
+        self.tracer = tracer or NULL_TRACER
+        
+        # Dose statistics cache: (roi, statistic, argument) -> value, valid until the dose or a ROI geometry changes
+        self._dose_cache = {}
+        self._key_locks = {}  # per-key locks of the dose, ROI volume and DVH curve caches
+        self._counter_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.round_cache_hits = 0
+        self.round_cache_misses = 0
+        self.round_batched_calls = 0
+        
+        # ROI volume cache: (structure set, roi) -> cc, valid until the ROI geometry is rewritten
+        self.examination = examination
+        self._roi_volume_cache = {}
+        self.volume_hits = 0
+        self.volume_queries = 0
+        
+        # Local NumPy DVH engine (dose grid loaded once per round, ROI masks once per run)
+        if evaluator not in self.EVALUATORS:
+            print(f"Warning: Unknown condition evaluator '{evaluator}'. Using 'api'.")
+            evaluator = "api"
+        self.evaluator = evaluator
+        self.engine = None
+        self._engine_dose_loaded = False
+        self.verify_checks = 0
+        self.verify_mismatches = 0
+        if self.evaluator in ("numpy", "verify"):
+            try:
+                self.engine = DvhEngine()
+            except ImportError as e:
+                print(f"Warning: {str(e)} Using 'api' condition evaluator.")
+                self.evaluator = "api"
+        
+        # Cumulative DVH curves ("curve" evaluator): current curves per ROI, and all curves per round
+        self.dvh_bins = max(2, int(dvh_bins))
+        self._dvh_curves = {}  # roi -> DvhCurve of the current dose
+        self.dvh_curve_history = {}  # optimization round -> {roi: DvhCurve}
         
         # Get plan and dose distribution
         try:
@@ -34,310 +109,622 @@ class ConditionChecker:
         except Exception as e:
             print(f"Warning: Could not access plan or dose: {str(e)}")
     
+    def set_required_conditions(self, required):
+        """
+        Limit evaluation to the conditions that are consumed downstream.
+        Other conditions are reported once here and return False without being evaluated.
+        
+        Args:
+            required: Set of condition names, or None to evaluate every condition
+        """
+        self.required = None if required is None else set(required)
+        if self.required is None:
+            return
+        # Operands of required expressions are evaluated on demand, so they are not unused
+        reachable = set()
+        pending = [name for name in self.required if name in self._conditions_by_name]
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            condition = self._conditions_by_name[name]
+            if condition.metric == "expression":
+                pending.extend(condition.expression.references())
+        unused = [condition.name for condition in self.conditions if condition.name not in reachable]
+        if unused:
+            print(f"  ⏭️ Not evaluated (not used by any conditional ROI or function adjustment): {', '.join(unused)}")
+        names = {condition.name for condition in self.conditions}
+        for name in sorted(self.required - names):
+            print(f"  Warning: Condition '{name}' is referenced but not defined in check conditions")
+    
     def check_all_conditions(self):
         """
-        Evaluate all conditions and return a dictionary of results.
+        Evaluate all required conditions and return a dictionary of results.
         
         Returns:
             Dictionary mapping condition names to True/False
             Example: {"Heart Dmean1500": True, "Lung V20": False}
         """
         results = {}
+        self.last_values = {}
+        self._round_results = {}
+        self._round_short_circuited = set()
+        self._round_inactive_operands = set()
+        self.round_cache_hits = 0
+        self.round_cache_misses = 0
+        self.round_batched_calls = 0
         
-        for condition in self.check_conditions_data:
-            condition_name = condition.get("name", "")
-            condition_type = condition.get("type", "")
-            roi_name = condition.get("roi", "")
-            criteria = condition.get("criteria", "")
-            active_round_symbol = condition.get("active_round", "≥ 0").split()[0]
-            active_round = condition.get("active_round", "≥ 0").split()[1]
+        # Phase 1: fetch all DaV/VaD values of the active, required conditions with one call per ROI and API
+        active_conditions = [condition for condition in self.conditions
+                             if condition.is_active(self.optimization_round)
+                             and (self.required is None or condition.name in self.required)]
+        self._prefetch_dvh(active_conditions)
+        
+        # Phase 2: evaluate the conditions (DVH values come from the cache, each condition is evaluated once)
+        # With a concurrent executor the metric conditions run in parallel and are merged in flow order
+        metric_conditions = [condition for condition in active_conditions if condition.metric != "expression"]
+        if self.executor.concurrent and len(metric_conditions) > 1:
+            outcomes = self.executor.map(self._run_condition, metric_conditions)
+            for condition, (met, value) in zip(metric_conditions, outcomes):
+                self._record(condition, met, value)
+        for condition in active_conditions:
+            self._condition_result(condition.name)
+        
+        # Conditions only pulled in by expressions report their result too
+        skipped = 0
+        short_circuited = 0
+        for condition in self.conditions:
+            if condition.name in self._round_results:
+                results[condition.name] = self._round_results[condition.name]
+            else:
+                results[condition.name] = False
+                if condition.is_active(self.optimization_round):
+                    if condition.name in self._round_short_circuited:
+                        short_circuited += 1
+                    else:
+                        skipped += 1
+                # else: print(f"  ⏩ Condition NOT evaluated (inactive round): {condition.name}")
+        
+        if skipped:
+            self.skipped_evaluations += skipped
+            print(f"  ⏭️ {skipped} unused condition(s) not evaluated")
+        if short_circuited:
+            self.short_circuit_skips += short_circuited
+            print(f"  ⏭️ {short_circuited} expression operand(s) skipped, result already known")
+        if self._round_inactive_operands:
+            self.inactive_operands += len(self._round_inactive_operands)
+            print(f"  ⏩ {len(self._round_inactive_operands)} expression operand(s) not active in this round (not met)")
+        if self.round_cache_hits or self.round_cache_misses:
+            print(f"  Dose statistics cache: {self.round_cache_hits} hits, {self.round_cache_misses} misses, {self.round_batched_calls} batched DVH calls")
+        return results
+    
+    def _condition_result(self, name):
+        """
+        Result of a condition in this round, evaluated on first use and memoized.
+        Conditions that are not active in this round are False.
+        """
+        if name in self._round_results:
+            return self._round_results[name]
+        condition = self._conditions_by_name[name]
+        if not condition.is_active(self.optimization_round):
+            self._round_results[name] = False
+            return False
+        
+        met, value = self._run_condition(condition)
+        self._record(condition, met, value)
+        return met
+    
+    def _run_condition(self, condition):
+        """
+        Evaluate one condition and print its result (may run in a worker thread for metric conditions).
+        
+        Returns:
+            (met, value) - value is None for expressions and after errors
+        """
+        print(f"  ▶️ Evaluating condition: {condition.name}")
+        condition_span = self.tracer.open(condition.name, "condition", type=condition.type, roi=condition.roi)
+        try:
+            # Evaluate based on metric kind
+            if condition.metric == "always":
+                met, value = (True, self.optimization_round)
+            elif condition.metric == "expression":
+                met, value = (self._evaluate_expression(condition.expression), None)
+            elif condition.metric == "max":
+                met, value = self._check_max_dose(condition)
+            elif condition.metric == "min":
+                met, value = self._check_min_dose(condition)
+            elif condition.metric == "mean":
+                met, value = self._check_dmean(condition)
+            elif condition.metric == "dav":
+                met, value = self._check_dav(condition)
+            else:
+                met, value = self._check_vad(condition)
             
-            # Check if condition is active in current optimization round
-            round_met = False
-            if active_round_symbol == "≥":
-                round_met = self.optimization_round >= int(active_round)
-            elif active_round_symbol == ">":
-                round_met = self.optimization_round > int(active_round)
-            elif active_round_symbol == "=":
-                round_met = self.optimization_round == int(active_round)
-            elif active_round_symbol == "<":
-                round_met = self.optimization_round < int(active_round)
-            elif active_round_symbol == "≤":
-                round_met = self.optimization_round <= int(active_round)
+            # Print result for all condition types
+            value_text = f" - Value: {value:.2f}" if value is not None else ""
+            if met:
+                print(f"    ✅ Condition MET: {condition.name}{value_text} ({condition.criteria})")
             else:
-                print(f"Warning: Unknown active round symbol '{active_round_symbol}' for condition '{condition_name}'")
-                round_met = False
+                print(f"    ❌ Condition NOT met: {condition.name}{value_text} ({condition.criteria})")
+            return (met, value)
                 
-            if not round_met:
-                results[condition_name] = False
-                # print(f"  ⏩ Condition NOT evaluated (inactive round): {condition_name}")
+        except Exception as e:
+            print(f"  ⚠️ Error evaluating condition '{condition.name}': {str(e)}")
+            return (False, None)
+        finally:
+            condition_span.close()
+    
+    def _record(self, condition, met, value):
+        """Store the result of an evaluated condition for this round (memo, values, history)."""
+        if condition.metric not in ("always", "expression") and value is not None:
+            self.last_values[condition.name] = value
+        self.history.append(self.optimization_round, condition.name, value if condition.metric != "always" else None,
+                            condition.threshold, met, condition.criteria)
+        self._round_results[condition.name] = met
+        self._previous_results[condition.name] = met
+    
+    def _evaluate_expression(self, node):
+        """
+        Evaluate an AND/OR/NOT expression over other conditions.
+        Operands are tried cheapest first and evaluation stops as soon as the result is known.
+        """
+        if node.op == "ref":
+            if not self._conditions_by_name[node.name].is_active(self.optimization_round):
+                self._round_inactive_operands.add(node.name)
+            return self._condition_result(node.name)
+        if node.op == "not":
+            return not self._evaluate_expression(node.operands[0])
+        operands = sorted(node.operands, key=self._expression_cost)
+        # AND stops at the first False operand, OR at the first True one
+        decisive = node.op == "or"
+        for index, operand in enumerate(operands):
+            if self._evaluate_expression(operand) == decisive:
+                for skipped in operands[index + 1:]:
+                    self._round_short_circuited |= self._operand_conditions(skipped)
+                return decisive
+        return not decisive
+    
+    def _operand_conditions(self, node):
+        """Names of the conditions an expression node would evaluate, through nested Expression conditions."""
+        names = set()
+        pending = list(node.references())
+        while pending:
+            name = pending.pop()
+            if name in names:
                 continue
-            else:
-                print(f"  ▶️ Evaluating condition: {condition_name}")
-                try:
-                    # Evaluate based on condition type
-                    if condition_type == "Alway TRUE":
-                        results[condition_name], value = (True, self.optimization_round)
-                    elif condition_type == "Max Dose":
-                        results[condition_name], value = self._check_max_dose(roi_name, criteria)
-                    elif condition_type == "Min Dose":
-                        results[condition_name], value = self._check_min_dose(roi_name, criteria)
-                    elif condition_type == "Max Dmean" or condition_type == "Min Dmean":
-                        results[condition_name], value = self._check_dmean(roi_name, criteria)
-                    elif condition_type == "Max DaV" or condition_type == "Min DaV":
-                        results[condition_name], value = self._check_dav(roi_name, criteria)
-                    elif condition_type == "Min VaD" or condition_type == "Max VaD":
-                        results[condition_name], value = self._check_vad(roi_name, criteria)
-                    else:
-                        print(f"Warning: Unknown condition type '{condition_type}' for condition '{condition_name}'")
-                        results[condition_name] = False
+            names.add(name)
+            condition = self._conditions_by_name[name]
+            if condition.metric == "expression":
+                pending.extend(condition.expression.references())
+        return names
+    
+    def _expression_cost(self, node):
+        """Estimated number of API calls needed to evaluate an expression node in this round."""
+        if node.op != "ref":
+            return sum(self._expression_cost(operand) for operand in node.operands)
+        if node.name in self._round_results:
+            return 0
+        condition = self._conditions_by_name[node.name]
+        if not condition.is_active(self.optimization_round):
+            return 0
+        if condition.metric == "expression":
+            return self._expression_cost(condition.expression)
+        roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+        cache_key = {
+            "max": (roi_name, "DoseStatistic", "Max"),
+            "min": (roi_name, "DoseStatistic", "Min"),
+            "mean": (roi_name, "DoseStatistic", "Average"),
+            "vad": (roi_name, "RelativeVolumeAtDose", condition.dose)
+        }.get(condition.metric)
+        if condition.metric == "dav" and condition.volume_unit == '%':
+            cache_key = (roi_name, "DoseAtRelativeVolume", condition.volume / 100.0)
+        if condition.metric == "always" or cache_key in self._dose_cache:
+            return 0
+        return self.METRIC_COSTS.get(condition.metric, 1)
+    
+    def _prefetch_dvh(self, conditions):
+        """
+        Collect the DaV relative volumes and VaD dose levels of all conditions per ROI,
+        then fetch them with one GetDoseAtRelativeVolumes and one GetRelativeVolumeAtDoseValues call per ROI.
+        Results are stored in the dose statistics cache under the same keys the single-value lookups use.
+        """
+        if not self.dose or self.evaluator in ("numpy", "curve"):
+            return
+        
+        relative_volumes = {}  # roi -> [relative volume, ...]
+        dose_values = {}  # roi -> [dose value, ...]
+        for condition in conditions:
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+            try:
+                if condition.metric == "dav":
+                    relative_volume = self._relative_volume(condition, actual_roi_name)
+                    if relative_volume is None:
                         continue
-                    
-                    # Print result for all condition types
-                    if results[condition_name]:
-                        print(f"    ✅ Condition MET: {condition_name} - Value: {value:.2f} ({criteria})")
-                    else:
-                        print(f"    ❌ Condition NOT met: {condition_name} - Value: {value:.2f} ({criteria})")
-                        
-                except Exception as e:
-                    print(f"  ⚠️ Error evaluating condition '{condition_name}': {str(e)}")
-                    results[condition_name] = False
+                    if (actual_roi_name, "DoseAtRelativeVolume", relative_volume) not in self._dose_cache:
+                        relative_volumes.setdefault(actual_roi_name, []).append(relative_volume)
+                elif condition.metric == "vad":
+                    if (actual_roi_name, "RelativeVolumeAtDose", condition.dose) not in self._dose_cache:
+                        dose_values.setdefault(actual_roi_name, []).append(condition.dose)
+            except Exception:
+                # The condition itself reports the error when it is evaluated
+                continue
         
-        return results
+        for roi_name, volumes in relative_volumes.items():
+            volumes = list(dict.fromkeys(volumes))
+            try:
+                with self.tracer.span("GetDoseAtRelativeVolumes", "api", roi=roi_name, values=len(volumes)):
+                    doses = self.dose.GetDoseAtRelativeVolumes(RoiName=roi_name, RelativeVolumes=volumes)
+                self.round_batched_calls += 1
+                for volume, dose in zip(volumes, doses):
+                    self._dose_cache[(roi_name, "DoseAtRelativeVolume", volume)] = dose
+                if self.engine is not None:
+                    engine_doses = self._engine_for(roi_name).dose_at_relative_volumes(roi_name, volumes)
+                    for volume, dose, engine_dose in zip(volumes, doses, engine_doses):
+                        self._verify(f"D{volume * 100:.4g}% {roi_name}", dose, lambda: engine_dose)
+            except Exception as e:
+                print(f"  Warning: Batched DaV query failed for {roi_name}: {str(e)}")
+        
+        for roi_name, doses in dose_values.items():
+            doses = list(dict.fromkeys(doses))
+            try:
+                with self.tracer.span("GetRelativeVolumeAtDoseValues", "api", roi=roi_name, values=len(doses)):
+                    volumes = self.dose.GetRelativeVolumeAtDoseValues(RoiName=roi_name, DoseValues=doses)
+                self.round_batched_calls += 1
+                for dose, volume in zip(doses, volumes):
+                    self._dose_cache[(roi_name, "RelativeVolumeAtDose", dose)] = volume
+                if self.engine is not None:
+                    engine_volumes = self._engine_for(roi_name).relative_volumes_at_doses(roi_name, doses)
+                    for dose, volume, engine_volume in zip(doses, volumes, engine_volumes):
+                        self._verify(f"V{dose:.4g}cGy {roi_name}", volume, lambda: engine_volume, abs_tolerance=0.005)
+            except Exception as e:
+                print(f"  Warning: Batched VaD query failed for {roi_name}: {str(e)}")
+    
+    def _relative_volume(self, condition, actual_roi_name):
+        """
+        Relative volume (0-1) of a DaV condition.
+        
+        Returns:
+            Relative volume, or None if the ROI has zero volume
+        """
+        if condition.volume_unit == '%':
+            return condition.volume / 100.0
+        # Absolute volume (cc) - need to convert to relative
+        total_volume = self._get_roi_volume(actual_roi_name)
+        if total_volume <= 0:
+            return None
+        return condition.volume / total_volume
+    
+    def _get_structure_set(self):
+        """Structure set of the selected examination (first structure set if no examination was given)."""
+        if self.examination is not None:
+            return self.case.PatientModel.StructureSets[self.examination.Name]
+        return self.case.PatientModel.StructureSets[0]
+    
+    def _get_roi_volume(self, roi_name):
+        """Volume of a ROI in cc, cached per structure set until the ROI geometry is rewritten."""
+        key = (self.examination.Name if self.examination is not None else None, roi_name)
+        if key in self._roi_volume_cache:
+            self._count("volume_hits")
+            return self._roi_volume_cache[key]
+        
+        def api_volume():
+            with self.tracer.span("GetRoiVolume", "api", roi=roi_name):
+                return self._get_structure_set().RoiGeometries[roi_name].GetRoiVolume()
+        
+        with self._key_lock(("volume",) + key):
+            if key in self._roi_volume_cache:
+                self._count("volume_hits")
+                return self._roi_volume_cache[key]
+            volume = self._evaluate(f"Volume {roi_name}", api_volume,
+                                    lambda: self._engine_for(roi_name).roi_volume(roi_name), abs_tolerance=0.1)
+            self._count("volume_queries")
+            self._roi_volume_cache[key] = volume
+        return volume
+    
+    def margins(self):
+        """
+        Relative margin of every condition evaluated in the last check (condition name -> margin),
+        see CompiledCondition.margin(). Used by proportional function adjustments.
+        """
+        return {name: self._conditions_by_name[name].margin(value) for name, value in self.last_values.items()}
     
     def set_optimization_round(self, round_number):
         """Set the current optimization round number."""
         self.optimization_round = round_number
     
-    def _check_max_dose(self, roi_name, criteria):
+    def invalidate_dose_cache(self, roi_name=None):
+        """
+        Clear cached dose statistics.
+        
+        Args:
+            roi_name: Only clear entries of this (case) ROI, e.g. after its geometry changed.
+                      None clears everything, e.g. after a new optimization.
+        """
+        if roi_name is None:
+            self._dose_cache.clear()
+            self._engine_dose_loaded = False
+            self._dvh_curves.clear()
+        else:
+            for key in [key for key in self._dose_cache if key[0] == roi_name]:
+                del self._dose_cache[key]
+            self._dvh_curves.pop(roi_name, None)
+    
+    def roi_geometry_changed(self, roi_name):
+        """
+        Drop cached dose statistics and the cached volume of a ROI whose geometry was rewritten.
+        Registered as geometry listener of the ROI creators.
+        
+        Args:
+            roi_name: Case ROI name
+        """
+        self.invalidate_dose_cache(roi_name)
+        for key in [key for key in self._roi_volume_cache if key[1] == roi_name]:
+            del self._roi_volume_cache[key]
+        if self.engine is not None:
+            self.engine.remove_roi(roi_name)
+    
+    def cache_summary(self):
+        """Return a one-line summary of dose statistics and ROI volume cache hits and misses."""
+        summary = (f"{self.cache_hits} hits, {self.cache_misses} misses "
+                   f"(ROI volumes: {self.volume_hits} hits, {self.volume_queries} queries) [evaluator: {self.evaluator}]")
+        if self.evaluator == "verify":
+            summary += f" - {self.verify_mismatches} mismatches in {self.verify_checks} checks"
+        if self.evaluator == "curve":
+            curves = [curve for curves in self.dvh_curve_history.values() for curve in curves.values()]
+            summary += f" - {len(curves)} DVH curves, {sum(curve.nbytes for curve in curves) / 1024:.1f} kB"
+        return summary
+    
+    def _curve_for(self, roi_name):
+        """
+        Cumulative DVH curve of a ROI for the current dose, built with one
+        GetRelativeVolumeAtDoseValues call on dvh_bins doses from 0 to Dmax.
+        """
+        curve = self._dvh_curves.get(roi_name)
+        if curve is not None:
+            return curve
+        with self._key_lock(("curve", roi_name)):
+            curve = self._dvh_curves.get(roi_name)
+            if curve is None:
+                dose_max = self._get_dose_statistic(roi_name, 'Max')
+                doses = DvhCurve.sample_doses(dose_max, self.dvh_bins)
+                with self.tracer.span("GetRelativeVolumeAtDoseValues", "api", roi=roi_name, values=len(doses)):
+                    volumes = self.dose.GetRelativeVolumeAtDoseValues(RoiName=roi_name, DoseValues=doses)
+                self._count("round_batched_calls")
+                curve = DvhCurve(roi_name, dose_max, volumes)
+                self._dvh_curves[roi_name] = curve
+                self.dvh_curve_history.setdefault(self.optimization_round, {})[roi_name] = curve
+        return curve
+    
+    def _engine_for(self, roi_name):
+        """Return the DVH engine with the current dose grid and the ROI mask loaded."""
+        if not self._engine_dose_loaded:
+            with self._key_lock(("engine",)):
+                if not self._engine_dose_loaded:
+                    with self.tracer.span("DoseValues.DoseData", "api"):
+                        self.engine.set_dose(read_dose_grid(self.dose))
+                    self._engine_dose_loaded = True
+        if not self.engine.has_roi(roi_name):
+            with self._key_lock(("engine", roi_name)):
+                if not self.engine.has_roi(roi_name):
+                    with self.tracer.span("GetDoseGridRoi", "api", roi=roi_name):
+                        self.engine.set_roi(roi_name, *read_roi_mask(self.dose, roi_name))
+        return self.engine
+    
+    def _evaluate(self, label, api_fetch, engine_fetch, abs_tolerance=1.0, rel_tolerance=0.01):
+        """
+        Get a metric value from the configured evaluator.
+        In "verify" mode the API value is returned and compared with the engine value.
+        
+        Args:
+            label: Metric label for mismatch warnings
+            api_fetch: Callable returning the value from the RayStation API
+            engine_fetch: Callable returning the value from the DVH engine
+            abs_tolerance: Allowed absolute difference in verify mode
+            rel_tolerance: Allowed relative difference in verify mode
+        """
+        if self.engine is None:
+            return api_fetch()
+        if self.evaluator == "numpy":
+            with self.tracer.span(label, "engine"):
+                return engine_fetch()
+        
+        api_value = api_fetch()
+        self._verify(label, api_value, engine_fetch, abs_tolerance, rel_tolerance)
+        return api_value
+    
+    def _verify(self, label, api_value, engine_fetch, abs_tolerance=1.0, rel_tolerance=0.01):
+        """Compare an API value with the DVH engine value and warn on a mismatch."""
+        try:
+            engine_value = engine_fetch()
+        except Exception as e:
+            print(f"    ⚠️ NumPy evaluator failed for {label}: {str(e)}")
+            return
+        self._count("verify_checks")
+        difference = abs(engine_value - api_value)
+        if difference > abs_tolerance and difference > rel_tolerance * abs(api_value):
+            self._count("verify_mismatches")
+            print(f"    ⚠️ Verify mismatch {label}: API {api_value:.3f}, NumPy {engine_value:.3f}")
+    
+    def _key_lock(self, key):
+        """Lock of one cache key (dict.setdefault is atomic, so all threads get the same lock)."""
+        return self._key_locks.setdefault(key, threading.Lock())
+    
+    def _count(self, *counters):
+        """Increment cache counters (conditions may be evaluated in worker threads)."""
+        with self._counter_lock:
+            for counter in counters:
+                setattr(self, counter, getattr(self, counter) + 1)
+    
+    def _cached(self, key, fetch):
+        """Return the cached value for key, calling fetch() on a miss."""
+        if key in self._dose_cache:
+            self._count("cache_hits", "round_cache_hits")
+            return self._dose_cache[key]
+        # Concurrent conditions asking for the same value wait for a single fetch
+        with self._key_lock(("dose",) + key):
+            if key in self._dose_cache:
+                self._count("cache_hits", "round_cache_hits")
+                return self._dose_cache[key]
+            self._count("cache_misses", "round_cache_misses")
+            value = fetch()
+            self._dose_cache[key] = value
+        return value
+    
+    def _get_dose_statistic(self, roi_name, dose_type):
+        """GetDoseStatistic through the cache (dose_type: 'Max', 'Min' or 'Average')."""
+        def api_fetch():
+            with self.tracer.span("GetDoseStatistic", "api", roi=roi_name, dose_type=dose_type):
+                return self.dose.GetDoseStatistic(RoiName=roi_name, DoseType=dose_type)
+        
+        def engine_fetch():
+            engine = self._engine_for(roi_name)
+            if dose_type == 'Max':
+                return engine.dmax(roi_name)
+            if dose_type == 'Min':
+                return engine.dmin(roi_name)
+            return engine.dmean(roi_name)
+        
+        if self.evaluator == "curve" and dose_type == 'Average':
+            fetch = lambda: self._curve_for(roi_name).dmean()
+        else:
+            fetch = lambda: self._evaluate(f"{dose_type} {roi_name}", api_fetch, engine_fetch)
+        return self._cached((roi_name, "DoseStatistic", dose_type), fetch)
+    
+    def _get_dose_at_relative_volume(self, roi_name, relative_volume):
+        """GetDoseAtRelativeVolumes for a single relative volume, through the cache."""
+        def api_fetch():
+            with self.tracer.span("GetDoseAtRelativeVolumes", "api", roi=roi_name):
+                return self.dose.GetDoseAtRelativeVolumes(RoiName=roi_name, RelativeVolumes=[relative_volume])[0]
+        
+        def engine_fetch():
+            return self._engine_for(roi_name).dose_at_relative_volumes(roi_name, [relative_volume])[0]
+        
+        if self.evaluator == "curve":
+            fetch = lambda: self._curve_for(roi_name).dose_at_relative_volume(relative_volume)
+        else:
+            fetch = lambda: self._evaluate(f"D{relative_volume * 100:.4g}% {roi_name}", api_fetch, engine_fetch)
+        return self._cached((roi_name, "DoseAtRelativeVolume", relative_volume), fetch)
+    
+    def _get_relative_volume_at_dose(self, roi_name, dose_value):
+        """GetRelativeVolumeAtDoseValues for a single dose value, through the cache."""
+        def api_fetch():
+            with self.tracer.span("GetRelativeVolumeAtDoseValues", "api", roi=roi_name):
+                return self.dose.GetRelativeVolumeAtDoseValues(RoiName=roi_name, DoseValues=[dose_value])[0]
+        
+        def engine_fetch():
+            return self._engine_for(roi_name).relative_volumes_at_doses(roi_name, [dose_value])[0]
+        
+        if self.evaluator == "curve":
+            fetch = lambda: self._curve_for(roi_name).relative_volume_at_dose(dose_value)
+        else:
+            fetch = lambda: self._evaluate(f"V{dose_value:.4g}cGy {roi_name}", api_fetch, engine_fetch, abs_tolerance=0.005)
+        return self._cached((roi_name, "RelativeVolumeAtDose", dose_value), fetch)
+    
+    def _check_max_dose(self, condition):
         """
         Check if max dose to ROI meets criteria.
-        Criteria format: "Max Dose (cGy) ≥ 5000" or "Max Dose (cGy) ≤ 5000"
-        Returns: (bool, float) - (condition_met, max_dose_value)
+        Criteria format: "Dmax (cGy) ≥ 5000" or "Dmax (cGy) ≤ 5000"
+        Returns: (bool, float) - (condition_met, max_dose_value), value is None on errors
         """
         if not self.dose:
-            print(f"Cannot check Max Dose for {roi_name}: No dose distribution available")
-            return (False, 0.0)
+            print(f"Cannot check Max Dose for {condition.roi}: No dose distribution available")
+            return (False, None)
         
         try:
             # Get actual ROI name from matched dictionary
-            actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
-            
-            # Extract threshold and operator from criteria
-            match = re.search(r'([≥≤><=]+)\s*(\d+\.?\d*)', criteria)
-            if not match:
-                print(f"Could not parse Max Dose criteria: {criteria}")
-                return (False, 0.0)
-            
-            operator = match.group(1)
-            threshold = float(match.group(2))
-            
-            # Get max dose from RayStation
-            max_dose_value = self.dose.GetDoseStatistic(RoiName=actual_roi_name, DoseType='Max')
-            
-            # Compare based on operator
-            if '≥' in  operator:
-                return (max_dose_value >= threshold, max_dose_value)
-            elif '≤' in operator:
-                return (max_dose_value <= threshold, max_dose_value)
-            else:
-                return (False, max_dose_value)
-                
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+            max_dose_value = self._get_dose_statistic(actual_roi_name, 'Max')
+            return (condition.evaluate(max_dose_value, self._previous_results.get(condition.name)), max_dose_value)
         except Exception as e:
-            print(f"Error checking Max Dose for {roi_name}: {str(e)}")
-            return (False, 0.0)
+            print(f"Error checking Max Dose for {condition.roi}: {str(e)}")
+            return (False, None)
     
-    def _check_min_dose(self, roi_name, criteria):
+    def _check_min_dose(self, condition):
         """
         Check if min dose to ROI meets criteria.
-        Returns: (bool, float) - (condition_met, min_dose_value)
+        Returns: (bool, float) - (condition_met, min_dose_value), value is None on errors
         """
         if not self.dose:
-            print(f"Cannot check Min Dose for {roi_name}: No dose distribution available")
-            return (False, 0.0)
+            print(f"Cannot check Min Dose for {condition.roi}: No dose distribution available")
+            return (False, None)
         
         try:
             # Get actual ROI name from matched dictionary
-            actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
-            
-            # Extract threshold and operator from criteria
-            match = re.search(r'([≥≤><=]+)\s*(\d+\.?\d*)', criteria)
-            if not match:
-                print(f"Could not parse Min Dose criteria: {criteria}")
-                return (False, 0.0)
-            
-            operator = match.group(1)
-            threshold = float(match.group(2))
-            
-            # Get min dose from RayStation
-            # PLACEHOLDER: Need to verify exact RayStation API
-            min_dose_value = self.dose.GetDoseStatistic(RoiName=actual_roi_name, DoseType='Min')
-            # Compare based on operator
-            if '≥' in operator:
-                return (min_dose_value >= threshold, min_dose_value)
-            elif '≤' in operator:
-                return (min_dose_value <= threshold, min_dose_value)
-            else:
-                return (False, min_dose_value)
-                
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+            min_dose_value = self._get_dose_statistic(actual_roi_name, 'Min')
+            return (condition.evaluate(min_dose_value, self._previous_results.get(condition.name)), min_dose_value)
         except Exception as e:
-            print(f"Error checking Min Dose for {roi_name}: {str(e)}")
-            return (False, 0.0)
+            print(f"Error checking Min Dose for {condition.roi}: {str(e)}")
+            return (False, None)
     
-    def _check_dmean(self, roi_name, criteria):
+    def _check_dmean(self, condition):
         """
         Check if mean dose to ROI meets criteria.
-        Returns: (bool, float) - (condition_met, mean_dose_value)
+        Returns: (bool, float) - (condition_met, mean_dose_value), value is None on errors
         """
         if not self.dose:
-            print(f"Cannot check Dmean for {roi_name}: No dose distribution available")
-            return (False, 0.0)
+            print(f"Cannot check Dmean for {condition.roi}: No dose distribution available")
+            return (False, None)
         
         try:
             # Get actual ROI name from matched dictionary
-            actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
-            
-            # Extract threshold and operator from criteria
-            match = re.search(r'([≥≤><=]+)\s*(\d+\.?\d*)', criteria)
-            if not match:
-                print(f"Could not parse Dmean criteria: {criteria}")
-                return (False, 0.0)
-            
-            operator = match.group(1)
-            threshold = float(match.group(2))
-            
-            # Get mean dose from RayStation
-            mean_dose_value = self.dose.GetDoseStatistic(RoiName=actual_roi_name, DoseType='Average')
-            
-            # Compare based on operator
-            if '≥' in operator:
-                return (mean_dose_value >= threshold, mean_dose_value)
-            elif '≤' in operator:
-                return (mean_dose_value <= threshold, mean_dose_value)
-            else:
-                return (False, mean_dose_value)
-                
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+            mean_dose_value = self._get_dose_statistic(actual_roi_name, 'Average')
+            return (condition.evaluate(mean_dose_value, self._previous_results.get(condition.name)), mean_dose_value)
         except Exception as e:
-            print(f"Error checking Dmean for {roi_name}: {str(e)}")
-            return (False, 0.0)
+            print(f"Error checking Dmean for {condition.roi}: {str(e)}")
+            return (False, None)
     
-    def _check_dav(self, roi_name, criteria):
+    def _check_dav(self, condition):
         """
         Check if dose at volume (DaV) meets criteria.
         Criteria format: "D95% ≥ 3900 cGy" or "D10cc ≤ 2000 cGy"
-        Returns: (bool, float) - (condition_met, actual_dose_at_volume)
+        Returns: (bool, float) - (condition_met, actual_dose_at_volume), value is None on errors
         """
         if not self.dose:
-            print(f"Cannot check DaV for {roi_name}: No dose distribution available")
-            return (False, 0.0)
+            print(f"Cannot check DaV for {condition.roi}: No dose distribution available")
+            return (False, None)
         
         try:
             # Get actual ROI name from matched dictionary
-            actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
-            
-            # Extract volume, unit, operator, and dose from criteria
-            # Format: "D{volume}{unit} {operator} {dose} cGy"
-            # Example: "D95% ≥ 3900 cGy" or "D10cc ≤ 2000 cGy"
-            pattern = r'D\s*(\d+\.?\d*)\s*(cc|%)\s*([≥≤><=]+)\s*(\d+\.?\d*)\s*cGy'
-            match = re.search(pattern, criteria, re.IGNORECASE)
-            
-            if not match:
-                print(f"Could not parse DaV criteria: {criteria}")
-                return (False, 0.0)
-            
-            volume_value = float(match.group(1))
-            volume_unit = match.group(2)
-            operator = match.group(3)
-            dose_threshold = float(match.group(4))
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
+            relative_volume = self._relative_volume(condition, actual_roi_name)
+            if relative_volume is None:
+                print(f"Warning: ROI {actual_roi_name} has zero volume")
+                return (False, None)
             
             # Get dose at specified volume from RayStation DVH
-            if volume_unit == '%':
-                # Relative volume (percentage)
-                relative_volume = volume_value / 100.0
-                dose_at_volume_array = self.dose.GetDoseAtRelativeVolumes(
-                    RoiName=actual_roi_name, 
-                    RelativeVolumes=[relative_volume]
-                )
-                actual_dose = dose_at_volume_array[0]
-            else:
-                # Absolute volume (cc) - need to convert to relative
-                roi_geometry = self.case.PatientModel.StructureSets[0].RoiGeometries[actual_roi_name]
-                total_volume = roi_geometry.GetRoiVolume()
-                if total_volume > 0:
-                    relative_volume = volume_value / total_volume
-                    dose_at_volume_array = self.dose.GetDoseAtRelativeVolumes(
-                        RoiName=actual_roi_name, 
-                        RelativeVolumes=[relative_volume]
-                    )
-                    actual_dose = dose_at_volume_array[0]
-                else:
-                    print(f"Warning: ROI {actual_roi_name} has zero volume")
-                    return (False, 0.0)
-            
-            # Compare based on operator
-            if '≥' in operator:
-                return (actual_dose >= dose_threshold, actual_dose)
-            elif '≤' in operator:
-                return (actual_dose <= dose_threshold, actual_dose)
-            else:
-                return (False, actual_dose)
+            actual_dose = self._get_dose_at_relative_volume(actual_roi_name, relative_volume)
+            return (condition.evaluate(actual_dose, self._previous_results.get(condition.name)), actual_dose)
         except Exception as e:
-            print(f"Error checking DaV for {roi_name}: {str(e)}")
-            return (False, 0.0)
+            print(f"Error checking DaV for {condition.roi}: {str(e)}")
+            return (False, None)
     
-    def _check_vad(self, roi_name, criteria):
+    def _check_vad(self, condition):
         """
         Check if volume at dose (VaD) meets criteria.
-        Criteria format: "V3900cGy ≥ 95%" or "V3900cGy ≥ 10cc" or "V2000cGy ≤ 20cc" or "V2000cGy ≤ 50%"
-        Returns: (bool, float) - (condition_met, actual_volume_at_dose)
+        Criteria format: "V3900 cGy ≥ 95%" or "V3900 cGy ≥ 10cc" or "V2000 cGy ≤ 20cc" or "V2000 cGy ≤ 50%"
+        Returns: (bool, float) - (condition_met, actual_volume_at_dose), value is None on errors
         """
         if not self.dose:
-            print(f"Cannot check VaD for {roi_name}: No dose distribution available")
-            return (False, 0.0)
+            print(f"Cannot check VaD for {condition.roi}: No dose distribution available")
+            return (False, None)
         
         try:
             # Get actual ROI name from matched dictionary
-            actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
-            
-            # Extract dose, operator, volume threshold, and unit from criteria
-            # Format: "V{dose}cGy {operator} {volume}{unit}"
-            # Example: "V3900cGy ≥ 95%" or "V3900cGy ≥ 10cc" or "V2000cGy ≤ 20cc" or "V2000cGy ≤ 50%"
-            pattern = r'V\s*(\d+\.?\d*)\s*cGy\s*([≥≤><=]+)\s*(\d+\.?\d*)\s*(cc|%)'
-            match = re.search(pattern, criteria, re.IGNORECASE)
-            
-            if not match:
-                print(f"Could not parse VaD criteria: {criteria}")
-                return (False, 0.0)
-            
-            dose_level = float(match.group(1))
-            operator = match.group(2)
-            volume_threshold = float(match.group(3))
-            volume_unit = match.group(4)
+            actual_roi_name = self.matched_roi_dict.get(condition.roi, condition.roi)
             
             # Get volume receiving specified dose from RayStation DVH
-            relative_volume_array = self.dose.GetRelativeVolumeAtDoseValues(
-                RoiName=actual_roi_name, 
-                DoseValues=[dose_level]
-            )
-            relative_volume = relative_volume_array[0]
+            relative_volume = self._get_relative_volume_at_dose(actual_roi_name, condition.dose)
             
-            if volume_unit == '%':
+            if condition.volume_unit == '%':
                 # Return as percentage
                 actual_volume = relative_volume * 100.0
             else:
                 # Convert to absolute volume (cc)
-                roi_geometry = self.case.PatientModel.StructureSets[0].RoiGeometries[actual_roi_name]
-                total_volume = roi_geometry.GetRoiVolume()
-                actual_volume = relative_volume * total_volume
-            
-            # Compare based on operator
-            if '≥' in operator:
-                return (actual_volume >= volume_threshold, actual_volume)
-            elif '≤' in operator:
-                return (actual_volume <= volume_threshold, actual_volume)
-            else:
-                return (False, actual_volume)
-                
+                actual_volume = relative_volume * self._get_roi_volume(actual_roi_name)
+            return (condition.evaluate(actual_volume, self._previous_results.get(condition.name)), actual_volume)
         except Exception as e:
-            print(f"Error checking VaD for {roi_name}: {str(e)}")
-            return (False, 0.0)
\ No newline at end of file
+            print(f"Error checking VaD for {condition.roi}: {str(e)}")
+            return (False, None)
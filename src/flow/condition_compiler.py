@@ -0,0 +1,399 @@
+import operator
+import re
+
+
+# Comparison operators allowed in criteria and active rounds
+CRITERIA_OPERATORS = {
+    "≥": operator.ge,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "≤": operator.le,
+    "<=": operator.le,
+    "<": operator.lt
+}
+# Operators that are met by values above the threshold (the others by values below)
+_ABOVE_OPERATORS = ("≥", ">=", ">")
+ROUND_OPERATORS = {
+    "≥": operator.ge,
+    ">": operator.gt,
+    "=": operator.eq,
+    "<": operator.lt,
+    "≤": operator.le
+}
+
+# Condition type -> metric kind
+CONDITION_METRICS = {
+    "Alway TRUE": "always",
+    "Max Dose": "max",
+    "Min Dose": "min",
+    "Max Dmean": "mean",
+    "Min Dmean": "mean",
+    "Max DaV": "dav",
+    "Min DaV": "dav",
+    "Max VaD": "vad",
+    "Min VaD": "vad",
+    "Expression": "expression"
+}
+
+# Expression keywords: "PTV_D95_low AND (Heart_Dmean_high OR NOT Lung_V20_high)"
+EXPRESSION_KEYWORDS = ("AND", "OR", "NOT")
+_EXPRESSION_TOKEN = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))', re.DOTALL)
+# Condition names that can be written in an expression without quotes
+_PLAIN_NAME = re.compile(r'[^\s()"]+')
+
+_NUMBER = r'(\d+\.?\d*)'
+_OPERATOR = r'(' + '|'.join(map(re.escape, sorted(CRITERIA_OPERATORS, key=len, reverse=True))) + r')'
+# "Dmax (cGy) ≥ 5000", "Dmin (cGy) ≤ 3900", "Dmean (cGy) ≤ 1500"
+_STATISTIC_PATTERN = re.compile(_OPERATOR + r'\s*' + _NUMBER + r'\s*$')
+# "D95% ≥ 3900 cGy", "D10cc ≤ 2000 cGy"
+_DAV_PATTERN = re.compile(r'D\s*' + _NUMBER + r'\s*(cc|%)\s*' + _OPERATOR + r'\s*' + _NUMBER + r'\s*cGy', re.IGNORECASE)
+# "V3900 cGy ≥ 95%", "V2000cGy ≤ 20cc"
+_VAD_PATTERN = re.compile(r'V\s*' + _NUMBER + r'\s*cGy\s*' + _OPERATOR + r'\s*' + _NUMBER + r'\s*(cc|%)', re.IGNORECASE)
+
+
+class ConditionExpression:
+    """
+    Node of a compiled condition expression.
+    op is "ref" (name of another condition), "not" (one operand), "and" or "or" (two or more operands).
+    """
+
+    __slots__ = ("op", "operands", "name")
+
+    def __init__(self, op, operands=(), name=None):
+        self.op = op
+        self.operands = list(operands)
+        self.name = name
+
+    def references(self):
+        """Names of all conditions referenced in this expression."""
+        if self.op == "ref":
+            return {self.name}
+        names = set()
+        for operand in self.operands:
+            names |= operand.references()
+        return names
+
+    def __repr__(self):
+        if self.op == "ref":
+            return self.name
+        if self.op == "not":
+            return f"NOT {self.operands[0]!r}"
+        return "(" + f" {self.op.upper()} ".join(repr(operand) for operand in self.operands) + ")"
+
+
+def quote_condition_name(name):
+    """
+    Write a condition name as an expression operand. Names that are not a plain word
+    (whitespace, parentheses, quotes, or an AND/OR/NOT keyword) are quoted,
+    with embedded quotes and backslashes escaped.
+
+    Args:
+        name: Condition name
+
+    Returns:
+        Text that parse_expression() reads back as a reference to name
+    """
+    if _PLAIN_NAME.fullmatch(name) and name.upper() not in EXPRESSION_KEYWORDS:
+        return name
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def parse_expression(text):
+    """
+    Parse a condition expression. AND binds tighter than OR; condition names with spaces,
+    parentheses or quotes are quoted (see quote_condition_name()), with \\" and \\\\ as escapes.
+
+    Args:
+        text: Expression like 'A AND (B OR NOT "C d")'
+
+    Returns:
+        ConditionExpression
+
+    Raises:
+        ValueError: If the expression is empty or malformed
+    """
+    tokens = []
+    position = 0
+    text = text or ""
+    while position < len(text.rstrip()):
+        match = _EXPRESSION_TOKEN.match(text, position)
+        if not match:
+            raise ValueError(f"unexpected character at position {position + 1}")
+        open_paren, close_paren, quoted, word = match.groups()
+        if open_paren or close_paren:
+            tokens.append(open_paren or close_paren)
+        elif quoted is not None:
+            tokens.append(("name", re.sub(r'\\(.)', r'\1', quoted, flags=re.DOTALL)))
+        elif word.upper() in EXPRESSION_KEYWORDS:
+            tokens.append(word.upper())
+        else:
+            tokens.append(("name", word))
+        position = match.end()
+    if not tokens:
+        raise ValueError("empty expression")
+
+    index = 0
+
+    def peek():
+        return tokens[index] if index < len(tokens) else None
+
+    def take():
+        nonlocal index
+        index += 1
+        return tokens[index - 1]
+
+    def parse_binary(op, parse_operand):
+        operands = [parse_operand()]
+        while peek() == op.upper():
+            take()
+            operands.append(parse_operand())
+        return operands[0] if len(operands) == 1 else ConditionExpression(op, operands)
+
+    def parse_or():
+        return parse_binary("or", parse_and)
+
+    def parse_and():
+        return parse_binary("and", parse_not)
+
+    def parse_not():
+        token = peek()
+        if token == "NOT":
+            take()
+            return ConditionExpression("not", [parse_not()])
+        if token == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("missing ')'")
+            take()
+            return node
+        if isinstance(token, tuple):
+            take()
+            return ConditionExpression("ref", name=token[1])
+        raise ValueError(f"expected a condition name, found '{token or 'end of expression'}'")
+
+    node = parse_or()
+    if index != len(tokens):
+        raise ValueError(f"unexpected '{tokens[index] if isinstance(tokens[index], str) else tokens[index][1]}'")
+    return node
+
+
+class CompiledCondition:
+    """
+    A check condition parsed once at flow load.
+    metric is one of "always", "max", "min", "mean", "dav", "vad" and "expression".
+    For "dav", volume/volume_unit give the DVH point and threshold is a dose (cGy);
+    for "vad", dose gives the DVH point and threshold is a volume in volume_unit;
+    for "expression", expression is the ConditionExpression over other conditions.
+    tolerance is a band (metric units) on the not-met side of the threshold: values inside it count
+    as met, or with hysteresis keep the result of the previous evaluation.
+    """
+
+    __slots__ = ("name", "type", "roi", "criteria", "metric", "volume", "volume_unit", "dose",
+                 "op_symbol", "compare", "threshold", "round_symbol", "round_value", "expression",
+                 "tolerance", "hysteresis", "_round_compare")
+
+    def __init__(self, name, condition_type, roi, criteria, metric, round_symbol, round_value,
+                 op_symbol=None, threshold=None, volume=None, volume_unit=None, dose=None, expression=None,
+                 tolerance=0.0, hysteresis=False):
+        self.name = name
+        self.type = condition_type
+        self.roi = roi
+        self.criteria = criteria
+        self.metric = metric
+        self.volume = volume
+        self.volume_unit = volume_unit
+        self.dose = dose
+        self.op_symbol = op_symbol
+        self.compare = CRITERIA_OPERATORS.get(op_symbol)
+        self.threshold = threshold
+        self.round_symbol = round_symbol
+        self.round_value = round_value
+        self.expression = expression
+        self.tolerance = tolerance
+        self.hysteresis = hysteresis
+        self._round_compare = ROUND_OPERATORS[round_symbol]
+
+    def is_active(self, optimization_round):
+        """True if the condition is evaluated in this optimization round."""
+        return self._round_compare(optimization_round, self.round_value)
+
+    def evaluate(self, value, previously_met=None):
+        """
+        Compare a metric value with the threshold, applying the tolerance band.
+
+        Args:
+            value: Metric value
+            previously_met: Result of the previous evaluation (None if not evaluated before)
+        """
+        if self.compare(value, self.threshold):
+            return True
+        if self.tolerance <= 0:
+            return False
+        if self.op_symbol in _ABOVE_OPERATORS:
+            in_band = value >= self.threshold - self.tolerance
+        else:
+            in_band = value <= self.threshold + self.tolerance
+        if not in_band:
+            return False
+        # Inside the band: met as a tolerance, or unchanged with hysteresis
+        return bool(previously_met) if self.hysteresis else True
+
+    def margin(self, value):
+        """
+        How far a metric value is past the threshold on the met side, relative to the threshold
+        (e.g. Dmax 6300 cGy for "≥ 6000" -> 0.05). Negative on the not-met side; absolute if the
+        threshold is 0. None for conditions without a threshold.
+        """
+        if self.threshold is None or value is None:
+            return None
+        difference = value - self.threshold if self.op_symbol in _ABOVE_OPERATORS else self.threshold - value
+        return difference / abs(self.threshold) if self.threshold else difference
+
+    def __repr__(self):
+        return f"CompiledCondition({self.name!r}, {self.metric}, {self.roi!r}, {self.criteria!r})"
+
+
+def compile_condition(condition):
+    """
+    Compile one check condition dictionary from the flow JSON.
+
+    Args:
+        condition: Dictionary with name, type, roi, active_round and criteria
+
+    Returns:
+        CompiledCondition
+
+    Raises:
+        ValueError: If the type, active round or criteria cannot be parsed
+    """
+    name = condition.get("name", "")
+    condition_type = condition.get("type", "")
+    roi = condition.get("roi", "")
+    criteria = condition.get("criteria", "")
+
+    metric = CONDITION_METRICS.get(condition_type)
+    if metric is None:
+        raise ValueError(f"Condition '{name}': unknown condition type '{condition_type}'")
+
+    active_round = condition.get("active_round", "≥ 0").split()
+    if len(active_round) != 2 or active_round[0] not in ROUND_OPERATORS:
+        raise ValueError(f"Condition '{name}': invalid active round '{condition.get('active_round')}'")
+    try:
+        round_value = int(active_round[1])
+    except ValueError:
+        raise ValueError(f"Condition '{name}': invalid active round '{condition.get('active_round')}'")
+
+    try:
+        tolerance = float(condition.get("tolerance", 0) or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"Condition '{name}': invalid tolerance '{condition.get('tolerance')}'")
+    if tolerance < 0:
+        raise ValueError(f"Condition '{name}': tolerance must not be negative")
+
+    common = dict(name=name, condition_type=condition_type, roi=roi, criteria=criteria,
+                  metric=metric, round_symbol=active_round[0], round_value=round_value)
+    banded = dict(tolerance=tolerance, hysteresis=bool(condition.get("hysteresis", False)))
+
+    if metric == "always":
+        return CompiledCondition(**common)
+
+    if metric == "expression":
+        try:
+            expression = parse_expression(criteria)
+        except ValueError as e:
+            raise ValueError(f"Condition '{name}': invalid expression '{criteria}' ({str(e)})")
+        return CompiledCondition(expression=expression, **common)
+
+    if not roi:
+        raise ValueError(f"Condition '{name}': no ROI selected")
+
+    if metric == "dav":
+        match = _DAV_PATTERN.search(criteria)
+        if not match:
+            raise ValueError(f"Condition '{name}': could not parse DaV criteria '{criteria}'")
+        return CompiledCondition(volume=float(match.group(1)), volume_unit=match.group(2).lower(),
+                                 op_symbol=match.group(3), threshold=float(match.group(4)), **common, **banded)
+
+    if metric == "vad":
+        match = _VAD_PATTERN.search(criteria)
+        if not match:
+            raise ValueError(f"Condition '{name}': could not parse VaD criteria '{criteria}'")
+        return CompiledCondition(dose=float(match.group(1)), op_symbol=match.group(2),
+                                 threshold=float(match.group(3)), volume_unit=match.group(4).lower(), **common, **banded)
+
+    match = _STATISTIC_PATTERN.search(criteria)
+    if not match:
+        raise ValueError(f"Condition '{name}': could not parse {condition_type} criteria '{criteria}'")
+    return CompiledCondition(op_symbol=match.group(1), threshold=float(match.group(2)), **common, **banded)
+
+
+def compile_conditions(check_conditions_data):
+    """
+    Compile all check conditions of a flow.
+
+    Args:
+        check_conditions_data: List of condition dictionaries from flow JSON
+
+    Returns:
+        List of CompiledCondition in flow order
+
+    Raises:
+        ValueError: Listing every condition that could not be compiled
+    """
+    compiled = []
+    errors = []
+    names = set()
+    for condition in check_conditions_data or []:
+        try:
+            compiled_condition = compile_condition(condition)
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        if compiled_condition.name in names:
+            errors.append(f"Condition '{compiled_condition.name}': duplicate condition name")
+        names.add(compiled_condition.name)
+        compiled.append(compiled_condition)
+
+    errors.extend(_check_expression_references(compiled))
+    if errors:
+        raise ValueError("Invalid check conditions:\n" + "\n".join(errors))
+    return compiled
+
+
+def _check_expression_references(compiled):
+    """Errors for expressions that reference unknown conditions or themselves (directly or through others)."""
+    by_name = {condition.name: condition for condition in compiled}
+    errors = []
+    for condition in compiled:
+        if condition.metric != "expression":
+            continue
+        for name in sorted(condition.expression.references() - set(by_name)):
+            errors.append(f"Condition '{condition.name}': expression references unknown condition '{name}'")
+
+    def has_cycle(name, path):
+        condition = by_name.get(name)
+        if condition is None or condition.metric != "expression":
+            return False
+        if name in path:
+            return True
+        return any(has_cycle(reference, path | {name}) for reference in condition.expression.references())
+
+    for condition in compiled:
+        if condition.metric == "expression" and has_cycle(condition.name, set()):
+            errors.append(f"Condition '{condition.name}': expression refers back to itself")
+    return errors
+
+
+def referenced_conditions(*entry_lists):
+    """
+    Names of the conditions consumed downstream of the condition check.
+
+    Args:
+        entry_lists: Lists of flow entries with a "condition" key
+                     (condition_rois, function_adjustments)
+
+    Returns:
+        Set of condition names
+    """
+    return {entry.get("condition", "") for entries in entry_lists for entry in entries or [] if entry.get("condition")}
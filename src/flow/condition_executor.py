@@ -0,0 +1,124 @@
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SerialExecutor:
+    """Evaluate conditions one after another in the calling thread (default)."""
+
+    concurrent = False
+    workers = 1
+
+    def map(self, function, items):
+        """Call function for each item and return the results in item order."""
+        return [function(item) for item in items]
+
+    def shutdown(self):
+        pass
+
+
+class ThreadPoolConditionExecutor:
+    """
+    Evaluate conditions in a pool of worker threads.
+    Only for backends that allow concurrent read-only queries of the dose. Output printed by a task
+    is buffered and replayed after all tasks finished, in item order, so the log reads the same
+    as a serial run; results are also returned in item order.
+    """
+
+    concurrent = True
+
+    def __init__(self, workers=4):
+        """
+        Initialize the thread pool executor.
+
+        Args:
+            workers: Number of worker threads
+        """
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="condition")
+
+    def map(self, function, items):
+        """
+        Call function for each item in the worker threads.
+
+        Returns:
+            List of results in item order
+
+        Raises:
+            The first exception raised by a task (in item order), after all output is replayed
+        """
+        stdout = sys.stdout
+        buffered = _ThreadBufferedStream(stdout)
+        sys.stdout = buffered
+        try:
+            futures = [self._pool.submit(buffered.capture, function, item) for item in items]
+            outcomes = [future.result() for future in futures]
+        finally:
+            sys.stdout = stdout
+
+        results = []
+        error = None
+        for output, result, exception in outcomes:
+            if output:
+                stdout.write(output)
+            if exception is not None and error is None:
+                error = exception
+            results.append(result)
+        if error is not None:
+            raise error
+        return results
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        self._pool.shutdown(wait=True)
+
+
+class _ThreadBufferedStream:
+    """sys.stdout replacement that keeps the output of each captured task in its own buffer."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, function, item):
+        """Run function(item) with its output buffered. Returns (output, result, exception)."""
+        buffer = self._local.buffer = io.StringIO()
+        try:
+            result = function(item)
+        except Exception as e:
+            return (buffer.getvalue(), None, e)
+        finally:
+            self._local.buffer = None
+        return (buffer.getvalue(), result, None)
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self._stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def make_executor(workers=1):
+    """
+    Create the condition executor for a number of workers.
+
+    Args:
+        workers: 1 (or less) for serial evaluation, more for a thread pool
+
+    Returns:
+        SerialExecutor or ThreadPoolConditionExecutor
+    """
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        workers = 1
+    if workers <= 1:
+        return SerialExecutor()
+    return ThreadPoolConditionExecutor(workers)
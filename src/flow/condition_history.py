@@ -0,0 +1,130 @@
+import csv
+import json
+import math
+import struct
+import sys
+from array import array
+
+
+class ConditionHistory:
+    """
+    Columnar store of condition results, one row per evaluated condition per optimization round.
+    Each column is an array (round: int32, condition: uint16 index into names, value/threshold: float64
+    with NaN for "no value", met: int8), so a run with hundreds of rounds stays a few kB and exports
+    without per-row objects.
+    """
+
+    # Binary format: header, names JSON, then the columns in COLUMNS order
+    MAGIC = b"PFCH"
+    VERSION = 1
+    _HEADER = struct.Struct("<4sHBI I")  # magic, version, little endian flag, rows, names JSON length
+    COLUMNS = (("round", "i"), ("condition", "H"), ("value", "d"), ("threshold", "d"), ("met", "b"))
+
+    def __init__(self):
+        self.names = []  # condition names (index stored in the "condition" column)
+        self.criteria = []  # criteria text per condition name
+        self._index = {}
+        self.columns = {name: array(typecode) for name, typecode in self.COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["round"])
+
+    def _name_index(self, name, criteria=""):
+        index = self._index.get(name)
+        if index is None:
+            index = len(self.names)
+            self._index[name] = index
+            self.names.append(name)
+            self.criteria.append(criteria)
+        return index
+
+    def append(self, optimization_round, name, value, threshold, met, criteria=""):
+        """
+        Add one evaluated condition.
+
+        Args:
+            optimization_round: Loop round the condition was evaluated in
+            name: Condition name
+            value: Metric value (None for Alway TRUE and Expression conditions and after errors)
+            threshold: Criteria threshold (None if the condition has none)
+            met: Condition result
+            criteria: Criteria text, stored once per condition name
+        """
+        self.columns["round"].append(optimization_round)
+        self.columns["condition"].append(self._name_index(name, criteria))
+        self.columns["value"].append(math.nan if value is None else value)
+        self.columns["threshold"].append(math.nan if threshold is None else threshold)
+        self.columns["met"].append(1 if met else 0)
+
+    def rows(self):
+        """Yield (round, name, value, threshold, met) tuples; missing values are None."""
+        columns = self.columns
+        for i in range(len(self)):
+            value = columns["value"][i]
+            threshold = columns["threshold"][i]
+            yield (columns["round"][i], self.names[columns["condition"][i]],
+                   None if math.isnan(value) else value,
+                   None if math.isnan(threshold) else threshold,
+                   bool(columns["met"][i]))
+
+    def export_csv(self, path):
+        """
+        Write the history as CSV (round, condition, criteria, value, threshold, met).
+
+        Returns:
+            The path written
+        """
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["round", "condition", "criteria", "value", "threshold", "met"])
+            for optimization_round, name, value, threshold, met in self.rows():
+                writer.writerow([optimization_round, name, self.criteria[self._index[name]],
+                                 "" if value is None else f"{value:.6g}",
+                                 "" if threshold is None else f"{threshold:.6g}",
+                                 int(met)])
+        return path
+
+    def export_binary(self, path):
+        """
+        Write the history in the compact binary format (readable with load_binary()).
+
+        Returns:
+            The path written
+        """
+        names_json = json.dumps({"names": self.names, "criteria": self.criteria}, ensure_ascii=False).encode("utf-8")
+        with open(path, 'wb') as f:
+            f.write(self._HEADER.pack(self.MAGIC, self.VERSION, sys.byteorder == "little", len(self), len(names_json)))
+            f.write(names_json)
+            for name, _ in self.COLUMNS:
+                f.write(self.columns[name].tobytes())
+        return path
+
+    @classmethod
+    def load_binary(cls, path):
+        """
+        Read a history written by export_binary().
+
+        Raises:
+            ValueError: If the file is not a condition history
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, little_endian, rows, names_length = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path} is not a condition history file")
+
+        history = cls()
+        offset = cls._HEADER.size
+        names = json.loads(data[offset:offset + names_length].decode("utf-8"))
+        offset += names_length
+        for name, criteria in zip(names["names"], names["criteria"]):
+            history._name_index(name, criteria)
+        for name, typecode in cls.COLUMNS:
+            column = array(typecode)
+            size = column.itemsize * rows
+            column.frombytes(data[offset:offset + size])
+            if bool(little_endian) != (sys.byteorder == "little"):
+                column.byteswap()
+            history.columns[name] = column
+            offset += size
+        return history
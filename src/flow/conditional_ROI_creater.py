@@ -5,6 +5,7 @@ try:
     import raystation.v2025.typing as rstype
 except:
     from connect import *
+from src.flow.tracer import NULL_TRACER
 
 
 class ConditionalROICreator:
@@ -14,7 +15,7 @@ class ConditionalROICreator:
     Supports two methods: "Boolean operation" and "Convert Dose to ROI".
     """
     
-    def __init__(self, condition_rois_data, matched_roi_dict, case, examination, plan):
+    def __init__(self, condition_rois_data, matched_roi_dict, case, examination, plan, tracer=None):
         """
         Initialize the ConditionalROICreator.
         
@@ -24,12 +25,28 @@ class ConditionalROICreator:
             case: RayStation case object
             examination: RayStation examination object
             plan: RayStation plan object (for dose distribution)
+            tracer: Optional SpanTracer for per-ROI and API call timing
         """
         self.condition_rois_data = condition_rois_data
         self.matched_roi_dict = matched_roi_dict
         self.case = case
         self.examination = examination
         self.plan = plan
+        self.tracer = tracer or NULL_TRACER
+        self.geometry_listeners = []
+        
+    def add_geometry_listener(self, listener):
+        """
+        Register a callback that is called with the ROI name whenever a conditional ROI geometry is (re)created.
+        
+        Args:
+            listener: Callable taking the ROI name, e.g. ConditionChecker.roi_geometry_changed
+        """
+        self.geometry_listeners.append(listener)
+    
+    def _notify_geometry_changed(self, roi_name):
+        for listener in self.geometry_listeners:
+            listener(roi_name)
         
     def create_all_conditional_rois(self, met_condition):
         """
@@ -67,6 +84,7 @@ class ConditionalROICreator:
                 continue
             
             # Condition is met, create the ROI
+            roi_span = self.tracer.open(roi_name, "roi", method=method)
             try:
                 if method == "Boolean operation":
                     print(f"  [{order}] Creating '{roi_name}' via Boolean operation...", end=" ")
@@ -89,6 +107,8 @@ class ConditionalROICreator:
             except Exception as e:
                 print(f"✗ Error: {str(e)}")
                 skipped_count += 1
+            finally:
+                roi_span.close()
         
         print(f"\nConditional ROI Creation Summary: {created_count} created, {skipped_count} skipped")
     
@@ -149,14 +169,16 @@ class ConditionalROICreator:
         result_margin_settings = self._build_margin_settings(output_config)
         
         # Create algebra geometry
-        new_roi.CreateAlgebraGeometry(
-            Examination=self.examination,
-            Algorithm="Auto",
-            ExpressionA=expression_a,
-            ExpressionB=expression_b,
-            ResultOperation=result_operation,
-            ResultMarginSettings=result_margin_settings
-        )
+        with self.tracer.span("CreateAlgebraGeometry", "api", roi=roi_name):
+            new_roi.CreateAlgebraGeometry(
+                Examination=self.examination,
+                Algorithm="Auto",
+                ExpressionA=expression_a,
+                ExpressionB=expression_b,
+                ResultOperation=result_operation,
+                ResultMarginSettings=result_margin_settings
+            )
+        self._notify_geometry_changed(roi_name)
     
     def _create_dose_to_roi(self, roi_name, convert_dose):
         """
@@ -195,10 +217,12 @@ class ConditionalROICreator:
             new_roi = existing_roi
         
         # Convert dose distribution to ROI
-        new_roi.CreateRoiGeometryFromDose(
-            DoseDistribution=self.plan.TreatmentCourse.TotalDose,
-            ThresholdLevel=dose_threshold
-        )
+        with self.tracer.span("CreateRoiGeometryFromDose", "api", roi=roi_name):
+            new_roi.CreateRoiGeometryFromDose(
+                DoseDistribution=self.plan.TreatmentCourse.TotalDose,
+                ThresholdLevel=dose_threshold
+            )
+        self._notify_geometry_changed(roi_name)
         
     
     def _build_expression(self, roi_config, roi_name):
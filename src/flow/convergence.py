@@ -0,0 +1,168 @@
+class ConditionPlateauDetector:
+    """
+    Detect when the DVH metrics behind the check conditions stop moving between loop rounds.
+    The loop can end once the same metrics were evaluated in two consecutive updates and each changed
+    by less than the absolute epsilon (metric units, cGy/%/cc) or the relative epsilon (% of the previous value).
+    Only update after a round whose dose came from a new optimization, otherwise unchanged metrics look flat.
+    """
+
+    def __init__(self, abs_epsilon=1.0, rel_epsilon=0.5):
+        """
+        Initialize the plateau detector.
+
+        Args:
+            abs_epsilon: Maximum absolute change counted as "not moving"
+            rel_epsilon: Maximum relative change in percent counted as "not moving"
+        """
+        self.abs_epsilon = float(abs_epsilon)
+        self.rel_epsilon = float(rel_epsilon)
+        self.previous_values = {}
+        self.last_changes = {}
+
+    @classmethod
+    def from_settings(cls, end_flow_data):
+        """
+        Create a detector from the "condition_plateau" section of end_flow data.
+
+        Returns:
+            ConditionPlateauDetector, or None if plateau stopping is disabled
+        """
+        settings = (end_flow_data or {}).get("condition_plateau", {})
+        if not settings.get("enabled"):
+            return None
+        return cls(abs_epsilon=settings.get("abs_epsilon", 1.0), rel_epsilon=settings.get("rel_epsilon", 0.5))
+
+    def update(self, values):
+        """
+        Compare this round's condition values with the previous round.
+
+        Args:
+            values: Dictionary mapping condition names to evaluated values
+
+        Returns:
+            True if the same metrics were evaluated in both rounds and each changed less than the epsilons.
+            A changed set of metrics (a condition became active, evaluable or failed) is not a plateau;
+            this round becomes the new baseline.
+        """
+        self.last_changes = {}
+        for name, value in values.items():
+            if name in self.previous_values:
+                self.last_changes[name] = value - self.previous_values[name]
+        same_metrics = set(values) == set(self.previous_values)
+        self.previous_values = dict(values)
+
+        if not self.last_changes or not same_metrics:
+            return False
+        return all(self._is_flat(name, change) for name, change in self.last_changes.items())
+
+    def _is_flat(self, name, change):
+        if abs(change) <= self.abs_epsilon:
+            return True
+        previous = self.previous_values[name] - change
+        return previous != 0 and abs(change) / abs(previous) * 100 <= self.rel_epsilon
+
+    def describe(self):
+        """Return the last round-to-round changes as a short string."""
+        return ", ".join(f"{name}: {change:+.2f}" for name, change in self.last_changes.items())
+
+
+class ObjectiveConvergenceMonitor:
+    """
+    Record the total objective value (and per-constituent values) after each RunOptimization.
+    With the stop rule enabled, the loop ends when the total objective improved by less than
+    min_improvement percent over the last `rounds` optimizations.
+    """
+
+    def __init__(self, enabled=False, min_improvement=1.0, rounds=2):
+        """
+        Initialize the objective convergence monitor.
+
+        Args:
+            enabled: If True, should_stop() applies the stop rule (values are always recorded)
+            min_improvement: Minimum relative improvement in percent over the last `rounds` optimizations
+            rounds: Number of optimizations the improvement is measured over
+        """
+        self.enabled = enabled
+        self.min_improvement = float(min_improvement)
+        self.rounds = max(1, int(rounds))
+        self.trajectory = []  # (label, total_value, {constituent_label: value})
+
+    @classmethod
+    def from_settings(cls, end_flow_data):
+        """Create a monitor from the "objective_convergence" section of end_flow data."""
+        settings = (end_flow_data or {}).get("objective_convergence", {})
+        return cls(
+            enabled=settings.get("enabled", False),
+            min_improvement=settings.get("min_improvement", 1.0),
+            rounds=settings.get("rounds", 2)
+        )
+
+    def record(self, po, label):
+        """
+        Read the objective values of a plan optimization after RunOptimization.
+
+        Args:
+            po: RayStation plan optimization object
+            label: Label for this optimization, e.g. "Loop 3"
+
+        Returns:
+            Total objective value, or None if it could not be read
+        """
+        try:
+            total = self._read_value(po.Objective.FunctionValue)
+        except Exception as e:
+            print(f"  Warning: Could not read objective value: {str(e)}")
+            return None
+
+        constituents = {}
+        for index, function in enumerate(po.Objective.ConstituentFunctions):
+            try:
+                name = getattr(function, "Tag", None) or f"{function.ForRegionOfInterest.Name} #{index + 1}"
+                constituents[name] = self._read_value(function.FunctionValue)
+            except Exception:
+                continue
+
+        self.trajectory.append((label, total, constituents))
+        print(f"  Objective value: {total:.6g}")
+        return total
+
+    @staticmethod
+    def _read_value(value):
+        # FunctionValue is either a number or an object with its own FunctionValue
+        if hasattr(value, "FunctionValue"):
+            value = value.FunctionValue
+        return float(value)
+
+    def improvement(self):
+        """Relative improvement in percent over the last `rounds` optimizations, or None if not enough data."""
+        if len(self.trajectory) <= self.rounds:
+            return None
+        previous = self.trajectory[-1 - self.rounds][1]
+        current = self.trajectory[-1][1]
+        if previous == 0:
+            return 0.0
+        return (previous - current) / abs(previous) * 100
+
+    def should_stop(self):
+        """True if the stop rule is enabled and the objective improved less than min_improvement."""
+        if not self.enabled:
+            return False
+        improvement = self.improvement()
+        return improvement is not None and improvement < self.min_improvement
+
+    def summary_lines(self, top_constituents=3):
+        """
+        Objective value trajectory for the timing summary.
+
+        Args:
+            top_constituents: Number of largest constituent functions shown per optimization
+        """
+        lines = []
+        previous = None
+        for label, total, constituents in self.trajectory:
+            change = f"{(total - previous) / abs(previous) * 100:+.2f}%" if previous else ""
+            largest = sorted(constituents.items(), key=lambda item: item[1], reverse=True)[:top_constituents]
+            details = ", ".join(f"{name}={value:.3g}" for name, value in largest)
+            lines.append(f"{label:<20} {total:>12.6g} {change:>9}  {details}")
+            previous = total
+        return lines
@@ -0,0 +1,86 @@
+from array import array
+
+
+class DvhCurve:
+    """
+    Cumulative DVH of one ROI sampled on a uniform dose grid from 0 to Dmax.
+    Relative volumes are stored as a float32 array of at most max_bins values, so one curve
+    takes 4 bytes per bin. DaV is answered by binary search on the (non-increasing) volumes,
+    VaD by indexing the dose grid, Dmean by integrating the curve; all with linear interpolation.
+    """
+
+    __slots__ = ("roi", "dose_max", "bin_width", "volumes")
+
+    def __init__(self, roi, dose_max, volumes):
+        """
+        Initialize the curve.
+
+        Args:
+            roi: Case ROI name
+            dose_max: Dose of the last sample in cGy (the first sample is 0 cGy)
+            volumes: Relative volume (0-1) receiving at least each sampled dose
+        """
+        self.roi = roi
+        self.dose_max = float(dose_max)
+        self.volumes = array('f', volumes)
+        self.bin_width = self.dose_max / (len(self.volumes) - 1) if len(self.volumes) > 1 else 0.0
+
+    @staticmethod
+    def sample_doses(dose_max, max_bins):
+        """
+        Dose values to sample for a curve.
+
+        Args:
+            dose_max: Maximum dose of the ROI in cGy
+            max_bins: Number of samples (at least 2)
+
+        Returns:
+            List of max_bins doses from 0 to dose_max
+        """
+        bins = max(2, int(max_bins))
+        return [dose_max * i / (bins - 1) for i in range(bins)]
+
+    @property
+    def nbytes(self):
+        """Memory used by the sampled volumes."""
+        return self.volumes.itemsize * len(self.volumes)
+
+    def relative_volume_at_dose(self, dose_value):
+        """Relative volume (0-1) receiving at least dose_value."""
+        if dose_value <= 0:
+            return float(self.volumes[0])
+        if dose_value >= self.dose_max:
+            return float(self.volumes[-1]) if dose_value == self.dose_max else 0.0
+        position = dose_value / self.bin_width
+        index = int(position)
+        fraction = position - index
+        return float(self.volumes[index] + (self.volumes[index + 1] - self.volumes[index]) * fraction)
+
+    def dose_at_relative_volume(self, relative_volume):
+        """Dose in cGy received by at least relative_volume (0-1) of the ROI."""
+        volumes = self.volumes
+        # At exactly volumes[0] (e.g. D100%) the search below finds the last sample of the plateau
+        if relative_volume > volumes[0]:
+            return 0.0
+        if relative_volume <= volumes[-1]:
+            return self.dose_max
+
+        # Last sample with volume >= relative_volume (volumes are non-increasing)
+        low, high = 0, len(volumes) - 1
+        while high - low > 1:
+            middle = (low + high) // 2
+            if volumes[middle] >= relative_volume:
+                low = middle
+            else:
+                high = middle
+        span = volumes[low] - volumes[high]
+        fraction = (volumes[low] - relative_volume) / span if span > 0 else 0.0
+        return (low + fraction) * self.bin_width
+
+    def dmean(self):
+        """Mean dose in cGy (area under the cumulative DVH, trapezoidal rule)."""
+        volumes = self.volumes
+        if len(volumes) < 2:
+            return 0.0
+        area = sum(volumes) - (volumes[0] + volumes[-1]) / 2.0
+        return area * self.bin_width
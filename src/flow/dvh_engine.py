@@ -0,0 +1,140 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class DvhEngine:
+    """
+    Local DVH calculations for condition evaluation.
+    Holds one flattened dose grid (cGy) and, per ROI, the dose grid voxel indices with their
+    fractional volume weights. Dmax, Dmin, Dmean, DaV, VaD and ROI volume are computed with
+    vectorized NumPy operations, so the engine works on synthetic arrays without RayStation.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("The NumPy condition evaluator requires numpy.")
+        self.dose = None
+        self.rois = {}  # roi -> (voxel indices, weights, voxel volume in cc)
+        self._sorted = {}  # roi -> (doses sorted descending, cumulative relative volume)
+
+    def set_dose(self, dose_values):
+        """
+        Set the dose grid for this round.
+
+        Args:
+            dose_values: Dose per voxel in cGy (any shape, flattened in C order)
+        """
+        self.dose = np.asarray(dose_values, dtype=np.float64).ravel()
+        self._sorted = {}
+
+    def set_roi(self, roi_name, voxel_indices, weights, voxel_volume):
+        """
+        Set the voxel mask of a ROI.
+
+        Args:
+            roi_name: ROI name
+            voxel_indices: Flat dose grid indices of voxels inside (or partly inside) the ROI
+            weights: Fraction (0-1) of each voxel that lies inside the ROI
+            voxel_volume: Volume of one dose grid voxel in cc
+        """
+        self.rois[roi_name] = (np.asarray(voxel_indices, dtype=np.int64),
+                               np.asarray(weights, dtype=np.float64),
+                               float(voxel_volume))
+        self._sorted.pop(roi_name, None)
+
+    def has_roi(self, roi_name):
+        return roi_name in self.rois
+
+    def remove_roi(self, roi_name):
+        """Forget a ROI mask (e.g. after its geometry was rewritten)."""
+        self.rois.pop(roi_name, None)
+        self._sorted.pop(roi_name, None)
+
+    def _roi_doses(self, roi_name):
+        indices, weights, _ = self.rois[roi_name]
+        doses = self.dose[indices]
+        inside = weights > 0
+        return doses[inside], weights[inside]
+
+    def _cumulative(self, roi_name):
+        # Doses sorted high to low with the cumulative relative volume receiving at least that dose
+        if roi_name not in self._sorted:
+            doses, weights = self._roi_doses(roi_name)
+            order = np.argsort(doses)[::-1]
+            sorted_doses = doses[order]
+            cumulative = np.cumsum(weights[order]) / weights.sum()
+            self._sorted[roi_name] = (sorted_doses, cumulative)
+        return self._sorted[roi_name]
+
+    def dmax(self, roi_name):
+        """Maximum dose in cGy."""
+        doses, _ = self._roi_doses(roi_name)
+        return float(doses.max())
+
+    def dmin(self, roi_name):
+        """Minimum dose in cGy."""
+        doses, _ = self._roi_doses(roi_name)
+        return float(doses.min())
+
+    def dmean(self, roi_name):
+        """Volume-weighted mean dose in cGy."""
+        doses, weights = self._roi_doses(roi_name)
+        return float(np.dot(doses, weights) / weights.sum())
+
+    def dose_at_relative_volumes(self, roi_name, relative_volumes):
+        """
+        Dose received by at least each relative volume (0-1), e.g. 0.95 -> D95%.
+
+        Returns:
+            List of doses in cGy
+        """
+        sorted_doses, cumulative = self._cumulative(roi_name)
+        return [float(d) for d in np.interp(np.asarray(relative_volumes, dtype=np.float64), cumulative, sorted_doses)]
+
+    def relative_volumes_at_doses(self, roi_name, dose_values):
+        """
+        Relative volume (0-1) receiving at least each dose value.
+
+        Returns:
+            List of relative volumes
+        """
+        sorted_doses, cumulative = self._cumulative(roi_name)
+        # Number of voxels with dose >= d (negated doses are ascending), then the cumulative volume of that many voxels
+        counts = np.searchsorted(-sorted_doses, -np.asarray(dose_values, dtype=np.float64), side='right')
+        volumes = np.where(counts > 0, cumulative[np.maximum(counts - 1, 0)], 0.0)
+        return [float(v) for v in volumes]
+
+    def roi_volume(self, roi_name):
+        """ROI volume in cc."""
+        _, weights, voxel_volume = self.rois[roi_name]
+        return float(weights.sum() * voxel_volume)
+
+
+def read_dose_grid(dose):
+    """
+    Read the dose values of a RayStation dose distribution.
+
+    Args:
+        dose: RayStation dose distribution, e.g. plan.TreatmentCourse.TotalDose
+
+    Returns:
+        Flat NumPy array of doses in cGy
+    """
+    return np.asarray(dose.DoseValues.DoseData, dtype=np.float64).ravel()
+
+
+def read_roi_mask(dose, roi_name):
+    """
+    Read the dose grid voxels of a ROI with their fractional volumes.
+
+    Returns:
+        (voxel_indices, weights, voxel_volume_cc)
+    """
+    distribution = dose.GetDoseGridRoi(RoiName=roi_name).RoiVolumeDistribution
+    voxel_size = dose.InDoseGrid.VoxelSize
+    voxel_volume = voxel_size.x * voxel_size.y * voxel_size.z
+    return (np.asarray(distribution.VoxelIndices, dtype=np.int64),
+            np.asarray(distribution.RelativeVolumes, dtype=np.float64),
+            voxel_volume)
@@ -0,0 +1,394 @@
+import re
+
+
+class ParameterField:
+    """One DoseFunctionParameters value read from a function description with a precompiled pattern."""
+
+    __slots__ = ("attribute", "label", "pattern")
+
+    def __init__(self, attribute, label, pattern, flags=0):
+        """
+        Initialize the field.
+
+        Args:
+            attribute: DoseFunctionParameters attribute the value is written to
+            label: Name used in error messages
+            pattern: Regular expression with the number as its first group
+            flags: re flags for the pattern
+        """
+        self.attribute = attribute
+        self.label = label
+        self.pattern = re.compile(pattern, flags)
+
+    def parse(self, description):
+        """Extract the value from a description (e.g. '5000 cGy' -> 5000.0)."""
+        match = self.pattern.search(description)
+        if match:
+            return float(match.group(1))
+        raise ValueError(f"Could not extract {self.label} from: {description}")
+
+    def parse_into(self, description, parameters):
+        """Add the value to a parameters dictionary."""
+        parameters[self.attribute] = self.parse(description)
+
+
+class VolumeField:
+    """DVH volume: absolute ('to 0.1cc volume') or percent ('to 70% volume') depending on the description."""
+
+    __slots__ = ("absolute", "percent")
+
+    def __init__(self, absolute, percent):
+        self.absolute = absolute
+        self.percent = percent
+
+    @staticmethod
+    def is_absolute(description):
+        """True if the description gives the volume in cc."""
+        return 'cc' in description.lower() and '%' not in description
+
+    def parse_into(self, description, parameters):
+        if self.is_absolute(description):
+            parameters["IsAbsoluteVolume"] = True
+            self.absolute.parse_into(description, parameters)
+        else:
+            parameters["IsAbsoluteVolume"] = False
+            self.percent.parse_into(description, parameters)
+
+
+# ========== Parameter fields ==========
+
+_NUMBER = r'(\d+\.?\d*)'
+
+DOSE_LEVEL = ParameterField("DoseLevel", "dose", _NUMBER + r'\s*cGy')
+EUD_PARAMETER_A = ParameterField("EudParameterA", "Parameter A", r'Parameter A\s+' + _NUMBER, re.IGNORECASE)
+HIGH_DOSE_LEVEL = ParameterField("HighDoseLevel", "high dose", r'\[H\]\s*' + _NUMBER + r'\s*cGy')
+LOW_DOSE_LEVEL = ParameterField("LowDoseLevel", "low dose", r'\[L\]\s*' + _NUMBER + r'\s*cGy')
+LOW_DOSE_DISTANCE = ParameterField("LowDoseDistance", "distance", r'Low dose distance\s+' + _NUMBER + r'\s*cm', re.IGNORECASE)
+PERCENT_STD_DEVIATION = ParameterField("PercentStdDeviation", "relative standard deviation",
+                                       r'Rel\.std\.dev\s+' + _NUMBER + r'\s*%', re.IGNORECASE)
+DVH_VOLUME = VolumeField(
+    absolute=ParameterField("AbsoluteVolume", "absolute volume", r'to\s+' + _NUMBER + r'\s*cc', re.IGNORECASE),
+    percent=ParameterField("PercentVolume", "percent volume", r'to\s+' + _NUMBER + r'\s*%'),
+)
+
+
+class FunctionSpec:
+    """Declarative description of one optimization function type."""
+
+    __slots__ = ("name", "function_type", "fields", "always_constraint")
+
+    def __init__(self, name, function_type, fields, always_constraint=False):
+        """
+        Initialize the spec.
+
+        Args:
+            name: Function type as shown in the flow (e.g. "Max DVH")
+            function_type: RayStation FunctionType (e.g. "MaxDvh")
+            fields: Parameter fields read from the description, in the order they are written
+            always_constraint: True for types that can only be constraints (they have no weight)
+        """
+        self.name = name
+        self.function_type = function_type
+        self.fields = tuple(fields)
+        self.always_constraint = always_constraint
+
+    def is_constraint(self, is_constraint):
+        return is_constraint or self.always_constraint
+
+    def parameters(self, description, weight, is_constraint):
+        """
+        DoseFunctionParameters values of a function.
+
+        Args:
+            description: Description string containing the parameter values
+            weight: Weight (written for objectives only)
+            is_constraint: Whether the function is a constraint
+
+        Returns:
+            Dictionary of attribute -> value, in the order they should be written
+
+        Raises:
+            ValueError: If a value cannot be read from the description
+        """
+        parameters = {}
+        for field in self.fields:
+            field.parse_into(description, parameters)
+        if not self.is_constraint(is_constraint):
+            parameters["Weight"] = parse_weight(weight)
+        return parameters
+
+
+# Function types by flow name. To support a new type, add its spec here (and its frame in function_frame.py)
+FUNCTION_SPECS = {spec.name: spec for spec in (
+    FunctionSpec("Max Dose", "MaxDose", [DOSE_LEVEL]),
+    FunctionSpec("Min Dose", "MinDose", [DOSE_LEVEL]),
+    FunctionSpec("Max EUD", "MaxEud", [DOSE_LEVEL, EUD_PARAMETER_A]),
+    FunctionSpec("Min EUD", "MinEud", [DOSE_LEVEL, EUD_PARAMETER_A]),
+    FunctionSpec("Target EUD", "TargetEud", [DOSE_LEVEL, EUD_PARAMETER_A]),
+    FunctionSpec("Uniform Dose", "UniformDose", [DOSE_LEVEL]),
+    FunctionSpec("Dose fall-off", "DoseFallOff", [HIGH_DOSE_LEVEL, LOW_DOSE_LEVEL, LOW_DOSE_DISTANCE]),
+    FunctionSpec("Max DVH", "MaxDvh", [DOSE_LEVEL, DVH_VOLUME]),
+    FunctionSpec("Min DVH", "MinDvh", [DOSE_LEVEL, DVH_VOLUME]),
+    FunctionSpec("Uniformity Constraint", "UniformityConstraint", [PERCENT_STD_DEVIATION], always_constraint=True),
+)}
+
+
+def get_function_spec(func_type):
+    """
+    Look up the spec of a flow function type.
+
+    Raises:
+        ValueError: If the type is unknown
+    """
+    spec = FUNCTION_SPECS.get(func_type)
+    if spec is None:
+        raise ValueError(f"Unknown function type: {func_type}")
+    return spec
+
+
+def parse_weight(weight):
+    """Weight from the flow ("" means 1.0)."""
+    if weight == "":
+        return 1.0
+    try:
+        return float(weight)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid weight: {weight}")
+
+
+def add_optimization_function(po, spec, tag, roi_name, parameters, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+    """
+    Add an optimization function and write its parameters.
+
+    Args:
+        po: RayStation plan optimization
+        spec: FunctionSpec of the function
+        tag: Tag of the new function
+        roi_name: ROI name (already mapped to case name)
+        parameters: DoseFunctionParameters values from spec.parameters()
+        is_constraint: Whether this is a constraint or objective
+        restrict_all_beams_individually: Whether to restrict to all beams individually
+        restrict_to_beams: List of beam names to restrict to
+        robust: Whether to apply robust optimization
+        restrict_to_beamset: BeamSet label for restriction
+
+    Returns:
+        The new function
+    """
+    o = po.AddOptimizationFunction(FunctionType=spec.function_type, RoiName=roi_name, IsConstraint=spec.is_constraint(is_constraint),
+                                   RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
+                                   IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
+    for attribute, value in parameters.items():
+        setattr(o.DoseFunctionParameters, attribute, value)
+    o.Tag = tag
+    return o
+
+
+class ProportionalAdjustment:
+    """
+    Feedback rule of a proportional "Adjust OLD Function" entry: the weight or dose level of the
+    function is scaled by the margin of its condition, new = clamp(current * (1 + gain * margin)).
+    A positive gain raises the value while the condition is met by a wide margin, a negative gain
+    lowers it; as the metric approaches the threshold the steps get smaller.
+    """
+
+    # Flow "mode" -> DoseFunctionParameters attribute that is scaled
+    MODES = {"Proportional weight": "Weight", "Proportional dose": "DoseLevel"}
+
+    __slots__ = ("mode", "attribute", "gain", "minimum", "maximum")
+
+    def __init__(self, mode, gain, minimum=0.0, maximum=float("inf")):
+        self.mode = mode
+        self.attribute = self.MODES[mode]
+        self.gain = gain
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def next_value(self, current, margin):
+        """
+        Scaled value for the current live value and the condition margin, within the clamps.
+        Adjustments only run for met conditions; a condition met inside its tolerance band (or kept
+        met by hysteresis) has a negative margin, which counts as 0 so the step never changes direction.
+        """
+        margin = max(0.0, margin)
+        return min(self.maximum, max(self.minimum, current * (1.0 + self.gain * margin)))
+
+
+def _optional_float(entry, key, default, label):
+    value = entry.get(key, "")
+    if value in ("", None):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {label}: {value}")
+
+
+def compile_proportional(entry, spec, is_constraint):
+    """
+    Parse the proportional adjustment settings of an entry.
+
+    Returns:
+        ProportionalAdjustment, or None for absolute adjustments (no or "Absolute" mode)
+
+    Raises:
+        ValueError: If the mode, gain or clamps are invalid or the mode does not fit the function
+    """
+    mode = entry.get("mode", "Absolute") or "Absolute"
+    if mode == "Absolute":
+        return None
+    if mode not in ProportionalAdjustment.MODES:
+        raise ValueError(f"Unknown adjustment mode: {mode}")
+    if entry.get("adjustment") != "Adjust OLD Function":
+        raise ValueError(f"{mode} only applies to \"Adjust OLD Function\" entries")
+    if mode == "Proportional weight" and is_constraint:
+        raise ValueError(f"{mode} needs an objective (constraints have no weight)")
+    if mode == "Proportional dose" and DOSE_LEVEL not in spec.fields:
+        raise ValueError(f"{mode} is not available for {spec.name} functions")
+
+    gain = _optional_float(entry, "gain", None, "gain")
+    if gain is None:
+        raise ValueError(f"{mode} needs a gain")
+    minimum = _optional_float(entry, "clamp_min", 0.0, "clamp minimum")
+    maximum = _optional_float(entry, "clamp_max", float("inf"), "clamp maximum")
+    if minimum > maximum:
+        raise ValueError(f"Clamp minimum {minimum:g} is above clamp maximum {maximum:g}")
+    return ProportionalAdjustment(mode, gain, minimum, maximum)
+
+
+def check_proportional_condition(mode, condition_name, condition):
+    """
+    Check that the condition of a proportional adjustment has a margin, i.e. a metric compared
+    with a threshold (ConditionChecker.margins() has no entry for other conditions).
+
+    Args:
+        mode: Proportional mode of the entry
+        condition_name: Condition name of the entry
+        condition: CompiledCondition with that name, or None if the flow has none
+
+    Raises:
+        ValueError: For a missing condition, Alway TRUE and Expression conditions
+    """
+    if condition is None:
+        raise ValueError(f"{mode} needs a condition with a threshold (condition '{condition_name}' not found)")
+    if condition.threshold is None:
+        raise ValueError(f"{mode} needs a condition with a threshold (condition '{condition_name}' has type {condition.type})")
+
+
+class CompiledFunction:
+    """
+    An initial function or function adjustment parsed once at flow load.
+    parameters holds the DoseFunctionParameters values read from the description;
+    the description itself is only kept for display.
+    """
+
+    __slots__ = ("tag", "spec", "roi", "description", "weight", "parameters", "is_constraint",
+                 "restrict_all_beams_individually", "restrict_to_beams", "robust", "condition", "adjustment",
+                 "proportional")
+
+    def __init__(self, tag, spec, roi, description, weight, parameters, is_constraint,
+                 restrict_all_beams_individually=False, restrict_to_beams=(), robust=False, condition="", adjustment="",
+                 proportional=None):
+        self.tag = tag
+        self.spec = spec
+        self.roi = roi
+        self.description = description
+        self.weight = weight
+        self.parameters = parameters
+        self.is_constraint = is_constraint
+        self.restrict_all_beams_individually = restrict_all_beams_individually
+        self.restrict_to_beams = list(restrict_to_beams)
+        self.robust = robust
+        self.condition = condition
+        self.adjustment = adjustment
+        self.proportional = proportional  # ProportionalAdjustment, None for absolute adjustments
+
+    @property
+    def type(self):
+        """Function type as shown in the flow (e.g. "Max DVH")."""
+        return self.spec.name
+
+    @property
+    def restricts_beams(self):
+        """True if the function is restricted to beams (and so needs the beam set label)."""
+        return self.restrict_all_beams_individually or bool(self.restrict_to_beams)
+
+    def __repr__(self):
+        return f"CompiledFunction({self.tag!r}, {self.spec.name!r}, {self.roi!r})"
+
+
+def compile_function(entry, default_weight=""):
+    """
+    Parse one initial function or function adjustment entry.
+
+    Args:
+        entry: Function dictionary from flow JSON
+        default_weight: Weight used if the entry has none
+
+    Returns:
+        CompiledFunction
+
+    Raises:
+        ValueError: If the type is unknown or the description or weight cannot be parsed
+    """
+    tag = entry.get("tag", "")
+    description = entry.get("description", "")
+    try:
+        spec = get_function_spec(entry.get("type", ""))
+        is_constraint = spec.is_constraint(entry.get("objective_constraint") == "Constraint")
+        weight = parse_weight(entry.get("weight", default_weight))
+        parameters = spec.parameters(description, weight, is_constraint)
+        proportional = compile_proportional(entry, spec, is_constraint)
+    except ValueError as e:
+        raise ValueError(f"Function '{tag}': {e}")
+
+    selected_beam = entry.get("selected_beam")
+    restrict_all_beams_individually = selected_beam == "All beams individually"
+    restrict_to_beams = [selected_beam] if not restrict_all_beams_individually and entry.get("restrict_to_beam") else []
+    return CompiledFunction(tag, spec, entry.get("roi", ""), description, weight, parameters, is_constraint,
+                            restrict_all_beams_individually=restrict_all_beams_individually,
+                            restrict_to_beams=restrict_to_beams,
+                            robust=entry.get("is_robust", False),
+                            condition=entry.get("condition", ""),
+                            adjustment=entry.get("adjustment", ""),
+                            proportional=proportional)
+
+
+def compile_functions(entries, section="functions", default_weight="", conditions=None):
+    """
+    Parse all function entries of a flow section.
+
+    Args:
+        entries: List of function dictionaries from flow JSON (initial_functions or function_adjustments)
+        section: Section name used in the error message
+        default_weight: Weight used for entries without one
+        conditions: Compiled check conditions; if given, proportional entries must use a condition with a threshold
+
+    Returns:
+        List of CompiledFunction in flow order
+
+    Raises:
+        ValueError: Listing every entry that could not be parsed
+    """
+    compiled = []
+    errors = []
+    for entry in entries or []:
+        if isinstance(entry, CompiledFunction):
+            compiled.append(entry)
+            continue
+        try:
+            compiled.append(compile_function(entry, default_weight))
+        except ValueError as e:
+            errors.append(str(e))
+    if conditions is not None:
+        by_name = {condition.name: condition for condition in conditions}
+        for function in compiled:
+            if function.proportional is None:
+                continue
+            try:
+                check_proportional_condition(function.proportional.mode, function.condition, by_name.get(function.condition))
+            except ValueError as e:
+                errors.append(f"Function '{function.tag}': {e}")
+    if errors:
+        raise ValueError(f"Invalid {section}:\n" + "\n".join(errors))
+    return compiled
@@ -5,31 +5,38 @@ try:
     import raystation.v2025.typing as rstype
 except:
     from connect import *
-import re
+from src.flow.function_registry import CompiledFunction, compile_functions, add_optimization_function
+from src.flow.robustness_settings import RobustnessSettingsManager
 
 
 class ObjectiveAdder:
     """
     Class to add optimization objectives/functions to a RayStation plan.
-    Parses initial_functions data and adds them to the plan optimization.
+    Adds the initial functions (parsed at flow load) to the plan optimization.
     """
     
-    def __init__(self, initial_functions_data, case, plan_name, matched_roi_dict, robust_settings):
+    def __init__(self, initial_functions_data, case, plan_name, matched_roi_dict, robust_settings, robustness=None):
         """
         Initialize the ObjectiveAdder.
         
         Args:
-            initial_functions_data: List of function dictionaries from flow config
+            initial_functions_data: List of CompiledFunction (or function dictionaries from flow config, parsed here)
             case: RayStation case object
             plan_name: Name of the plan to add objectives to
             matched_roi_dict: Dictionary mapping flow ROI names to case ROI names
             robust_settings: Dictionary of robustness settings
+            robustness: Optional RobustnessSettingsManager shared with the ObjectiveAdjuster
         """
         self.initial_functions_data = initial_functions_data
+        if all(isinstance(function, CompiledFunction) for function in initial_functions_data or []):
+            self.functions = list(initial_functions_data or [])
+        else:
+            self.functions = compile_functions(initial_functions_data, "initial functions", default_weight="1")
         self.case = case
         self.plan_name = plan_name
         self.matched_roi_dict = matched_roi_dict
         self.robust_settings = robust_settings
+        self.robustness = robustness or RobustnessSettingsManager(robust_settings)
         self.beam_set = get_current('BeamSet')
         
         # Get plan and plan optimization
@@ -40,64 +47,33 @@ class ObjectiveAdder:
         """
         Main method to add all initial objectives to the plan.
         """
-        if not self.initial_functions_data:
+        if not self.functions:
             print("No initial objectives to add.")
             return
         
-        print(f"\nAdding {len(self.initial_functions_data)} objectives...")
+        print(f"\nAdding {len(self.functions)} objectives...")
         
-        for func_entry in self.initial_functions_data:
-            tag = func_entry.get("tag", "")
-            func_type = func_entry.get("type", "")
-            roi_name = func_entry.get("roi", "")
-            description = func_entry.get("description", "")
-            weight = func_entry.get("weight", "1")
-            is_constraint = True if func_entry.get("objective_constraint") == "Constraint" else False
-            restrict_all_beams_individually = True if func_entry.get("selected_beam") == "All beams individually" else False
-            restrict_to_beams = [func_entry["selected_beam"]] if func_entry.get("selected_beam") != "All beams individually" and func_entry.get("restrict_to_beam") else []
-            robust = func_entry.get("is_robust", False)
-            restrict_to_beamset = self.beam_set.DicomPlanLabel if restrict_all_beams_individually or restrict_to_beams != [] else None
+        for function in self.functions:
+            restrict_to_beamset = self.beam_set.DicomPlanLabel if function.restricts_beams else None
             
             # Map ROI name if it's in matched dictionary
-            if roi_name in self.matched_roi_dict:
-                roi_name = self.matched_roi_dict[roi_name]
+            roi_name = self.matched_roi_dict.get(function.roi, function.roi)
             
             try:
-                print(f"  Adding '{tag}' ({func_type})...", end=" ")
-                self._add_single_function(tag, func_type, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
+                print(f"  Adding '{function.tag}' ({function.type})...", end=" ")
+                add_optimization_function(self.po, function.spec, function.tag, roi_name, function.parameters, function.is_constraint,
+                                          function.restrict_all_beams_individually, function.restrict_to_beams, function.robust, restrict_to_beamset)
+                self.robustness.mark(function.tag, function.robust)
                 print("✓")
             except Exception as e:
                 print(f"✗ Error: {str(e)}")
                 
-        # Check if any function requires robustness
-        if any(func.get("is_robust", False) for func in self.initial_functions_data):
+        # Save the robustness parameters if any function is robust
+        if self.robustness.has_robust_functions:
             print("Configuring robustness settings...", end=" ")
-            self._set_robustness()
+            self.robustness.ensure_saved(self.po)
             print("✓")
     
-    def _set_robustness(self):
-        """
-        Placeholder for adding robustness settings if needed.
-        Currently not implemented.
-        """
-        self.po.OptimizationParameters.SaveRobustnessParameters(PositionUncertaintyAnterior=self.robust_settings['positioning_uncertainty']['anterior'],
-                                                                        PositionUncertaintyPosterior=self.robust_settings['positioning_uncertainty']['posterior'],
-                                                                        PositionUncertaintySuperior=self.robust_settings['positioning_uncertainty']['superior'],
-                                                                        PositionUncertaintyInferior=self.robust_settings['positioning_uncertainty']['inferior'],
-                                                                        PositionUncertaintyLeft=self.robust_settings['positioning_uncertainty']['left'], 
-                                                                        PositionUncertaintyRight=self.robust_settings['positioning_uncertainty']['right'], 
-                                                                        DensityUncertainty=self.robust_settings['density_uncertainty']/100, 
-                                                                        UseReducedSetOfDensityShifts=False, 
-                                                                        PositionUncertaintySetting="Universal", IndependentLeftRight=True, 
-                                                                        IndependentAnteriorPosterior=True, IndependentSuperiorInferior=True, 
-                                                                        ComputeExactScenarioDoses=False, NamesOfNonPlanningExaminations=[], 
-                                                                        PatientGeometryUncertaintyType="PerTreatmentCourse", 
-                                                                        PositionUncertaintyType="PerTreatmentCourse", 
-                                                                        TreatmentCourseScenariosFactor=1000, 
-                                                                        PositionUncertaintyList=None, 
-                                                                        PositionUncertaintyFormation="Automatic", 
-                                                                        RobustMethodPerTreatmentCourse="WeightedPowerMean" if self.robust_settings.get('method', '') == 'Composite worst cases (minimax)' else "VoxelwiseWorstCase")
-    
     def _check_robust_function(self):
         """
         Check if there is robust function.
@@ -108,251 +84,3 @@ class ObjectiveAdder:
             bool: True if robustness function, False otherwise
         """
         pass
-    
-    def _add_single_function(self, tag, func_type, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """
-        Add a single optimization function based on type and description.
-        
-        Args:
-            tag: Unique identifier for the function
-            func_type: Type of function (e.g., "Max Dose", "Min Dose", etc.)
-            roi_name: ROI name (already mapped to case name)
-            description: Description string containing parameter values
-            weight: Weight value for the function
-        """
-        if weight == "": 
-            weight = 1.0
-        else:
-            weight = float(weight)
-        
-        # Route to appropriate function based on type
-        if func_type == "Max Dose":
-            self._add_max_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min Dose":
-            self._add_min_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Max EUD":
-            self._add_max_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min EUD":
-            self._add_min_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Target EUD":
-            self._add_target_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Uniform Dose":
-            self._add_uniform_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Dose fall-off":
-            self._add_fall_off(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Max DVH":
-            self._add_max_dvh(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min DVH":
-            self._add_min_dvh(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Uniformity Constraint":
-            self._add_uniformity_constraint(tag, roi_name, description, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        else:
-            raise ValueError(f"Unknown function type: {func_type}")
-    
-    def _add_uniformity_constraint(self, tag, roi_name, description, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Uniformity Constraint objective. Description: 'Uniformity Constraint Rel.std.dev 1 %'"""
-        rel_std_dev  = self._extract_rel_std_dev(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="UniformityConstraint", RoiName=roi_name, IsConstraint=True,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.PercentStdDeviation = rel_std_dev
-        o.Tag = tag
-    
-    def _add_max_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Max Dose objective. Description: 'Max Dose 5000 cGy'"""
-        dose_level = self._extract_dose(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MaxDose", RoiName=roi_name, IsConstraint=is_constraint, 
-                                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                                            IsRobust=robust,  RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Min Dose objective. Description: 'Min Dose 3933 cGy'"""
-        dose_level = self._extract_dose(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MinDose", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_max_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Max EUD objective. Description: 'Max EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MaxEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Min EUD objective. Description: 'Min EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MinEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_target_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Target EUD objective. Description: 'Target EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="TargetEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_uniform_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Uniform Dose objective. Description: 'Uniform Dose 4140 cGy'"""
-        dose_level = self._extract_dose(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="UniformDose", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_fall_off(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """
-        Add Dose Fall-off objective.
-        Description: 'Dose fall-off [H] 4140 cGy [L] 2070 cGy, Low dose distance 1.5 cm'
-        """
-        high_dose = self._extract_high_dose(description)
-        low_dose = self._extract_low_dose(description)
-        distance = self._extract_distance(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="DoseFallOff", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.HighDoseLevel = high_dose
-        o.DoseFunctionParameters.LowDoseLevel = low_dose
-        o.DoseFunctionParameters.LowDoseDistance = distance
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_max_dvh(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """
-        Add Max DVH objective.
-        Description: 'Max DVH 500 cGy to 70% volume' or 'Max DVH 500 cGy to 0.1cc volume'
-        """
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MaxDvh", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            o.DoseFunctionParameters.IsAbsoluteVolume = True
-            o.DoseFunctionParameters.AbsoluteVolume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            o.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_dvh(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """
-        Add Min DVH objective.
-        Description: 'Min DVH 500 cGy to 70% volume' or 'Min DVH 500 cGy to 0.1cc volume'
-        """
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MinDvh", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            o.DoseFunctionParameters.IsAbsoluteVolume = True
-            o.DoseFunctionParameters.AbsoluteVolume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            o.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    # ========== Helper methods to extract values from descriptions ==========
-    
-    def _extract_dose(self, description):
-        """Extract dose value from description (e.g., '5000 cGy' -> 5000)"""
-        match = re.search(r'(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract dose from: {description}")
-    
-    def _extract_parameter_a(self, description):
-        """Extract Parameter A from description (e.g., 'Parameter A 1' -> 1)"""
-        match = re.search(r'Parameter A\s+(\d+\.?\d*)', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract Parameter A from: {description}")
-    
-    def _extract_high_dose(self, description):
-        """Extract high dose from fall-off description (e.g., '[H] 4140 cGy' -> 4140)"""
-        match = re.search(r'\[H\]\s*(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract high dose from: {description}")
-    
-    def _extract_low_dose(self, description):
-        """Extract low dose from fall-off description (e.g., '[L] 2070 cGy' -> 2070)"""
-        match = re.search(r'\[L\]\s*(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract low dose from: {description}")
-    
-    def _extract_distance(self, description):
-        """Extract distance from fall-off description (e.g., 'Low dose distance 1.5 cm' -> 1.5)"""
-        match = re.search(r'Low dose distance\s+(\d+\.?\d*)\s*cm', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract distance from: {description}")
-    
-    def _extract_percent_volume(self, description):
-        """Extract percent volume from DVH description (e.g., 'to 70% volume' -> 70)"""
-        match = re.search(r'to\s+(\d+\.?\d*)%\s*volume', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract percent volume from: {description}")
-    
-    def _extract_is_absolute_volume(self, description):
-        """Detect if description uses absolute volume (cc) or percent volume (%)"""
-        return 'cc' in description.lower()
-    
-    def _extract_absolute_volume(self, description):
-        """Extract absolute volume from DVH description (e.g., 'to 0.1cc volume' -> 0.1)"""
-        match = re.search(r'to\s+(\d+\.?\d*)\s*cc\s*volume', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract absolute volume from: {description}")
-    
-    def _extract_rel_std_dev(self, description):
-        """Extract relative standard deviation from Uniformity Constraint description (e.g., 'Rel.std.dev 1 %' -> 1)"""
-        match = re.search(r'Rel\.std\.dev\s+(\d+\.?\d*)\s*%', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract relative standard deviation from: {description}")
-    
-    
@@ -1,4 +1,6 @@
-import re
+from src.flow.tracer import NULL_TRACER
+from src.flow.function_registry import CompiledFunction, compile_functions, add_optimization_function
+from src.flow.robustness_settings import RobustnessSettingsManager
 try:
     from raystation import *
     import raystation.v2025 as rs
@@ -15,27 +17,46 @@ class ObjectiveAdjuster:
     Supports two adjustment types: "Add NEW function" and "Adjust OLD Function".
     """
     
-    def __init__(self, function_adjustments_data, matched_roi_dict, case, plan, robust_settings):
+    def __init__(self, function_adjustments_data, matched_roi_dict, case, plan, robust_settings, tracer=None, robustness=None):
         """
         Initialize the ObjectiveAdjuster.
         
         Args:
-            function_adjustments_data: List of function adjustment configurations from flow JSON
+            function_adjustments_data: List of CompiledFunction (or function adjustment dictionaries from flow JSON, parsed here)
             matched_roi_dict: Dictionary mapping flow ROI names to case ROI names
             case: RayStation case object
             plan: RayStation plan object
             robust_settings: Robust settings for the plan
+            tracer: Optional SpanTracer for per-adjustment and API call timing
+            robustness: Optional RobustnessSettingsManager shared with the ObjectiveAdder
         """
         self.function_adjustments_data = function_adjustments_data
+        if all(isinstance(function, CompiledFunction) for function in function_adjustments_data or []):
+            self.adjustments = list(function_adjustments_data or [])
+        else:
+            self.adjustments = compile_functions(function_adjustments_data, "function adjustments")
         self.matched_roi_dict = matched_roi_dict
         self.case = case
         self.plan = plan
         self.robust_settings = robust_settings
+        self.tracer = tracer or NULL_TRACER
+        self.robustness = robustness or RobustnessSettingsManager(robust_settings, tracer=self.tracer)
         
         # Get plan optimization
         self.po = self.plan.PlanOptimizations[0]
+        
+        # Tag index of the optimization functions: tag -> (collection, position), rebuilt every round
+        self._function_index = None
+        self._collection_sizes = {}
+        self.duplicate_tags = {}  # tag -> number of functions using it
+        
+        # Structure (type, ROI, constraint, beam restriction, robustness) each tag was last set to by this flow;
+        # the beam restriction cannot be fully read back from RayStation, so it is compared with this
+        self._applied_structures = {}
+        self.skipped_edits = 0  # EditOptimizationFunction calls skipped (this round)
+        self.skipped_writes = 0  # Parameter writes skipped (this round)
     
-    def adjust_objectives(self, met_condition):
+    def adjust_objectives(self, met_condition, margins=None):
         """
         Main method to adjust all conditional objectives.
         Only adjusts objectives where the associated condition is True.
@@ -43,30 +64,31 @@ class ObjectiveAdjuster:
         Args:
             met_condition: Dictionary mapping condition names to True/False
                           Example: {"Heart Dmean1500": True, "r1": False}
+            margins: Dictionary mapping condition names to their relative margin
+                     (ConditionChecker.margins()), needed by proportional adjustments
         """
-        if not self.function_adjustments_data:
+        if not self.adjustments:
             print("No function adjustments defined.")
             return
         
-        print(f"\nProcessing {len(self.function_adjustments_data)} function adjustment entries...")
+        print(f"\nProcessing {len(self.adjustments)} function adjustment entries...")
         
         adjusted_count = 0
         skipped_count = 0
+        self.skipped_edits = 0
+        self.skipped_writes = 0
+        # Index function tags once per round (the previous round's optimization may have changed them)
+        self._function_index = None
+        if any(adjustment.adjustment == "Adjust OLD Function" and met_condition.get(adjustment.condition, False)
+               for adjustment in self.adjustments):
+            self._build_function_index()
         
-        for adjustment_entry in self.function_adjustments_data:
-            condition_name = adjustment_entry.get("condition", "")
-            adjustment_type = adjustment_entry.get("adjustment", "")
-            tag = adjustment_entry.get("tag", "")
-            func_type = adjustment_entry.get("type", "")
-            roi_name = adjustment_entry.get("roi", "")
-            description = adjustment_entry.get("description", "")
-            weight = adjustment_entry.get("weight", "")
-            is_constraint = True if adjustment_entry.get("objective_constraint") == "Constraint" else False
-            restrict_all_beams_individually = True if adjustment_entry.get("selected_beam") == "All beams individually" else False
-            restrict_to_beams = [adjustment_entry["selected_beam"]] if adjustment_entry.get("selected_beam") != "All beams individually" and adjustment_entry.get("restrict_to_beam") else []
-            robust = adjustment_entry.get("is_robust", False)
-            beam_set = get_current('BeamSet')
-            restrict_to_beamset = beam_set.DicomPlanLabel if restrict_all_beams_individually or restrict_to_beams != [] else None
+        beam_set = get_current('BeamSet')
+        for adjustment in self.adjustments:
+            condition_name = adjustment.condition
+            adjustment_type = adjustment.adjustment
+            tag = adjustment.tag
+            restrict_to_beamset = beam_set.DicomPlanLabel if adjustment.restricts_beams else None
             
             # Check if condition is met
             condition_met = met_condition.get(condition_name, False)
@@ -77,20 +99,26 @@ class ObjectiveAdjuster:
                 continue
             
             # Condition is met, perform adjustment
+            adjustment_span = self.tracer.open(tag, "adjustment", adjustment=adjustment_type, type=adjustment.type)
             try:
                 # Map ROI name to actual case ROI name
-                actual_roi_name = self.matched_roi_dict.get(roi_name, roi_name)
+                actual_roi_name = self.matched_roi_dict.get(adjustment.roi, adjustment.roi)
                 
                 if adjustment_type == "Add NEW function":
-                    print(f"  Adding new function '{tag}' ({func_type})...", end=" ")
-                    self._add_new_function(tag, func_type, actual_roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
+                    print(f"  Adding new function '{tag}' ({adjustment.type})...", end=" ")
+                    self._add_new_function(adjustment, actual_roi_name, restrict_to_beamset)
                     print("✓")
                     adjusted_count += 1
                     
                 elif adjustment_type == "Adjust OLD Function":
+                    margin = (margins or {}).get(condition_name)
+                    if adjustment.proportional and margin is None:
+                        print(f"  Skipping '{tag}' - Condition '{condition_name}' has no metric value for a proportional adjustment")
+                        skipped_count += 1
+                        continue
                     print(f"  Adjusting existing function '{tag}'...", end=" ")
-                    self._adjust_existing_function(tag, actual_roi_name, func_type, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-                    print("✓")
+                    changed = self._adjust_existing_function(adjustment, actual_roi_name, restrict_to_beamset, margin)
+                    print("✓" if changed else "✓ (already up to date)")
                     adjusted_count += 1
                     
                 else:
@@ -100,484 +128,234 @@ class ObjectiveAdjuster:
             except Exception as e:
                 print(f"✗ Error: {str(e)}")
                 skipped_count += 1
+            finally:
+                adjustment_span.close()
         
         print(f"\nFunction Adjustment Summary: {adjusted_count} adjusted, {skipped_count} skipped")
+        if self.skipped_edits or self.skipped_writes:
+            print(f"  No-op edits skipped: {self.skipped_edits} EditOptimizationFunction, {self.skipped_writes} parameter writes")
         self.check_and_set_robustness()
     
     def check_and_set_robustness(self):
         """
-        Check if any function requires robustness settings and set them if needed.
+        Save the robustness settings if any function is robust and the settings or the set of
+        robust functions changed since they were last saved.
         """
-        requires_robustness = False
-        for c in self.po.Constraints:
-            if c.UseRobustness:
-                requires_robustness = True
-                break
-        for f in self.po.Objective.ConstituentFunctions:
-            if f.UseRobustness:
-                requires_robustness = True
-                break
+        # The robust functions are read from the plan once; afterwards adds and edits keep them up to date
+        if not self.robustness.synced:
+            with self.tracer.span("robust functions", "api"):
+                self.robustness.sync(self.po)
         
-        if requires_robustness:
+        if self.robustness.has_robust_functions:
             print("Setting robustness parameters for plan optimization...", end=" ")
-            self._set_robustness()
-            print("✓")
+            saved = self.robustness.ensure_saved(self.po)
+            print("✓" if saved else "✓ (unchanged, not saved again)")
     
-    def _set_robustness(self):
-        """
-        Placeholder for adding robustness settings if needed.
-        Currently not implemented.
+    def _add_new_function(self, function, roi_name, restrict_to_beamset):
         """
-        self.po.OptimizationParameters.SaveRobustnessParameters(PositionUncertaintyAnterior=self.robust_settings['positioning_uncertainty']['anterior'],
-                                                                        PositionUncertaintyPosterior=self.robust_settings['positioning_uncertainty']['posterior'],
-                                                                        PositionUncertaintySuperior=self.robust_settings['positioning_uncertainty']['superior'],
-                                                                        PositionUncertaintyInferior=self.robust_settings['positioning_uncertainty']['inferior'],
-                                                                        PositionUncertaintyLeft=self.robust_settings['positioning_uncertainty']['left'], 
-                                                                        PositionUncertaintyRight=self.robust_settings['positioning_uncertainty']['right'], 
-                                                                        DensityUncertainty=self.robust_settings['density_uncertainty']/100, 
-                                                                        UseReducedSetOfDensityShifts=False, 
-                                                                        PositionUncertaintySetting="Universal", IndependentLeftRight=True, 
-                                                                        IndependentAnteriorPosterior=True, IndependentSuperiorInferior=True, 
-                                                                        ComputeExactScenarioDoses=False, NamesOfNonPlanningExaminations=[], 
-                                                                        PatientGeometryUncertaintyType="PerTreatmentCourse", 
-                                                                        PositionUncertaintyType="PerTreatmentCourse", 
-                                                                        TreatmentCourseScenariosFactor=1000, 
-                                                                        PositionUncertaintyList=None, 
-                                                                        PositionUncertaintyFormation="Automatic", 
-                                                                        RobustMethodPerTreatmentCourse="WeightedPowerMean" if self.robust_settings.get('method', '') == 'Composite worst cases (minimax)' else "VoxelwiseWorstCase")
-    
-    
-    def _add_new_function(self, tag, func_type, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """
-        Add a new optimization function based on type and description.
+        Add a new optimization function from its parsed adjustment entry.
         
         Args:
-            tag: Unique identifier for the function
-            func_type: Type of function (e.g., "Max Dose", "Min Dose", etc.)
+            function: CompiledFunction of the "Add NEW function" entry
             roi_name: ROI name (already mapped to case name)
-            description: Description string containing parameter values
-            weight: Weight value for the function
-            is_constraint: Whether this is a constraint or objective
-            restrict_all_beams_individually: Whether to restrict to all beams individually
-            restrict_to_beams: List of beam names to restrict to
-            robust: Whether to apply robust optimization
             restrict_to_beamset: BeamSet label for restriction
         """
-        if weight == "":
-            weight = 1.0
-        else:
-            weight = float(weight)
+        tag = function.tag
+        add_optimization_function(self.po, function.spec, tag, roi_name, function.parameters, function.is_constraint,
+                                  function.restrict_all_beams_individually, function.restrict_to_beams, function.robust, restrict_to_beamset)
         
-        # Route to appropriate function based on type
-        if func_type == "Max Dose":
-            self._add_max_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min Dose":
-            self._add_min_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Max EUD":
-            self._add_max_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min EUD":
-            self._add_min_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Target EUD":
-            self._add_target_eud(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Uniform Dose":
-            self._add_uniform_dose(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Dose fall-off":
-            self._add_fall_off(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Max DVH":
-            self._add_max_dvh(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Min DVH":
-            self._add_min_dvh(tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        elif func_type == "Uniformity Constraint":
-            self._add_uniformity_constraint(tag, roi_name, description, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
-        else:
-            raise ValueError(f"Unknown function type: {func_type}")
-    
-    def _adjust_existing_function(self, tag, roi_name, func_type, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+        # New functions are appended to their collection
+        collection = "Constraints" if function.is_constraint else "Objective"
+        self._applied_structures[tag] = (function.spec.function_type, roi_name, function.is_constraint, function.robust,
+                                         function.restrict_all_beams_individually, tuple(function.restrict_to_beams), restrict_to_beamset)
+        self.robustness.mark(tag, function.robust)
+        if self._function_index is not None:
+            position = self._collection_sizes.get(collection, 0)
+            self._collection_sizes[collection] = position + 1
+            self._index_tag(tag, collection, position)
+            if tag in self.duplicate_tags:
+                print(f"✗ Error: function tag '{tag}' is now used by {self.duplicate_tags[tag]} functions", end=" ")
+    
+    def _adjust_existing_function(self, function, roi_name, restrict_to_beamset, margin=None):
         """
         Adjust an existing optimization function by finding it by tag.
-        Updates all parameters based on function type and description.
+        The desired state is compared with the live function: EditOptimizationFunction is only
+        called when function type, ROI, constraint, beam restriction or robustness change, and only
+        the DoseFunctionParameters that differ are written.
         
         Args:
-            tag: Tag of the existing function to adjust
-            func_type: Type of function (e.g., "Max Dose", "Min Dose", etc.)
-            description: Description string containing new parameter values
-            weight: New weight value for the function
-            is_constraint: Whether this is a constraint or objective
-            restrict_all_beams_individually: Whether to restrict to all beams individually
-            restrict_to_beams: List of beam names to restrict to
-            robust: Whether to apply robust optimization
+            function: CompiledFunction of the "Adjust OLD Function" entry
+            roi_name: ROI name (already mapped to case name)
             restrict_to_beamset: BeamSet label for restriction
-        """
-        # Find the function by tag
-        target_function = None
-        for f in self.po.Objective.ConstituentFunctions:
-            if f.Tag == tag:
-                target_function = f
-                break
-        
-        if target_function is None:
-            for f in self.po.Constraints:
-                if f.Tag == tag:
-                    target_function = f
-                    break
-        
-        if target_function is None:
-            raise ValueError(f"Function with tag '{tag}' not found")
+            margin: Relative margin of the condition (proportional adjustments only)
         
-        if weight == "":
-            weight = 1.0
-        else:
-            weight = float(weight)
-        
-        # Edit the function to update basic properties
-        func_type_dict = {
-            "Max Dose": "MaxDose",
-            "Min Dose": "MinDose",
-            "Max EUD": "MaxEud",
-            "Min EUD": "MinEud",
-            "Target EUD": "TargetEud",
-            "Uniform Dose": "UniformDose",
-            "Dose fall-off": "DoseFallOff",
-            "Max DVH": "MaxDvh",
-            "Min DVH": "MinDvh",
-            "Uniformity Constraint": "UniformityConstraint"
-        }
-        actual_func_type = func_type_dict[func_type]
-        self._edit_function(target_function, actual_func_type, roi_name, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset)
+        Returns:
+            True if anything was edited, False if the function was already up to date
+        """
+        tag = function.tag
+        is_constraint = function.is_constraint
         
-        # Find the function by tag AGAIN after editing
-        target_function = None
-        for f in self.po.Objective.ConstituentFunctions:
-            if f.Tag == tag:
-                target_function = f
-                break
+        # Find the function by tag
+        target_function = self._find_function(tag)
+        was_constraint = self._function_index[tag][0] == "Constraints"
         
-        if target_function is None:
-            for f in self.po.Constraints:
-                if f.Tag == tag:
-                    target_function = f
-                    break
+        # Desired state of the function
+        structure = (function.spec.function_type, roi_name, is_constraint, function.robust,
+                     function.restrict_all_beams_individually, tuple(function.restrict_to_beams), restrict_to_beamset)
         
-        # Route to appropriate adjustment based on function type
-        if actual_func_type == "MaxDose":
-            self._adjust_max_dose(target_function, description, weight, is_constraint)
-        elif actual_func_type == "MinDose":
-            self._adjust_min_dose(target_function, description, weight, is_constraint)
-        elif actual_func_type == "MaxEud":
-            self._adjust_max_eud(target_function, description, weight, is_constraint)
-        elif actual_func_type == "MinEud":
-            self._adjust_min_eud(target_function, description, weight, is_constraint)
-        elif actual_func_type == "TargetEud":
-            self._adjust_target_eud(target_function, description, weight, is_constraint)
-        elif actual_func_type == "UniformDose":
-            self._adjust_uniform_dose(target_function, description, weight, is_constraint)
-        elif actual_func_type == "DoseFallOff":
-            self._adjust_fall_off(target_function, description, weight, is_constraint)
-        elif actual_func_type == "MaxDvh":
-            self._adjust_max_dvh(target_function, description, weight, is_constraint)
-        elif actual_func_type == "MinDvh":
-            self._adjust_min_dvh(target_function, description, weight, is_constraint)
+        # Edit the function only if type, ROI, constraint, beam restriction or robustness change
+        edited = not self._structure_matches(tag, target_function, structure, was_constraint)
+        if not edited:
+            self.skipped_edits += 1
         else:
-            print(f"Unknown function type for adjustment: {actual_func_type}")
-    # ========== Helper methods to adjust existing functions ==========
-    
-    def _edit_function(self, target_function, func_type, roi_name, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        self.po.EditOptimizationFunction(FunctionType=func_type, DoseBasedRoiFunction=target_function, 
-                                        RoiName=roi_name, IsConstraint=is_constraint, RestrictAllBeamsIndividually=restrict_all_beams_individually, 
-                                        RestrictToBeams=restrict_to_beams, IsRobust=robust, RestrictToBeamSet=restrict_to_beamset, 
-                                        UseRbeDose=True, UseEqd=False)
-    
-    def _adjust_max_dose(self, target_function, description, weight, is_constraint):
-        """Adjust Max Dose objective parameters."""
-        dose_level = self._extract_dose(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_min_dose(self, target_function, description, weight, is_constraint):
-        """Adjust Min Dose objective parameters."""
-        dose_level = self._extract_dose(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_max_eud(self, target_function, description, weight, is_constraint):
-        """Adjust Max EUD objective parameters."""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        target_function.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_min_eud(self, target_function, description, weight, is_constraint):
-        """Adjust Min EUD objective parameters."""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        target_function.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_target_eud(self, target_function, description, weight, is_constraint):
-        """Adjust Target EUD objective parameters."""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        target_function.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_uniform_dose(self, target_function, description, weight, is_constraint):
-        """Adjust Uniform Dose objective parameters."""
-        dose_level = self._extract_dose(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_fall_off(self, target_function, description, weight, is_constraint):
-        """Adjust Dose Fall-off objective parameters."""
-        high_dose = self._extract_high_dose(description)
-        low_dose = self._extract_low_dose(description)
-        distance = self._extract_distance(description)
-        target_function.DoseFunctionParameters.HighDoseLevel = high_dose
-        target_function.DoseFunctionParameters.LowDoseLevel = low_dose
-        target_function.DoseFunctionParameters.LowDoseDistance = distance
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_max_dvh(self, target_function, description, weight, is_constraint):
-        """Adjust Max DVH objective parameters."""
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            target_function.DoseFunctionParameters.Volume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            target_function.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    def _adjust_min_dvh(self, target_function, description, weight, is_constraint):
-        """Adjust Min DVH objective parameters."""
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
-        target_function.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            target_function.DoseFunctionParameters.Volume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            target_function.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint:
-            target_function.DoseFunctionParameters.Weight = weight
-    
-    
-    
-    # ========== Helper methods to add new functions ==========
-    
-    def _add_max_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Max Dose objective. Description: 'Max Dose 5000 cGy'"""
-        dose_level = self._extract_dose(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MaxDose", RoiName=roi_name, IsConstraint=is_constraint, 
-                                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                                            IsRobust=robust,  RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Min Dose objective. Description: 'Min Dose 3933 cGy'"""
-        dose_level = self._extract_dose(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MinDose", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_max_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Max EUD objective. Description: 'Max EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MaxEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Min EUD objective. Description: 'Min EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="MinEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_target_eud(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Target EUD objective. Description: 'Target EUD 2500 cGy, Parameter A 1'"""
-        dose_level = self._extract_dose(description)
-        eud_parameter = self._extract_parameter_a(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="TargetEud", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        o.DoseFunctionParameters.EudParameterA = eud_parameter
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_uniform_dose(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Uniform Dose objective. Description: 'Uniform Dose 4140 cGy'"""
-        dose_level = self._extract_dose(description)
+            self._edit_function(target_function, function.spec.function_type, roi_name, is_constraint,
+                                function.restrict_all_beams_individually, function.restrict_to_beams, function.robust, restrict_to_beamset)
+            self._applied_structures[tag] = structure
+            self.robustness.mark(tag, function.robust)
+            
+            # Find the function by tag AGAIN after editing (the edit replaces the function object;
+            # moving it between objectives and constraints shifts positions, so the index is rebuilt)
+            if is_constraint != was_constraint:
+                self._build_function_index()
+            target_function = self._find_function(tag)
         
-        o = self.po.AddOptimizationFunction(FunctionType="UniformDose", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
+        parameters = function.parameters
+        if function.proportional:
+            parameters = self._proportional_parameters(target_function, function, margin)
+        return self._apply_parameters(target_function, parameters) > 0 or edited
     
-    def _add_fall_off(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+    def _proportional_parameters(self, target_function, function, margin):
         """
-        Add Dose Fall-off objective.
-        Description: 'Dose fall-off [H] 4140 cGy [L] 2070 cGy, Low dose distance 1.5 cm'
+        Parameters of a proportional adjustment: the description values, with the weight or dose level
+        scaled from its live value by the condition margin.
         """
-        high_dose = self._extract_high_dose(description)
-        low_dose = self._extract_low_dose(description)
-        distance = self._extract_distance(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="DoseFallOff", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.HighDoseLevel = high_dose
-        o.DoseFunctionParameters.LowDoseLevel = low_dose
-        o.DoseFunctionParameters.LowDoseDistance = distance
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_max_dvh(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+        rule = function.proportional
+        parameters = dict(function.parameters)
+        try:
+            current = float(getattr(target_function.DoseFunctionParameters, rule.attribute))
+        except Exception:
+            current = parameters[rule.attribute]
+        parameters[rule.attribute] = rule.next_value(current, margin)
+        print(f"({rule.attribute} {current:g} → {parameters[rule.attribute]:g}, margin {margin:+.1%})", end=" ")
+        return parameters
+    
+    def _structure_matches(self, tag, target_function, structure, was_constraint):
         """
-        Add Max DVH objective.
-        Description: 'Max DVH 500 cGy to 70% volume' or 'Max DVH 500 cGy to 0.1cc volume'
+        True if the live function already has the desired type, ROI, constraint, robustness and beam restriction.
+        Type, ROI, constraint and robustness are read from the function. The beam restriction is compared with
+        what this flow last applied to the tag; for a tag the flow has not edited yet, only a restriction to
+        no beam or a single beam can be read (ForBeam), so "All beams individually" is always edited once.
         """
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
+        function_type, roi_name, is_constraint, robust, all_beams, beams, beamset = structure
+        try:
+            live = (target_function.DoseFunctionParameters.FunctionType, target_function.ForRegionOfInterest.Name,
+                    was_constraint, bool(target_function.UseRobustness))
+        except Exception:
+            return False
+        if live != (function_type, roi_name, is_constraint, bool(robust)):
+            return False
         
-        o = self.po.AddOptimizationFunction(FunctionType="MaxDvh", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            o.DoseFunctionParameters.Volume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            o.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_min_dvh(self, tag, roi_name, description, weight, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+        applied = self._applied_structures.get(tag)
+        if applied is not None:
+            return applied[4:] == structure[4:]
+        if all_beams:
+            return False
+        try:
+            live_beam = getattr(target_function, "ForBeam", None)
+            live_beams = (live_beam.Name,) if live_beam is not None else ()
+        except Exception:
+            return False
+        return live_beams == beams
+    
+    def _apply_parameters(self, target_function, desired_parameters):
         """
-        Add Min DVH objective.
-        Description: 'Min DVH 500 cGy to 70% volume' or 'Min DVH 500 cGy to 0.1cc volume'
-        """
-        dose_level = self._extract_dose(description)
-        is_absolute_volume = self._extract_is_absolute_volume(description)
+        Write the dose function parameters that differ from the live values.
         
-        o = self.po.AddOptimizationFunction(FunctionType="MinDvh", RoiName=roi_name, IsConstraint=is_constraint,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.DoseLevel = dose_level
-        if is_absolute_volume:
-            absolute_volume = self._extract_absolute_volume(description)
-            o.DoseFunctionParameters.Volume = absolute_volume
-        else:
-            percent_volume = self._extract_percent_volume(description)
-            o.DoseFunctionParameters.PercentVolume = percent_volume
-        if not is_constraint: o.DoseFunctionParameters.Weight = weight
-        o.Tag = tag
-    
-    def _add_uniformity_constraint(self, tag, roi_name, description, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
-        """Add Uniformity Constraint objective. Description: 'Uniformity Constraint Rel.std.dev 1 %'"""
-        rel_std_dev = self._extract_rel_std_dev(description)
-        
-        o = self.po.AddOptimizationFunction(FunctionType="UniformityConstraint", RoiName=roi_name, IsConstraint=True,
-                            RestrictAllBeamsIndividually=restrict_all_beams_individually, RestrictToBeams=restrict_to_beams,
-                            IsRobust=robust, RestrictToBeamSet=restrict_to_beamset)
-        o.DoseFunctionParameters.PercentStdDeviation = rel_std_dev
-        o.Tag = tag
-    
-    # ========== Helper methods to extract values from descriptions ==========
-    
-    def _extract_dose(self, description):
-        """Extract dose value from description (e.g., '5000 cGy' -> 5000)"""
-        match = re.search(r'(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract dose from: {description}")
-    
-    def _extract_parameter_a(self, description):
-        """Extract Parameter A from description (e.g., 'Parameter A 1' -> 1)"""
-        match = re.search(r'Parameter A\s+(\d+\.?\d*)', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract Parameter A from: {description}")
-    
-    def _extract_high_dose(self, description):
-        """Extract high dose from fall-off description (e.g., '[H] 4140 cGy' -> 4140)"""
-        match = re.search(r'\[H\]\s*(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract high dose from: {description}")
-    
-    def _extract_low_dose(self, description):
-        """Extract low dose from fall-off description (e.g., '[L] 2070 cGy' -> 2070)"""
-        match = re.search(r'\[L\]\s*(\d+\.?\d*)\s*cGy', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract low dose from: {description}")
+        Returns:
+            Number of parameters written
+        """
+        parameters = target_function.DoseFunctionParameters
+        written = 0
+        for name, value in desired_parameters.items():
+            try:
+                current = float(getattr(parameters, name))
+            except Exception:
+                current = None
+            if current is not None and abs(current - value) <= 1e-6 * max(1.0, abs(value)):
+                self.skipped_writes += 1
+                continue
+            setattr(parameters, name, value)
+            written += 1
+        return written
     
-    def _extract_distance(self, description):
-        """Extract distance from fall-off description (e.g., 'Low dose distance 1.5 cm' -> 1.5)"""
-        match = re.search(r'Low dose distance\s+(\d+\.?\d*)\s*cm', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract distance from: {description}")
+    # ========== Tag index of optimization functions ==========
     
-    def _extract_percent_volume(self, description):
-        """Extract percent volume from DVH description (e.g., 'to 70% volume' -> 70)"""
-        match = re.search(r'to\s+(\d+\.?\d*)\s*%', description)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract percent volume from: {description}")
+    def _collection(self, collection):
+        """Objective constituent functions ("Objective") or constraints ("Constraints") of the plan optimization."""
+        if collection == "Objective":
+            return self.po.Objective.ConstituentFunctions
+        return self.po.Constraints
     
-    def _extract_is_absolute_volume(self, description):
-        """Check if volume is absolute (cc) or relative (%)"""
-        return 'cc' in description.lower() and '%' not in description
+    def _build_function_index(self):
+        """
+        Index all optimization functions by tag with one pass over objectives and constraints.
+        Tags used by more than one function are reported; adjusting them fails instead of picking the first match.
+        """
+        self._function_index = {}
+        self._collection_sizes = {}
+        self.duplicate_tags = {}
+        with self.tracer.span("Index optimization functions", "api"):
+            for collection in ("Objective", "Constraints"):
+                size = 0
+                for position, function in enumerate(self._collection(collection)):
+                    self._index_tag(function.Tag, collection, position)
+                    size = position + 1
+                self._collection_sizes[collection] = size
+        for tag, count in self.duplicate_tags.items():
+            print(f"  ✗ Error: function tag '{tag}' is used by {count} functions - it cannot be adjusted")
+    
+    def _index_tag(self, tag, collection, position):
+        if not tag:
+            return
+        if tag in self._function_index:
+            self.duplicate_tags[tag] = self.duplicate_tags.get(tag, 1) + 1
+        else:
+            self._function_index[tag] = (collection, position)
+    
+    def _function_at(self, tag):
+        """Function at the indexed position of tag, or None if the index is stale."""
+        collection, position = self._function_index[tag]
+        try:
+            function = self._collection(collection)[position]
+        except Exception:
+            return None
+        return function if function.Tag == tag else None
+    
+    def _find_function(self, tag):
+        """
+        Look up an optimization function by tag through the index (rebuilt once if it is stale).
+        
+        Raises:
+            ValueError: If no function or more than one function has this tag
+        """
+        if self._function_index is None:
+            self._build_function_index()
+        for attempt in range(2):
+            if tag in self.duplicate_tags:
+                raise ValueError(f"Function tag '{tag}' is not unique ({self.duplicate_tags[tag]} functions)")
+            if tag in self._function_index:
+                function = self._function_at(tag)
+                if function is not None:
+                    return function
+            if attempt == 0:
+                # Functions changed outside the index (e.g. added or removed by another step)
+                self._build_function_index()
+        raise ValueError(f"Function with tag '{tag}' not found")
     
-    def _extract_absolute_volume(self, description):
-        """Extract absolute volume from DVH description (e.g., 'to 0.1cc volume' -> 0.1)"""
-        match = re.search(r'to\s+(\d+\.?\d*)\s*cc', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract absolute volume from: {description}")
+    # ========== Helper methods to adjust existing functions ==========
     
-    def _extract_rel_std_dev(self, description):
-        """Extract relative standard deviation from Uniformity Constraint description (e.g., 'Rel.std.dev 1 %' -> 1)"""
-        match = re.search(r'Rel\.std\.dev\s+(\d+\.?\d*)\s*%', description, re.IGNORECASE)
-        if match:
-            return float(match.group(1))
-        raise ValueError(f"Could not extract relative standard deviation from: {description}")
+    def _edit_function(self, target_function, func_type, roi_name, is_constraint, restrict_all_beams_individually, restrict_to_beams, robust, restrict_to_beamset):
+        self.po.EditOptimizationFunction(FunctionType=func_type, DoseBasedRoiFunction=target_function, 
+                                        RoiName=roi_name, IsConstraint=is_constraint, RestrictAllBeamsIndividually=restrict_all_beams_individually, 
+                                        RestrictToBeams=restrict_to_beams, IsRobust=robust, RestrictToBeamSet=restrict_to_beamset, 
+                                        UseRbeDose=True, UseEqd=False)
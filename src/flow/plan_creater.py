@@ -1,4 +1,5 @@
 from tkinter import messagebox
+from src.flow.checkpoint_policy import CheckpointPolicy
 try:
     from raystation import *
     import raystation.v2025 as rs
@@ -11,7 +12,7 @@ except:
 class PlanCreater:
     """Create a plan and add beams based on loaded flow data."""
     
-    def __init__(self, loaded_flow_data, case, examination, matched_roi_dict):
+    def __init__(self, loaded_flow_data, case, examination, matched_roi_dict, checkpoint=None, interactive=True, journal=None):
         """
         Initialize PlanCreater with flow data and case.
         
@@ -19,10 +20,16 @@ class PlanCreater:
             loaded_flow_data: Dictionary containing all workflow configuration
             case: RayStation case object
             examination_name: Name of the RayStation examination
+            checkpoint: CheckpointPolicy deciding when to save (default: save every step)
+            interactive: If False, errors are raised instead of shown in a message box
+            journal: RunJournal recording the saves (optional)
         """
         self.flow_data = loaded_flow_data
         self.case = case
         self.patient = get_current('Patient')
+        self.checkpoint = checkpoint if checkpoint is not None else CheckpointPolicy(self.patient)
+        self.interactive = interactive
+        self.journal = journal
         self.plan = None
         self.beam_set = None
         self.examination = examination
@@ -39,18 +46,32 @@ class PlanCreater:
         self.isocenter_data = loaded_flow_data.get("isocenter_data", {})
         self.prescription_data = loaded_flow_data.get("prescription_data", {})
         
+    def _show_error(self, title, message):
+        """Show an error message box, or raise when running non-interactively."""
+        if self.interactive:
+            messagebox.showerror(title, message)
+        else:
+            raise RuntimeError(f"{title}: {message}")
+    
+    def _checkpoint(self, step_name, force=False):
+        """Checkpoint after a plan creation step and record a save in the run journal."""
+        saved = self.checkpoint.force(step_name) if force else self.checkpoint.step_done(step_name)
+        if saved and self.journal is not None:
+            self.journal.record_saved()
+        return saved
+    
     def validate_prerequisites(self):
         """Check if examination and structure set are available."""
         try:
             # Get current examination
             if not self.examination:
-                messagebox.showerror("No Examination", "Please open an examination before creating a plan.")
+                self._show_error("No Examination", "Please open an examination before creating a plan.")
                 return False
             
             examination_name = self.examination.Name
             print(f"Using examination: {examination_name}")
         except:
-            messagebox.showerror("No Examination", "Please open an examination before creating a plan.")
+            self._show_error("No Examination", "Please open an examination before creating a plan.")
             return False
         
         try:
@@ -58,11 +79,11 @@ class PlanCreater:
             examination_name = self.examination.Name
             self.structure_set = self.case.PatientModel.StructureSets[examination_name]
             if not self.structure_set:
-                messagebox.showerror("No Structure Set", f"No structure set found for examination '{examination_name}'.")
+                self._show_error("No Structure Set", f"No structure set found for examination '{examination_name}'.")
                 return False
             print(f"Using structure set for: {examination_name}\n")
         except:
-            messagebox.showerror("No Structure Set", f"Please create a structure set for the current examination.")
+            self._show_error("No Structure Set", f"Please create a structure set for the current examination.")
             return False
         
         return True
@@ -86,7 +107,7 @@ class PlanCreater:
             return True
             
         except Exception as e:
-            messagebox.showerror("Plan Creation Error", f"Failed to create plan:\n{str(e)}")
+            self._show_error("Plan Creation Error", f"Failed to create plan:\n{str(e)}")
             return False
     
     def create_beam_set(self):
@@ -122,7 +143,8 @@ class PlanCreater:
                 UseUserSelectedIsocenterSetupIsocenter=False
             )
             
-            self.patient.Save()
+            # The new plan and beam set must be saved before they can be set current
+            self._checkpoint("Create Beam Set", force=True)
             self.plan.SetCurrent()
             self.beam_set.SetCurrent()
             
@@ -130,7 +152,7 @@ class PlanCreater:
             return True
             
         except Exception as e:
-            messagebox.showerror("Beam Set Creation Error", f"Failed to create beam set:\n{str(e)}")
+            self._show_error("Beam Set Creation Error", f"Failed to create beam set:\n{str(e)}")
             return False
     
     def add_prescription(self):
@@ -165,7 +187,7 @@ class PlanCreater:
             return True
             
         except Exception as e:
-            messagebox.showerror("Prescription Error", f"Failed to add prescription:\n{str(e)}")
+            self._show_error("Prescription Error", f"Failed to add prescription:\n{str(e)}")
             return False
     
     def set_isocenter(self):
@@ -207,7 +229,7 @@ class PlanCreater:
             # Create isocenter data
             self.iso_data = self.beam_set.CreateDefaultIsocenterData(Position=isocenter_position)
             
-            self.patient.Save()
+            self._checkpoint("Set Isocenter", force=True)
             self.plan.SetCurrent()
             self.beam_set.SetCurrent()
             
@@ -215,7 +237,7 @@ class PlanCreater:
             return True
             
         except Exception as e:
-            messagebox.showerror("Isocenter Error", f"Failed to set isocenter:\n{str(e)}")
+            self._show_error("Isocenter Error", f"Failed to set isocenter:\n{str(e)}")
             return False
     
     def add_vmat_beams(self):
@@ -228,7 +250,7 @@ class PlanCreater:
                 return True
             
             if not self.iso_data:
-                messagebox.showerror("Isocenter Error", "Isocenter must be set before adding beams")
+                self._show_error("Isocenter Error", "Isocenter must be set before adding beams")
                 return False
             
             for idx, beam_config in enumerate(self.vmat_beam_data):
@@ -277,12 +299,12 @@ class PlanCreater:
             # Edit setup beam names
             self.edit_setup_beams()
             
-            self.patient.Save()
+            self._checkpoint("Add VMAT Beams")
             print("All VMAT beams added successfully")
             return True
             
         except Exception as e:
-            messagebox.showerror("Beam Addition Error", f"Failed to add VMAT beams:\n{str(e)}")
+            self._show_error("Beam Addition Error", f"Failed to add VMAT beams:\n{str(e)}")
             return False
     
     def add_impt_beams(self):
@@ -295,7 +317,7 @@ class PlanCreater:
                 return True
             
             if not self.iso_data:
-                messagebox.showerror("Isocenter Error", "Isocenter must be set before adding beams")
+                self._show_error("Isocenter Error", "Isocenter must be set before adding beams")
                 return False
             
             for idx, beam_config in enumerate(self.impt_beam_data):
@@ -393,12 +415,12 @@ class PlanCreater:
             # Edit setup beam names
             self.edit_setup_beams()
             
-            self.patient.Save()
+            self._checkpoint("Add IMPT Beams")
             print("All IMPT beams added successfully")
             return True
             
         except Exception as e:
-            messagebox.showerror("Beam Addition Error", f"Failed to add IMPT beams:\n{str(e)}")
+            self._show_error("Beam Addition Error", f"Failed to add IMPT beams:\n{str(e)}")
             return False
     
     def edit_setup_beams(self):
@@ -455,7 +477,7 @@ class PlanCreater:
             if not self.add_impt_beams():
                 return False
         else:
-            messagebox.showerror("Unknown Technique", f"Unknown technique: {self.technique}")
+            self._show_error("Unknown Technique", f"Unknown technique: {self.technique}")
             return False
         
         print("Plan created successfully with all beams!")
@@ -0,0 +1,90 @@
+import json
+
+from src.flow.tracer import NULL_TRACER
+
+
+class RobustnessSettingsManager:
+    """
+    Robustness parameters of the plan optimization, shared by ObjectiveAdder and ObjectiveAdjuster.
+    Tracks which function tags are robust and what was last saved, so SaveRobustnessParameters is
+    called once, and again only when the robust settings or the set of robust functions change.
+    """
+
+    def __init__(self, robust_settings, tracer=None):
+        """
+        Initialize the manager.
+
+        Args:
+            robust_settings: Dictionary of robustness settings from flow JSON
+            tracer: Optional SpanTracer for API call timing
+        """
+        self.robust_settings = robust_settings or {}
+        self.tracer = tracer or NULL_TRACER
+        self.robust_tags = set()  # tags of the robust optimization functions
+        self.synced = False  # robust_tags was read from the plan
+        self._saved_state = None  # (settings, robust tags) of the last save
+        self.saves = 0
+        self.skipped_saves = 0
+
+    def mark(self, tag, robust):
+        """Record whether the function with this tag is robust (after adding or editing it)."""
+        if robust:
+            self.robust_tags.add(tag)
+        else:
+            self.robust_tags.discard(tag)
+
+    def sync(self, po):
+        """Read the robust functions from the plan optimization (once, e.g. when a run resumes)."""
+        self.robust_tags = {function.Tag for function in po.Constraints if function.UseRobustness}
+        self.robust_tags.update(function.Tag for function in po.Objective.ConstituentFunctions if function.UseRobustness)
+        self.synced = True
+
+    @property
+    def has_robust_functions(self):
+        return bool(self.robust_tags)
+
+    def _state(self):
+        return (json.dumps(self.robust_settings, sort_keys=True), frozenset(self.robust_tags))
+
+    def ensure_saved(self, po):
+        """
+        Save the robustness parameters if they are needed and changed.
+
+        Args:
+            po: RayStation plan optimization
+
+        Returns:
+            True if SaveRobustnessParameters was called
+        """
+        if not self.has_robust_functions:
+            return False
+        state = self._state()
+        if state == self._saved_state:
+            self.skipped_saves += 1
+            return False
+        with self.tracer.span("SaveRobustnessParameters", "api"):
+            po.OptimizationParameters.SaveRobustnessParameters(**self.save_parameters())
+        self._saved_state = state
+        self.saves += 1
+        return True
+
+    def save_parameters(self):
+        """Keyword arguments of SaveRobustnessParameters for the robust settings."""
+        positioning = self.robust_settings['positioning_uncertainty']
+        return dict(PositionUncertaintyAnterior=positioning['anterior'],
+                    PositionUncertaintyPosterior=positioning['posterior'],
+                    PositionUncertaintySuperior=positioning['superior'],
+                    PositionUncertaintyInferior=positioning['inferior'],
+                    PositionUncertaintyLeft=positioning['left'],
+                    PositionUncertaintyRight=positioning['right'],
+                    DensityUncertainty=self.robust_settings['density_uncertainty']/100,
+                    UseReducedSetOfDensityShifts=False,
+                    PositionUncertaintySetting="Universal", IndependentLeftRight=True,
+                    IndependentAnteriorPosterior=True, IndependentSuperiorInferior=True,
+                    ComputeExactScenarioDoses=False, NamesOfNonPlanningExaminations=[],
+                    PatientGeometryUncertaintyType="PerTreatmentCourse",
+                    PositionUncertaintyType="PerTreatmentCourse",
+                    TreatmentCourseScenariosFactor=1000,
+                    PositionUncertaintyList=None,
+                    PositionUncertaintyFormation="Automatic",
+                    RobustMethodPerTreatmentCourse="WeightedPowerMean" if self.robust_settings.get('method', '') == 'Composite worst cases (minimax)' else "VoxelwiseWorstCase")
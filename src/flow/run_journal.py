@@ -0,0 +1,129 @@
+import json
+import os
+from datetime import datetime
+
+
+class RunJournal:
+    """
+    Append-only run journal (JSON lines) written next to the flow file.
+    Records finished steps, the matched ROI dictionary, the plan name and completed loop rounds,
+    so an interrupted StartFlow run can be resumed from the first unfinished step or round.
+    Only events followed by a "saved" event are considered durable when the journal is loaded.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the run journal.
+
+        Args:
+            path: Path of the .journal.jsonl file (None disables journaling)
+        """
+        self.path = path
+
+    @staticmethod
+    def journal_path(base_dir, flow_name, plan_name):
+        """Return the journal file path for a flow and plan, e.g. 'Esophagus_4140_Plan1.journal.jsonl'."""
+        safe_name = f"{flow_name}_{plan_name}".replace(" ", "_").replace("/", "_").replace("\\", "_")
+        return os.path.join(base_dir, f"{safe_name}.journal.jsonl")
+
+    def start(self, flow_name, plan_name, machine, patient_id, case_name, examination_name, selected_steps):
+        """Start a new journal, overwriting any previous run for the same flow and plan."""
+        if self.path is None:
+            return
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self._write("start", flow_name=flow_name, plan_name=plan_name, machine=machine, patient_id=patient_id,
+                    case_name=case_name, examination_name=examination_name, selected_steps=selected_steps)
+
+    def resume(self):
+        """Mark that the following events belong to a resumed run."""
+        self._write("resume")
+
+    def record_plan_name(self, plan_name):
+        """Record the plan name actually used (e.g. when an existing plan was selected)."""
+        self._write("plan_name", plan_name=plan_name)
+
+    def record_match_roi(self, match_roi_dict):
+        """Record the matched ROI dictionary."""
+        self._write("match_roi", match_roi_dict=match_roi_dict)
+
+    def record_step(self, step_key):
+        """Record a finished flow step (key as used in selected_steps)."""
+        self._write("step", step=step_key)
+
+    def record_round(self, round_number):
+        """Record a finished optimization loop round."""
+        self._write("round", round=round_number)
+
+    def record_saved(self):
+        """Record that the patient was saved; all previous events are now durable."""
+        self._write("saved")
+
+    def record_finished(self):
+        """Record that the flow ran to the end."""
+        self._write("finished")
+
+    def load(self):
+        """
+        Read the journal and return the resumable state.
+
+        Returns:
+            Dictionary with keys flow_name, plan_name, machine, patient_id, case_name, examination_name,
+            selected_steps, match_roi_dict, completed_steps, last_round and finished,
+            or None if the journal does not exist or has no start event
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+
+        events = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A crash can leave a partially written last line
+                    break
+
+        if not events or events[0].get("event") != "start":
+            return None
+
+        # Only trust events up to the last patient save
+        last_saved = max((i for i, e in enumerate(events) if e["event"] in ("saved", "finished")), default=0)
+        state = {
+            "flow_name": events[0].get("flow_name"),
+            "plan_name": events[0].get("plan_name"),
+            "machine": events[0].get("machine"),
+            "patient_id": events[0].get("patient_id"),
+            "case_name": events[0].get("case_name"),
+            "examination_name": events[0].get("examination_name"),
+            "selected_steps": events[0].get("selected_steps", {}),
+            "match_roi_dict": None,
+            "completed_steps": [],
+            "last_round": 0,
+            "finished": False
+        }
+        for event in events[1:last_saved + 1]:
+            if event["event"] == "plan_name":
+                state["plan_name"] = event["plan_name"]
+            elif event["event"] == "match_roi":
+                state["match_roi_dict"] = event["match_roi_dict"]
+            elif event["event"] == "step" and event["step"] not in state["completed_steps"]:
+                state["completed_steps"].append(event["step"])
+            elif event["event"] == "round":
+                state["last_round"] = max(state["last_round"], event["round"])
+            elif event["event"] == "finished":
+                state["finished"] = True
+        return state
+
+    def _write(self, event, **data):
+        if self.path is None:
+            return
+        record = {"event": event, "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        record.update(data)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
@@ -9,7 +9,9 @@ except:
     from connect import *
 
 class MatchROI:
-    def __init__(self, match_roi_data, case):
+    UNMATCHED_POLICIES = ["ask", "skip", "fail"]
+    
+    def __init__(self, match_roi_data, case, unmatched_policy="ask"):
         """
         Initialize the MatchROI class.
         
@@ -17,9 +19,13 @@ class MatchROI:
             match_roi_data: List of dictionaries with structure:
                 [{"roi_name": "PTV_4140", "possible_roi_name": "PTV, PTV4140, PTV41.4"}, ...]
             case: RayStation case object
+            unmatched_policy: What to do with unmatched ROIs:
+                "ask" opens the manual match window, "skip" leaves them unmatched,
+                "fail" raises a ValueError (used for non-interactive batch runs)
         """
         self.match_roi_data = match_roi_data
         self.case = case
+        self.unmatched_policy = unmatched_policy
         self.matched_dict = {}
         self.has_unmatched = False
         
@@ -68,9 +74,15 @@ class MatchROI:
         # First, perform automatic matching
         self.auto_match()
         
-        # If there are unmatched ROIs, open GUI
+        # If there are unmatched ROIs, open GUI (or apply the non-interactive policy)
         if self.has_unmatched:
-            self._open_match_window()
+            unmatched_rois = [k for k, v in self.matched_dict.items() if v is None]
+            if self.unmatched_policy == "fail":
+                raise ValueError(f"Unmatched ROIs: {', '.join(unmatched_rois)}")
+            elif self.unmatched_policy == "skip":
+                print(f"⚠️ Unmatched ROIs skipped: {', '.join(unmatched_rois)}")
+            else:
+                self._open_match_window()
         else:
             print("✅ All ROIs are MATCHED")
         
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Span:
+    """One timed span of a SpanTracer (start/end in seconds from the tracer start)."""
+
+    __slots__ = ("name", "category", "start", "end", "depth", "parent", "args", "thread", "_tracer")
+
+    def __init__(self, tracer, name, category, start, depth, parent, args, thread=1):
+        self._tracer = tracer
+        self.thread = thread
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = None
+        self.depth = depth
+        self.parent = parent
+        self.args = args
+
+    @property
+    def duration(self):
+        """Duration in seconds (up to now if the span is still open)."""
+        end = self.end if self.end is not None else self._tracer.now()
+        return end - self.start
+
+    def close(self):
+        """
+        End the span.
+
+        Returns:
+            Duration of the span in seconds
+        """
+        self._tracer.close(self)
+        return self.duration
+
+
+class SpanTracer:
+    """
+    Hierarchical timing of a planning flow: flow → step → loop round → condition/adjustment/optimization → API call.
+    Spans are measured with time.perf_counter() and can be exported as Chrome trace-event JSON,
+    which opens as a flame chart in chrome://tracing or https://ui.perfetto.dev.
+    Each thread has its own span stack; spans opened in worker threads nest under the span
+    that is open in the main thread.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Initialize the tracer.
+
+        Args:
+            enabled: If False, spans are not recorded (used as the default for flow classes)
+        """
+        self.enabled = enabled
+        self.spans = []
+        self._main_stack = []
+        self._main_thread = threading.get_ident()
+        self._local = threading.local()
+        self._thread_ids = {self._main_thread: 1}
+        self._origin = time.perf_counter()
+
+    @property
+    def _stack(self):
+        # Open spans of the calling thread
+        if threading.get_ident() == self._main_thread:
+            return self._main_stack
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def now(self):
+        """Seconds since the tracer was created."""
+        return time.perf_counter() - self._origin
+
+    def open(self, name, category="step", **args):
+        """
+        Open a span nested in the currently open span. Close it with span.close().
+
+        Args:
+            name: Span name, e.g. "Loop 3" or "GetDoseStatistic"
+            category: "flow", "step", "round", "condition", "roi", "adjustment", "optimization" or "api"
+            args: Extra values shown in the trace viewer
+        """
+        stack = self._stack
+        if stack:
+            parent = stack[-1]
+        else:
+            parent = self._main_stack[-1] if self._main_stack else None
+        thread = self._thread_ids.setdefault(threading.get_ident(), len(self._thread_ids) + 1)
+        span = Span(self, name, category, self.now(), parent.depth + 1 if parent else 0, parent, args, thread)
+        if self.enabled:
+            self.spans.append(span)
+            stack.append(span)
+        return span
+
+    def close(self, span):
+        """Close a span and any spans still open inside it."""
+        if span.end is not None:
+            return
+        span.end = self.now()
+        stack = self._stack
+        if span in stack:
+            while stack:
+                inner = stack.pop()
+                if inner.end is None:
+                    inner.end = span.end
+                if inner is span:
+                    break
+
+    @contextmanager
+    def span(self, name, category="step", **args):
+        """Context manager version of open()/close()."""
+        span = self.open(name, category, **args)
+        try:
+            yield span
+        finally:
+            span.close()
+
+    def current(self, category=None):
+        """Innermost open span (of the given category), or None. Worker threads also see the main thread's spans."""
+        stack = self._stack
+        spans = stack if stack is self._main_stack else self._main_stack + stack
+        for span in reversed(spans):
+            if category is None or span.category == category:
+                return span
+        return None
+
+    def close_all(self):
+        """Close all open spans (e.g. after an error)."""
+        if self._main_stack:
+            self.close(self._main_stack[0])
+
+    def totals(self, category="step"):
+        """
+        Total duration per span name for one category, in first-seen order.
+
+        Returns:
+            Dictionary like {"Create Plan and Beams": 12.3, "Loop Optimization": 845.1}
+        """
+        result = {}
+        for span in self.spans:
+            if span.category == category:
+                result[span.name] = result.get(span.name, 0.0) + span.duration
+        return result
+
+    def breakdown(self, parent, max_depth=2):
+        """
+        Aggregate the children of a span by name, recursively.
+
+        Returns:
+            List of (depth, name, count, total_seconds) tuples, depth 1 for direct children
+        """
+        rows = []
+        self._collect_breakdown(parent, 1, max_depth, rows)
+        return rows
+
+    def _collect_breakdown(self, parents, depth, max_depth, rows):
+        if not isinstance(parents, list):
+            parents = [parents]
+        groups = {}
+        for span in self.spans:
+            if span.parent in parents:
+                key = self._group_name(span)
+                groups.setdefault(key, []).append(span)
+        for name, spans in groups.items():
+            rows.append((depth, name, len(spans), sum(s.duration for s in spans)))
+            if depth < max_depth:
+                self._collect_breakdown(spans, depth + 1, max_depth, rows)
+
+    @staticmethod
+    def _group_name(span):
+        # Loop rounds are grouped together ("Loop 1", "Loop 2" -> "Loop")
+        if span.category == "round":
+            return "Loop round"
+        return span.name
+
+    def export_chrome_trace(self, path):
+        """
+        Write all spans as Chrome trace-event JSON (complete "X" events, microseconds).
+
+        Returns:
+            The path written
+        """
+        self.close_all()
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round(span.start * 1e6, 3),
+                "dur": round(span.duration * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": span.thread,
+                "args": {k: str(v) for k, v in span.args.items()}
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return path
+
+
+# Shared disabled tracer, used when no tracer is passed to a flow class
+NULL_TRACER = SpanTracer(enabled=False)
@@ -0,0 +1,77 @@
+class UINavigator:
+    """
+    Switch RayStation modules and tabs only when the UI is not already there.
+    Resolves whether the navigation menu lives under ui.Navigation or ui.TitleBar.Navigation
+    once per session, and can run fully headless (no UI navigation at all) for batch runs.
+    """
+
+    def __init__(self, ui, headless=False):
+        """
+        Initialize the UI navigator.
+
+        Args:
+            ui: RayStation ui object from get_current("ui")
+            headless: If True, all navigation calls are skipped
+        """
+        self.ui = ui
+        self.headless = headless
+        self._navigation = None
+        self.current_module = None
+        self.selected_tabs = {}
+        self.click_count = 0
+        self.skipped_count = 0
+
+    def _get_navigation(self):
+        """Resolve the navigation menu variant once and cache it."""
+        if self._navigation is None:
+            try:
+                self._navigation = self.ui.Navigation
+                self._navigation.MenuItem  # RayStation versions without ui.Navigation raise here
+            except Exception:
+                self._navigation = self.ui.TitleBar.Navigation
+        return self._navigation
+
+    def go_to(self, menu, sub_menu):
+        """
+        Open a module, e.g. go_to('Plan design', 'Plan setup').
+
+        Returns:
+            True if the module was switched, False if no click was needed
+        """
+        if self.headless or self.current_module == (menu, sub_menu):
+            self.skipped_count += 1
+            return False
+
+        navigation = self._get_navigation()
+        navigation.MenuItem[menu].Click()
+        navigation.MenuItem[menu].Popup.MenuItem[sub_menu].Click()
+        self.current_module = (menu, sub_menu)
+        # Tabs are re-rendered when the module changes
+        self.selected_tabs = {}
+        self.click_count += 1
+        return True
+
+    def select_workspace_tab(self, tab_control, tab_item):
+        """Select a tab in ui.Workspace.TabControl, e.g. ('DVH', 'Clinical goals')."""
+        return self._select_tab(("Workspace", tab_control), tab_item,
+                                lambda: self.ui.Workspace.TabControl[tab_control].TabItem[tab_item].Select())
+
+    def select_tool_panel_tab(self, tab_item):
+        """Select a tab in ui.ToolPanel, e.g. 'ROIs'."""
+        return self._select_tab(("ToolPanel",), tab_item,
+                                lambda: self.ui.ToolPanel.TabItem[tab_item].Select())
+
+    def _select_tab(self, container, tab_item, select):
+        if self.headless or self.selected_tabs.get(container) == tab_item:
+            self.skipped_count += 1
+            return False
+
+        select()
+        self.selected_tabs[container] = tab_item
+        self.click_count += 1
+        return True
+
+    def summary(self):
+        """Return a one-line summary of UI switches performed and skipped."""
+        mode = "headless" if self.headless else "interactive"
+        return f"{self.click_count} switches, {self.skipped_count} skipped [{mode}]"
@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
+from src.flow.condition_compiler import quote_condition_name
 
 class CheckCondition_Window:
     """Open a new window for Check Condition step."""
@@ -20,7 +21,7 @@ class CheckCondition_Window:
         
         condition_tree_scroll_y = ttk.Scrollbar(condition_tree_frame, orient="vertical")
         
-        self.condition_tree = ttk.Treeview(condition_tree_frame, columns=("Condition Name", "ROI",  "Active Round","Condition Type", "Criteria"), show="headings",
+        self.condition_tree = ttk.Treeview(condition_tree_frame, columns=("Condition Name", "ROI",  "Active Round","Condition Type", "Criteria", "Tolerance", "Hysteresis"), show="headings",
                                             yscrollcommand=condition_tree_scroll_y.set)
         
         condition_tree_scroll_y.config(command=self.condition_tree.yview)
@@ -30,11 +31,15 @@ class CheckCondition_Window:
         self.condition_tree.heading("Condition Type", text="Condition Type")
         self.condition_tree.heading("Criteria", text="Criteria")
         self.condition_tree.heading("Active Round", text="Active Round")
+        self.condition_tree.heading("Tolerance", text="Tolerance")
+        self.condition_tree.heading("Hysteresis", text="Hysteresis")
         self.condition_tree.column("Condition Name", width=150)
         self.condition_tree.column("ROI", width=100)
         self.condition_tree.column("Condition Type", width=130)
         self.condition_tree.column("Criteria", width=200)
         self.condition_tree.column("Active Round", width=100)
+        self.condition_tree.column("Tolerance", width=70)
+        self.condition_tree.column("Hysteresis", width=70)
         
         self.condition_tree.pack(side="left", fill="both", expand=True)
         condition_tree_scroll_y.pack(side="right", fill="y")
@@ -54,7 +59,8 @@ class CheckCondition_Window:
         # Load existing data if available
         if self.designer.check_conditions_data:
             for item in self.designer.check_conditions_data:
-                self.condition_tree.insert("", "end", values=(item["name"], item["roi"], item["active_round"], item["type"], item["criteria"]))
+                self.condition_tree.insert("", "end", values=(item["name"], item["roi"], item["active_round"], item["type"], item["criteria"],
+                                                              item.get("tolerance", 0), "Yes" if item.get("hysteresis") else "No"))
         
         # Save Button
         self.save_condition_btn = ttk.Button(self.check_condition_window, text="Save", command=self.save_conditions)
@@ -74,7 +80,9 @@ class CheckCondition_Window:
                 "roi": values[1],
                 "active_round": values[2],
                 "type": values[3],
-                "criteria": values[4]
+                "criteria": values[4],
+                "tolerance": float(values[5]) if len(values) > 5 else 0.0,
+                "hysteresis": len(values) > 6 and values[6] == "Yes"
             })
         
         self.designer.check_conditions_data = conditions
@@ -88,7 +96,7 @@ class CheckCondition_Window:
         """Add a condition to the list."""
         add_condition_window = tk.Toplevel(self.check_condition_window)
         add_condition_window.title("Add Condition")
-        add_condition_window.geometry("380x220")
+        add_condition_window.geometry("380x260")
         
         ttk.Label(add_condition_window, text="Condition Name:").grid(row=0, column=0, padx=5, pady=5)
         self.condition_name_var = tk.StringVar()
@@ -110,7 +118,7 @@ class CheckCondition_Window:
         ttk.Label(add_condition_window, text="Condition Type:").grid(row=2, column=0, padx=5, pady=5)
         self.condition_type_var = tk.StringVar()
         self.condition_type_combo = ttk.Combobox(add_condition_window, textvariable=self.condition_type_var,
-                                            values=['Alway TRUE', 'Max Dose','Max DaV', 'Max VaD', 'Max Dmean', 'Min Dose','Min DaV', 'Min VaD', 'Min Dmean'], state="readonly")
+                                            values=['Alway TRUE', 'Max Dose','Max DaV', 'Max VaD', 'Max Dmean', 'Min Dose','Min DaV', 'Min VaD', 'Min Dmean', 'Expression'], state="readonly")
         self.condition_type_combo.grid(row=2, column=1, columnspan=2, padx=5, pady=5)
         
         # --------------------
@@ -254,6 +262,12 @@ class CheckCondition_Window:
         self.min_dmean_entry = ttk.Entry(frame_min_dmean, textvariable=self.min_dmean_var)
         self.min_dmean_entry.grid(row=1, column=1, padx=5, pady=5)
         
+        # Frame Expression
+        frame_expression = self._create_expression_frame(add_condition_window)
+        
+        # Tolerance band, hysteresis and strict comparison (all metric types)
+        self._create_band_frame(add_condition_window).grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+        
         def show_selected_frame(self):
             """Show the relevant frame based on condition type selection."""
             frame_alway.grid_forget()
@@ -265,6 +279,7 @@ class CheckCondition_Window:
             frame_min_vad.grid_forget()
             frame_max_dmean.grid_forget()
             frame_min_dmean.grid_forget()
+            frame_expression.grid_forget()
             selection = self.condition_type_var.get()
             if selection == 'Alway TRUE':
                 frame_alway.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
@@ -284,6 +299,8 @@ class CheckCondition_Window:
                 frame_max_dmean.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
             elif selection == 'Min Dmean':
                 frame_min_dmean.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
+            elif selection == 'Expression':
+                frame_expression.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
                 
         self.condition_type_combo.bind("<<ComboboxSelected>>", lambda event: show_selected_frame(self))
         show_selected_frame(self)  # Show the initial frame based on the default selection
@@ -340,6 +357,14 @@ class CheckCondition_Window:
             roi_name = self.roi_name_var_min_dmean.get().strip()
             min_dmean = self.min_dmean_var.get().strip()
             criteria = f"Dmean (cGy) ≤ {min_dmean}"
+        elif condition_type == 'Expression':
+            roi_name = 'N/A'
+            criteria = self.expression_var.get().strip()
+        
+        band = self._get_band_values(condition_type, criteria)
+        if band is None:
+            return
+        criteria, tolerance, hysteresis = band
         
         # auto condition name if empty
         if not condition_name:
@@ -362,7 +387,7 @@ class CheckCondition_Window:
             if len(condition_name) >= 50:
                 condition_name = condition_name[:49]
         
-        self.condition_tree.insert("", "end", values=(condition_name, roi_name, active_round_str, condition_type, criteria))
+        self.condition_tree.insert("", "end", values=(condition_name, roi_name, active_round_str, condition_type, criteria, tolerance, hysteresis))
         popup.destroy()
     
     def remove_condition(self):
@@ -388,7 +413,7 @@ class CheckCondition_Window:
         
         edit_condition_window = tk.Toplevel(self.check_condition_window)
         edit_condition_window.title("Edit Condition")
-        edit_condition_window.geometry("380x220")
+        edit_condition_window.geometry("380x260")
         
         ttk.Label(edit_condition_window, text="Condition Name:").grid(row=0, column=0, padx=5, pady=5)
         self.condition_name_var = tk.StringVar(value=selected_name)
@@ -408,7 +433,7 @@ class CheckCondition_Window:
         ttk.Label(edit_condition_window, text="Condition Type:").grid(row=2, column=0, padx=5, pady=5)
         self.condition_type_var = tk.StringVar(value=selected_type)
         self.condition_type_combo = ttk.Combobox(edit_condition_window, textvariable=self.condition_type_var,
-                                            values=['Optimization Round', 'Max Dose','Max DaV', 'Max VaD', 'Max Dmean', 'Min Dose','Min DaV', 'Min VaD', 'Min Dmean'], state="readonly")
+                                            values=['Alway TRUE', 'Max Dose','Max DaV', 'Max VaD', 'Max Dmean', 'Min Dose','Min DaV', 'Min VaD', 'Min Dmean', 'Expression'], state="readonly")
         self.condition_type_combo.grid(row=2, column=1, padx=5, pady=5)
         
         # --------------------
@@ -552,6 +577,16 @@ class CheckCondition_Window:
         self.min_dmean_entry = ttk.Entry(frame_min_dmean, textvariable=self.min_dmean_var)
         self.min_dmean_entry.grid(row=1, column=1, padx=5, pady=5)
         
+        # Frame Expression
+        frame_expression = self._create_expression_frame(edit_condition_window)
+        
+        # Tolerance band, hysteresis and strict comparison (all metric types)
+        self._create_band_frame(edit_condition_window,
+                                tolerance=item_values[5] if len(item_values) > 5 else 0,
+                                hysteresis=len(item_values) > 6 and item_values[6] == "Yes",
+                                strict=('>' in selected_criteria or '<' in selected_criteria) and selected_type != 'Expression'
+                                ).grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+        
         # Parse criteria to pre-populate values
         self._parse_and_populate_condition_values(selected_type, selected_roi, selected_criteria)
         
@@ -566,6 +601,7 @@ class CheckCondition_Window:
             frame_min_vad.grid_forget()
             frame_max_dmean.grid_forget()
             frame_min_dmean.grid_forget()
+            frame_expression.grid_forget()
             selection = self.condition_type_var.get()
             if selection == 'Alway TRUE':
                 frame_alway.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
@@ -585,6 +621,8 @@ class CheckCondition_Window:
                 frame_max_dmean.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
             elif selection == 'Min Dmean':
                 frame_min_dmean.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
+            elif selection == 'Expression':
+                frame_expression.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
                 
         self.condition_type_combo.bind("<<ComboboxSelected>>", lambda event: show_selected_frame(self))
         show_selected_frame(self)  # Show the initial frame based on the default selection
@@ -639,9 +677,17 @@ class CheckCondition_Window:
                 roi_name = self.roi_name_var_min_dmean.get().strip()
                 min_dmean = self.min_dmean_var.get().strip()
                 criteria = f"Dmean (cGy) ≤ {min_dmean}"
+            elif condition_type == 'Expression':
+                roi_name = 'N/A'
+                criteria = self.expression_var.get().strip()
+            
+            band = self._get_band_values(condition_type, criteria)
+            if band is None:
+                return
+            criteria, tolerance, hysteresis = band
             
             # Update tree item
-            self.condition_tree.item(selected_item[0], values=(condition_name, roi_name, active_round_str, condition_type, criteria))
+            self.condition_tree.item(selected_item[0], values=(condition_name, roi_name, active_round_str, condition_type, criteria, tolerance, hysteresis))
             edit_condition_window.destroy()
         
         ttk.Button(edit_condition_window, text="Save Changes", command=save_edited_condition).grid(row=5, column=0, columnspan=2, pady=10)
@@ -655,19 +701,19 @@ class CheckCondition_Window:
         elif condition_type == 'Max Dose':
             # "Dmax (cGy) ≥ 5000"
             self.roi_name_var_max_dose.set(roi_name)
-            match = re.search(r'Dmax \(cGy\) ≥ (\S+)', criteria)
+            match = re.search(r'Dmax \(cGy\) [≥>] (\S+)', criteria)
             if match:
                 self.max_dose_var.set(match.group(1))
         elif condition_type == 'Min Dose':
             # "Dmin (cGy) ≤ 4500"
             self.roi_name_var_min_dose.set(roi_name)
-            match = re.search(r'Dmin \(cGy\) ≤ (\S+)', criteria)
+            match = re.search(r'Dmin \(cGy\) [≤<] (\S+)', criteria)
             if match:
                 self.min_dose_var.set(match.group(1))
         elif condition_type == 'Max DaV':
             # "D95% ≥ 4500 cGy"
             self.roi_name_var_max_dav.set(roi_name)
-            match = re.search(r'D(\S+)(%)|(cc) ≥ (\S+) cGy', criteria)
+            match = re.search(r'D(\S+)(%)|(cc) [≥>] (\S+) cGy', criteria)
             if match:
                 self.volume_max_dav_var.set(match.group(1))
                 self.volume_max_dav_unit.set(match.group(2) if match.group(2) else match.group(3))
@@ -675,7 +721,7 @@ class CheckCondition_Window:
         elif condition_type == 'Min DaV':
             # "D2% ≤ 5500 cGy"
             self.roi_name_var_min_dav.set(roi_name)
-            match = re.search(r'D(\S+)(%)|(cc) ≤ (\S+) cGy', criteria)
+            match = re.search(r'D(\S+)(%)|(cc) [≤<] (\S+) cGy', criteria)
             if match:
                 self.volume_min_dav_var.set(match.group(1))
                 self.volume_min_dav_unit.set(match.group(2) if match.group(2) else match.group(3))
@@ -683,7 +729,7 @@ class CheckCondition_Window:
         elif condition_type == 'Max VaD':
             # "V5000 cGy ≥ 95%"
             self.roi_name_var_max_vad.set(roi_name)
-            match = re.search(r'V(\S+) cGy ≥ (\S+)(%)|(cc)', criteria)
+            match = re.search(r'V(\S+) cGy [≥>] (\S+)(%)|(cc)', criteria)
             if match:
                 self.dose_max_vad_var.set(match.group(1))
                 self.volume_max_vad_var.set(match.group(2))
@@ -691,7 +737,7 @@ class CheckCondition_Window:
         elif condition_type == 'Min VaD':
             # "V3000 cGy ≤ 10%"
             self.roi_name_var_min_vad.set(roi_name)
-            match = re.search(r'V(\S+) cGy ≤ (\S+)(%)|(cc)', criteria)
+            match = re.search(r'V(\S+) cGy [≤<] (\S+)(%)|(cc)', criteria)
             if match:
                 self.dose_min_vad_var.set(match.group(1))
                 self.volume_min_vad_var.set(match.group(2))
@@ -699,15 +745,80 @@ class CheckCondition_Window:
         elif condition_type == 'Max Dmean':
             # "Dmean (cGy) ≥ 3000"
             self.roi_name_var_max_dmean.set(roi_name)
-            match = re.search(r'Dmean \(cGy\) ≥ (\S+)', criteria)
+            match = re.search(r'Dmean \(cGy\) [≥>] (\S+)', criteria)
             if match:
                 self.max_dmean_var.set(match.group(1))
         elif condition_type == 'Min Dmean':
             # "Dmean (cGy) ≤ 2000"
             self.roi_name_var_min_dmean.set(roi_name)
-            match = re.search(r'Dmean \(cGy\) ≤ (\S+)', criteria)
+            match = re.search(r'Dmean \(cGy\) [≤<] (\S+)', criteria)
             if match:
                 self.min_dmean_var.set(match.group(1))
+        elif condition_type == 'Expression':
+            # "PTV_low AND (Heart_high OR NOT Lung_high)"
+            self.expression_var.set(criteria)
+    
+    def _create_band_frame(self, parent, tolerance=0, hysteresis=False, strict=False):
+        """Frame for the tolerance band, hysteresis and strict comparison of a condition."""
+        frame_band = ttk.Frame(parent)
+        ttk.Label(frame_band, text="Tolerance ±").grid(row=0, column=0, padx=5, pady=2)
+        self.tolerance_var = tk.StringVar(value=str(tolerance))
+        ttk.Entry(frame_band, textvariable=self.tolerance_var, width=7).grid(row=0, column=1, padx=5, pady=2)
+        self.hysteresis_var = tk.BooleanVar(value=hysteresis)
+        ttk.Checkbutton(frame_band, text="Hysteresis", variable=self.hysteresis_var).grid(row=0, column=2, padx=5, pady=2)
+        self.strict_var = tk.BooleanVar(value=strict)
+        ttk.Checkbutton(frame_band, text="Strict (> / <)", variable=self.strict_var).grid(row=0, column=3, padx=5, pady=2)
+        return frame_band
+    
+    def _get_band_values(self, condition_type, criteria):
+        """
+        Apply the strict comparison to the criteria and read the tolerance band.
+        
+        Returns:
+            (criteria, tolerance, "Yes"/"No" hysteresis), or None if the tolerance is invalid
+        """
+        if condition_type in ('Alway TRUE', 'Expression'):
+            return (criteria, 0.0, "No")
+        try:
+            tolerance = float(self.tolerance_var.get().strip() or 0)
+        except ValueError:
+            messagebox.showerror("Input Error", "Tolerance must be a number.")
+            return None
+        if tolerance < 0:
+            messagebox.showerror("Input Error", "Tolerance must not be negative.")
+            return None
+        if self.strict_var.get():
+            criteria = criteria.replace("≥", ">").replace("≤", "<")
+        else:
+            criteria = criteria.replace(">", "≥").replace("<", "≤")
+        return (criteria, tolerance, "Yes" if self.hysteresis_var.get() else "No")
+    
+    def _create_expression_frame(self, parent):
+        """Frame for an Expression condition: AND/OR/NOT over other conditions of this list."""
+        frame_expression = ttk.Frame(parent)
+        ttk.Label(frame_expression, text="Expression:").grid(row=0, column=0, padx=5, pady=5)
+        self.expression_var = tk.StringVar()
+        ttk.Entry(frame_expression, textvariable=self.expression_var, width=30).grid(row=0, column=1, columnspan=2, padx=5, pady=5)
+        
+        condition_names = [self.condition_tree.item(child, "values")[0] for child in self.condition_tree.get_children()]
+        self.expression_condition_var = tk.StringVar()
+        token_combo = ttk.Combobox(frame_expression, textvariable=self.expression_condition_var,
+                                   values=condition_names + ['AND', 'OR', 'NOT', '(', ')'], state="readonly")
+        token_combo.grid(row=1, column=1, padx=5, pady=5)
+        
+        def insert_token():
+            token = self.expression_condition_var.get()
+            index = token_combo.current()
+            if index < 0:
+                return
+            if index < len(condition_names):
+                # Condition names are quoted unless they are a plain word (e.g. "PTV(boost) D95")
+                token = quote_condition_name(token)
+            self.expression_var.set(f"{self.expression_var.get().rstrip()} {token}".strip())
+        
+        ttk.Button(frame_expression, text="Insert", command=insert_token).grid(row=1, column=2, padx=5, pady=5)
+        ttk.Label(frame_expression, text='Use AND, OR, NOT and ( ). Quote names with spaces, ( ) or " (escape " as \\").').grid(row=2, column=0, columnspan=3, padx=5, pady=2)
+        return frame_expression
     
     def show_step_info(self, message):
         """Display a message box with step information."""
@@ -8,7 +8,7 @@ class EndPlanningFlow_Window:
         self.designer = designer
         end_planning_window = tk.Toplevel(parent)
         end_planning_window.title("End Planning Flow")
-        end_planning_window.geometry("400x80")
+        end_planning_window.geometry("400x255")
         
         ttk.Label(end_planning_window, text="End flow after 1st optimize and additional").grid(row=0, column=0, padx=5, pady=5)
         self.max_optimize_var = tk.IntVar()
@@ -16,18 +16,95 @@ class EndPlanningFlow_Window:
         max_optimize_entry.grid(row=0, column=1, padx=0, pady=5)
         ttk.Label(end_planning_window, text="optimization rounds").grid(row=0, column=2, padx=0, pady=5)
         
+        # Condition plateau: end the loop early when condition values stop changing
+        plateau_frame = ttk.Frame(end_planning_window)
+        plateau_frame.grid(row=1, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        self.plateau_enabled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(plateau_frame, text="Stop when condition values change <", variable=self.plateau_enabled_var).pack(side="left")
+        self.plateau_abs_var = tk.DoubleVar(value=1.0)
+        ttk.Entry(plateau_frame, textvariable=self.plateau_abs_var, width=5).pack(side="left", padx=2)
+        ttk.Label(plateau_frame, text="or").pack(side="left", padx=2)
+        self.plateau_rel_var = tk.DoubleVar(value=0.5)
+        ttk.Entry(plateau_frame, textvariable=self.plateau_rel_var, width=5).pack(side="left", padx=2)
+        ttk.Label(plateau_frame, text="%").pack(side="left")
+        
+        # Objective convergence: end the loop when the objective value stops improving
+        objective_frame = ttk.Frame(end_planning_window)
+        objective_frame.grid(row=2, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        self.objective_enabled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(objective_frame, text="Stop when objective improves <", variable=self.objective_enabled_var).pack(side="left")
+        self.objective_improvement_var = tk.DoubleVar(value=1.0)
+        ttk.Entry(objective_frame, textvariable=self.objective_improvement_var, width=5).pack(side="left", padx=2)
+        ttk.Label(objective_frame, text="% over last").pack(side="left", padx=2)
+        self.objective_rounds_var = tk.IntVar(value=2)
+        ttk.Entry(objective_frame, textvariable=self.objective_rounds_var, width=3).pack(side="left", padx=2)
+        ttk.Label(objective_frame, text="rounds").pack(side="left")
+        
+        # Condition evaluator: RayStation API, local NumPy DVH engine, or API cross-checked with NumPy
+        evaluator_frame = ttk.Frame(end_planning_window)
+        evaluator_frame.grid(row=3, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        ttk.Label(evaluator_frame, text="Condition evaluator").pack(side="left")
+        self.evaluator_var = tk.StringVar(value="api")
+        ttk.Combobox(evaluator_frame, textvariable=self.evaluator_var, values=["api", "numpy", "verify", "curve"],
+                     state="readonly", width=8).pack(side="left", padx=5)
+        ttk.Label(evaluator_frame, text="DVH curve bins").pack(side="left", padx=2)
+        self.dvh_bins_var = tk.IntVar(value=200)
+        ttk.Entry(evaluator_frame, textvariable=self.dvh_bins_var, width=5).pack(side="left", padx=2)
+        
+        # Condition workers: evaluate metric conditions in parallel threads (1 = one after another)
+        workers_frame = ttk.Frame(end_planning_window)
+        workers_frame.grid(row=4, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        ttk.Label(workers_frame, text="Condition workers").pack(side="left")
+        self.condition_workers_var = tk.IntVar(value=1)
+        ttk.Entry(workers_frame, textvariable=self.condition_workers_var, width=3).pack(side="left", padx=5)
+        ttk.Label(workers_frame, text="(>1 only if the scripting API allows parallel reads)").pack(side="left")
+        
         # Load existing data if available
         if self.designer.end_flow_data:
             self.max_optimize_var.set(self.designer.end_flow_data.get("max_optimize_rounds", 0))
+            plateau = self.designer.end_flow_data.get("condition_plateau", {})
+            self.plateau_enabled_var.set(plateau.get("enabled", False))
+            self.plateau_abs_var.set(plateau.get("abs_epsilon", 1.0))
+            self.plateau_rel_var.set(plateau.get("rel_epsilon", 0.5))
+            objective = self.designer.end_flow_data.get("objective_convergence", {})
+            self.objective_enabled_var.set(objective.get("enabled", False))
+            self.objective_improvement_var.set(objective.get("min_improvement", 1.0))
+            self.objective_rounds_var.set(objective.get("rounds", 2))
+            self.evaluator_var.set(self.designer.end_flow_data.get("condition_evaluator", "api"))
+            self.dvh_bins_var.set(self.designer.end_flow_data.get("dvh_curve_bins", 200))
+            self.condition_workers_var.set(self.designer.end_flow_data.get("condition_workers", 1))
         
         # Save Button
-        ttk.Button(end_planning_window, text="Save", command=self.save_end_flow_settings).grid(row=1, column=0, columnspan=3, padx=5, pady=10)
+        ttk.Button(end_planning_window, text="Save", command=self.save_end_flow_settings).grid(row=5, column=0, columnspan=3, padx=5, pady=10)
         
     
     def save_end_flow_settings(self):
         """Save end planning flow settings."""
+        try:
+            plateau_abs = self.plateau_abs_var.get()
+            plateau_rel = self.plateau_rel_var.get()
+            objective_improvement = self.objective_improvement_var.get()
+            objective_rounds = self.objective_rounds_var.get()
+            dvh_bins = self.dvh_bins_var.get()
+            condition_workers = self.condition_workers_var.get()
+        except tk.TclError:
+            messagebox.showerror("Input Error", "Condition change, objective improvement limits, DVH curve bins and condition workers must be numbers.")
+            return
         self.designer.end_flow_data = {
-            "max_optimize_rounds": self.max_optimize_var.get()
+            "max_optimize_rounds": self.max_optimize_var.get(),
+            "condition_plateau": {
+                "enabled": self.plateau_enabled_var.get(),
+                "abs_epsilon": plateau_abs,
+                "rel_epsilon": plateau_rel
+            },
+            "objective_convergence": {
+                "enabled": self.objective_enabled_var.get(),
+                "min_improvement": objective_improvement,
+                "rounds": max(1, objective_rounds)
+            },
+            "condition_evaluator": self.evaluator_var.get(),
+            "dvh_curve_bins": max(2, dvh_bins),
+            "condition_workers": max(1, condition_workers)
         }
         messagebox.showinfo("Save Successful", "End planning flow settings saved successfully.")
     
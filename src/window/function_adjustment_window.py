@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from .function_frame import FunctionConfigFrame
+from src.flow.condition_compiler import compile_condition
+from src.flow.function_registry import check_proportional_condition
 
 class FunctionAdjustment_Window:
     """Open a new window for Function Adjustment step."""
@@ -90,7 +92,7 @@ class FunctionAdjustment_Window:
         
         function_adjustment_scroll_y = ttk.Scrollbar(function_adjustment_frame, orient="vertical")
         
-        self.function_adjustment_tree = ttk.Treeview(function_adjustment_frame, columns=("If this condition TRUE", "Make this Adjustment", "Function tag", "Function Type", "ROI", "Description", "Weight", "Objective/Constraint", "Robust", "Restrict to Beam", "Beam"), show="headings",
+        self.function_adjustment_tree = ttk.Treeview(function_adjustment_frame, columns=("If this condition TRUE", "Make this Adjustment", "Function tag", "Function Type", "ROI", "Description", "Weight", "Objective/Constraint", "Robust", "Restrict to Beam", "Beam", "Mode", "Gain", "Clamp min", "Clamp max"), show="headings",
                                                     yscrollcommand=function_adjustment_scroll_y.set)
         
         function_adjustment_scroll_y.config(command=self.function_adjustment_tree.yview)
@@ -106,6 +108,10 @@ class FunctionAdjustment_Window:
         self.function_adjustment_tree.heading("Robust", text="Robust")
         self.function_adjustment_tree.heading("Restrict to Beam", text="Restrict to Beam")
         self.function_adjustment_tree.heading("Beam", text="Beam")
+        self.function_adjustment_tree.heading("Mode", text="Mode")
+        self.function_adjustment_tree.heading("Gain", text="Gain")
+        self.function_adjustment_tree.heading("Clamp min", text="Clamp min")
+        self.function_adjustment_tree.heading("Clamp max", text="Clamp max")
         
         self.function_adjustment_tree.column("If this condition TRUE", width=80)
         self.function_adjustment_tree.column("Make this Adjustment", width=80)
@@ -118,6 +124,10 @@ class FunctionAdjustment_Window:
         self.function_adjustment_tree.column("Robust", width=20)
         self.function_adjustment_tree.column("Restrict to Beam", width=30)
         self.function_adjustment_tree.column("Beam", width=80)
+        self.function_adjustment_tree.column("Mode", width=60)
+        self.function_adjustment_tree.column("Gain", width=20)
+        self.function_adjustment_tree.column("Clamp min", width=20)
+        self.function_adjustment_tree.column("Clamp max", width=20)
         
         self.function_adjustment_tree.pack(side="left", fill="both", expand=True)
         function_adjustment_scroll_y.pack(side="right", fill="y")
@@ -148,7 +158,11 @@ class FunctionAdjustment_Window:
                         "" if item.get("objective_constraint", "Objective") == "Objective" else "⭐",
                         "" if item.get("is_robust", False) is False else "⚙️",
                         "" if item.get("restrict_to_beam", False) is False else "✔️",
-                        item.get("selected_beam", "")
+                        item.get("selected_beam", ""),
+                        item.get("mode", "Absolute"),
+                        item.get("gain", ""),
+                        item.get("clamp_min", ""),
+                        item.get("clamp_max", "")
                     )
                 )
         
@@ -186,7 +200,11 @@ class FunctionAdjustment_Window:
                 "objective_constraint": "Constraint" if values[7] == "⭐" else "Objective",
                 "is_robust": values[8] == "⚙️",
                 "restrict_to_beam": values[9] == "✔️",
-                "selected_beam": values[10]
+                "selected_beam": values[10],
+                "mode": values[11] if len(values) > 11 else "Absolute",
+                "gain": values[12] if len(values) > 12 else "",
+                "clamp_min": values[13] if len(values) > 13 else "",
+                "clamp_max": values[14] if len(values) > 14 else ""
             })
         
         self.designer.function_adjustments_data = adjustments
@@ -200,6 +218,70 @@ class FunctionAdjustment_Window:
         """Display a message box with step information."""
         messagebox.showinfo("Step Information", message)
     
+    def _create_mode_frame(self, parent, mode="Absolute", gain="", clamp_min="", clamp_max=""):
+        """
+        Frame for the adjustment mode of an "Adjust OLD Function" entry.
+        Proportional modes scale the weight or dose level by the condition margin:
+        new = clamp(current * (1 + gain * margin)).
+        """
+        frame_mode = ttk.Frame(parent)
+        ttk.Label(frame_mode, text="Mode:").grid(row=0, column=0, padx=5, pady=2)
+        self.mode_var = tk.StringVar(value=mode or "Absolute")
+        ttk.Combobox(frame_mode, textvariable=self.mode_var, values=["Absolute", "Proportional weight", "Proportional dose"],
+                     state="readonly", width=18).grid(row=0, column=1, padx=5, pady=2)
+        ttk.Label(frame_mode, text="Gain").grid(row=0, column=2, padx=5, pady=2)
+        self.gain_var = tk.StringVar(value=str(gain))
+        ttk.Entry(frame_mode, textvariable=self.gain_var, width=7).grid(row=0, column=3, padx=5, pady=2)
+        ttk.Label(frame_mode, text="Clamp min").grid(row=0, column=4, padx=5, pady=2)
+        self.clamp_min_var = tk.StringVar(value=str(clamp_min))
+        ttk.Entry(frame_mode, textvariable=self.clamp_min_var, width=7).grid(row=0, column=5, padx=5, pady=2)
+        ttk.Label(frame_mode, text="max").grid(row=0, column=6, padx=5, pady=2)
+        self.clamp_max_var = tk.StringVar(value=str(clamp_max))
+        ttk.Entry(frame_mode, textvariable=self.clamp_max_var, width=7).grid(row=0, column=7, padx=5, pady=2)
+        return frame_mode
+    
+    def _get_mode_values(self, values, condition_name):
+        """
+        Read the adjustment mode.
+        Proportional modes need a condition with a threshold (not Alway TRUE or Expression).
+        
+        Returns:
+            (mode, gain, clamp_min, clamp_max), or None if a value is invalid
+        """
+        mode = self.mode_var.get() or "Absolute"
+        if mode == "Absolute":
+            return ("Absolute", "", "", "")
+        if mode == "Proportional weight" and values.get("objective_constraint") == "Constraint":
+            messagebox.showerror("Input Error", "Proportional weight needs an objective (constraints have no weight).")
+            return None
+        condition_data = next((condition for condition in self.designer.check_conditions_data
+                               if condition.get("name") == condition_name), None)
+        try:
+            condition = compile_condition(condition_data) if condition_data is not None else None
+            check_proportional_condition(mode, condition_name, condition)
+        except ValueError as e:
+            messagebox.showerror("Input Error", str(e))
+            return None
+        numbers = []
+        for label, var, required in (("Gain", self.gain_var, True), ("Clamp min", self.clamp_min_var, False),
+                                     ("Clamp max", self.clamp_max_var, False)):
+            text = var.get().strip()
+            if not text:
+                if required:
+                    messagebox.showerror("Input Error", f"{label} is required for {mode}.")
+                    return None
+                numbers.append("")
+                continue
+            try:
+                numbers.append(float(text))
+            except ValueError:
+                messagebox.showerror("Input Error", f"{label} must be a number.")
+                return None
+        if numbers[1] != "" and numbers[2] != "" and numbers[1] > numbers[2]:
+            messagebox.showerror("Input Error", "Clamp min must not be above clamp max.")
+            return None
+        return (mode, *numbers)
+    
     def adjust_function(self):
         """Adjust the selected function."""
         # Get selected function from old_function_tree
@@ -225,7 +307,7 @@ class FunctionAdjustment_Window:
         # Open adjustment window
         adjust_window = tk.Toplevel(self.function_adjustment_window)
         adjust_window.title("Adjust Function")
-        adjust_window.geometry("680x350")
+        adjust_window.geometry("680x390")
         
         # Condition selector frame
         condition_frame = ttk.Frame(adjust_window)
@@ -247,6 +329,7 @@ class FunctionAdjustment_Window:
             extended_roi_list=True
         )
         config_frame.pack(padx=10, pady=10)
+        self._create_mode_frame(adjust_window).pack(padx=10, pady=2, fill="x")
         
         def save_adjustment():
             """Save the adjusted function."""
@@ -256,6 +339,9 @@ class FunctionAdjustment_Window:
                 return
             
             values = config_frame.get_values()
+            mode_values = self._get_mode_values(values, condition_true)
+            if mode_values is None:
+                return
             # Insert into function adjustment tree with condition and adjustment type
             self.function_adjustment_tree.insert(
                 "",
@@ -267,7 +353,8 @@ class FunctionAdjustment_Window:
                     "" if values.get("objective_constraint", "Objective") == "Objective" else "⭐",
                     "" if values.get("is_robust", False) is False else "⚙️",
                     "" if values.get("restrict_to_beam", False) is False else "✔️",
-                    values.get("selected_beam", "")
+                    values.get("selected_beam", ""),
+                    *mode_values
                 )
             )
             adjust_window.destroy()
@@ -336,7 +423,8 @@ class FunctionAdjustment_Window:
                     "" if values.get("objective_constraint", "Objective") == "Objective" else "⭐",
                     "" if values.get("is_robust", False) is False else "⚙️",
                     "" if values.get("restrict_to_beam", False) is False else "✔️",
-                    values.get("selected_beam", "")
+                    values.get("selected_beam", ""),
+                    "Absolute", "", "", ""
                 )
             )
             add_adjustment_window.destroy()
@@ -368,7 +456,7 @@ class FunctionAdjustment_Window:
         
         edit_adjustment_window = tk.Toplevel(self.function_adjustment_window)
         edit_adjustment_window.title("Edit Function Adjustment")
-        edit_adjustment_window.geometry("680x350")
+        edit_adjustment_window.geometry("680x390")
         
         # Condition selector frame
         condition_frame = ttk.Frame(edit_adjustment_window)
@@ -391,6 +479,9 @@ class FunctionAdjustment_Window:
             extended_roi_list=True
         )
         config_frame.pack(padx=10, pady=10)
+        if selected_adjustment == "Adjust OLD Function":
+            mode_settings = list(item_values[11:15]) if len(item_values) > 11 else []
+            self._create_mode_frame(edit_adjustment_window, *mode_settings).pack(padx=10, pady=2, fill="x")
         
         def save_edited_adjustment():
             """Save the edited function adjustment."""
@@ -400,6 +491,11 @@ class FunctionAdjustment_Window:
                 return
             
             values = config_frame.get_values()
+            mode_values = ("Absolute", "", "", "")
+            if selected_adjustment == "Adjust OLD Function":
+                mode_values = self._get_mode_values(values, condition_true)
+                if mode_values is None:
+                    return
             # Update tree item with condition and original adjustment type
             self.function_adjustment_tree.item(
                 selected_item[0],
@@ -410,7 +506,8 @@ class FunctionAdjustment_Window:
                     "" if values.get("objective_constraint", "Objective") == "Objective" else "⭐",
                     "" if values.get("is_robust", False) is False else "⚙️",
                     "" if values.get("restrict_to_beam", False) is False else "✔️",
-                    values.get("selected_beam", "")
+                    values.get("selected_beam", ""),
+                    *mode_values
                 )
             )
             edit_adjustment_window.destroy()